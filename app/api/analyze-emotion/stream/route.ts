@@ -0,0 +1,65 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+const PYTHON_API_URL = process.env.PYTHON_API_URL || 'http://localhost:8000';
+
+export async function POST(request: NextRequest) {
+  console.log('🔄 Next.js API route /api/analyze-emotion/stream called');
+
+  let body: any;
+  try {
+    body = await request.json();
+  } catch {
+    body = null;
+  }
+
+  if (!body || !body.text || typeof body.text !== 'string') {
+    return NextResponse.json(
+      {
+        status: 'error',
+        message: 'Missing or invalid "text" field in request',
+        code: 'MISSING_TEXT'
+      },
+      { status: 400 }
+    );
+  }
+
+  console.log(`🐍 Streaming from Python server: ${PYTHON_API_URL}/analyze-emotion/stream`);
+
+  const response = await fetch(`${PYTHON_API_URL}/analyze-emotion/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      text: body.text,
+      debug: body.debug || false,
+      user_context: body.user_context
+    }),
+    signal: request.signal
+  }).catch(error => {
+    console.error('🌐 Network error connecting to Python server:', error.message);
+    return null;
+  });
+
+  if (!response || !response.ok || !response.body) {
+    // Clients fall back to the non-streaming /api/analyze-emotion route
+    return NextResponse.json(
+      {
+        status: 'error',
+        message: 'Streaming analysis unavailable',
+        code: 'STREAM_UNAVAILABLE'
+      },
+      { status: 503 }
+    );
+  }
+
+  // Pass the server-sent events through unbuffered
+  return new Response(response.body, {
+    headers: {
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache, no-transform',
+      'Connection': 'keep-alive',
+      'X-Accel-Buffering': 'no'
+    }
+  });
+}
@@ -22,7 +22,9 @@ export async function POST(request: NextRequest) {
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({
-        text: body.text
+        text: body.text,
+        draft_id: body.draft_id,
+        speculate: body.speculate
       }),
     });
 
@@ -55,6 +55,7 @@ export default function JournalPage() {
   const [tags, setTags] = useState<string[]>([]);
   const [emotionPreview, setEmotionPreview] = useState<any>(null);
   const [previewTimeout, setPreviewTimeout] = useState<NodeJS.Timeout | null>(null);
+  const [draftId, setDraftId] = useState(() => crypto.randomUUID());
   const [showDetailModal, setShowDetailModal] = useState(false);
   const [currentTime, setCurrentTime] = useState(new Date());
   
@@ -240,6 +241,7 @@ export default function JournalPage() {
     setEmotionPreview(null);
     setAnalysisPhase(null);
     setPreviewEmotions([]);
+    setDraftId(crypto.randomUUID());
   };
 
   // Real-time emotion preview as user types
@@ -262,7 +264,7 @@ export default function JournalPage() {
           headers: {
             'Content-Type': 'application/json',
           },
-          body: JSON.stringify({ text }),
+          body: JSON.stringify({ text, draft_id: draftId, speculate: true }),
         });
 
         if (response.ok) {
@@ -10,19 +10,45 @@ Usage:
 
 Endpoints:
     POST /analyze-emotion
+    POST /analyze-emotion/stream
+    POST /preview-analysis
+    GET /body-regions
+    GET /body-regions/<region>
+    GET /trends/<user_id>
+    GET /rollups/<user_id>
+    POST /similar-entries
     GET /health
+    GET /models
+    POST /models/load
 """
 
 import os
 import sys
 import json
-from flask import Flask, request, jsonify
+import time
+import uuid
+import hmac
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import logging
 
 # Add the project root to the path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from draft_sessions import DraftSessionStore
+from trend_store import EmotionTrendStore
+from emotion_rollups import EmotionRollupEngine, WINDOWS
+from entry_store import EntryVectorStore
+from similarity_index import SimilarEntryIndex
+from request_coalescing import SingleFlight, coalescing_key
+from psychosomatic_mapping import (
+    GOEMOTIONS_LABELS,
+    SYMPTOM_NAMES,
+    REGION_EMOTION_INDEX,
+    detect_symptoms,
+    normalize_region_name
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,12 +56,72 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Next.js frontend
 
-# Global classifier instance
-classifier = None
+# Global model registry (serves the active classifier version)
+registry = None
+
+# Per-draft incremental text characteristics for /preview-analysis
+draft_sessions = DraftSessionStore()
+
+# Low-priority background inference of drafts (created with the registry)
+speculative_queue = None
+
+# Torch thread / CPU affinity settings applied at startup
+thread_config = None
+
+# Running per-user emotion trend aggregates, updated as analyses complete
+trend_store = EmotionTrendStore()
+
+# Columnar per-user probability vectors for dashboard rollups
+rollup_engine = EmotionRollupEngine()
+
+# On-disk probability vectors and embeddings for relabeling (empty dir disables)
+ENTRY_STORE_DIR = os.getenv('SOMA_ENTRY_STORE_DIR', 'data/entry_store')
+entry_store = EntryVectorStore(ENTRY_STORE_DIR, labels=GOEMOTIONS_LABELS) if ENTRY_STORE_DIR else None
+
+# Per-user embedding indexes for "similar past entries", rebuilt from the store
+similarity_index = SimilarEntryIndex()
+if entry_store:
+    logger.info(f"🔎 Indexed {similarity_index.load_from_store(entry_store, GOEMOTIONS_LABELS)} stored entries for similarity search")
+    logger.info(f"📈 Rebuilt trends from {trend_store.load_from_store(entry_store, GOEMOTIONS_LABELS)} stored entries")
+    logger.info(f"📊 Rebuilt rollups from {rollup_engine.load_from_store(entry_store)} stored entries")
+
+# Identical /analyze-emotion requests in flight share one pipeline run
+COALESCE_ANALYSES = os.getenv('SOMA_COALESCE_ANALYSES', '1') == '1'
+inflight_analyses = SingleFlight()
+
+# Early-exit inference for models trained with scripts/train_early_exit.py
+EARLY_EXIT = os.getenv('SOMA_EARLY_EXIT', '0') == '1'
+
+# Per-text-type inference engines, e.g. "quick_note=model:models/bert_emotion_student"
+ROUTES = os.getenv('SOMA_ROUTES', '')
+
+# /models/load access: with an admin token, callers must send it in the
+# X-Admin-Token header; without one, only local non-browser requests are
+# accepted. Models are only loaded from under SOMA_MODELS_DIR.
+ADMIN_TOKEN = os.getenv('SOMA_ADMIN_TOKEN', '')
+MODELS_DIR = os.path.realpath(os.getenv('SOMA_MODELS_DIR', 'models'))
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+
+# Pre-encoded body-region query payloads (the index is static, so encode once)
+REGION_PAYLOADS = {
+    region: json.dumps({
+        'status': 'success',
+        'region': region,
+        'emotion_count': len(entries),
+        'emotions': entries
+    }).encode('utf-8')
+    for region, entries in REGION_EMOTION_INDEX.items()
+}
+REGION_LIST_PAYLOAD = json.dumps({
+    'status': 'success',
+    'regions': {region: len(entries) for region, entries in REGION_EMOTION_INDEX.items()}
+}).encode('utf-8')
 
 # Import psychosomatic analysis system
 try:
-    from gpt_personalization import create_hybrid_analysis
+    from gpt_personalization import (
+        create_hybrid_analysis, iter_hybrid_analysis, personalization_engine, COMBINED_CANDIDATE_COUNT
+    )
     PSYCHOSOMATIC_AVAILABLE = True
     logger.info("✅ Psychosomatic analysis system loaded")
 except ImportError as e:
@@ -43,19 +129,54 @@ except ImportError as e:
     logger.warning(f"⚠️ Psychosomatic analysis not available: {e}")
 
 def initialize_classifier():
-    """Initialize the adaptive emotion classifier."""
-    global classifier
+    """Initialize the model registry with the adaptive emotion classifier."""
+    global registry, speculative_queue, thread_config
     
     try:
         from scripts.adaptive_classifier import AdaptiveEmotionClassifier
+        from model_registry import ModelRegistry
+        from speculative_inference import SpeculativeInferenceQueue
+        from inference_threads import configure_from_environment
+        from model_server import connect_from_environment
         
         model_path = 'models/bert_emotion_model'
         if not os.path.exists(model_path):
             logger.error(f"Model not found at {model_path}")
             return False
+        
+        # Size torch's thread pools (and optionally pin CPUs) before loading
+        thread_config = configure_from_environment(model_path)
             
-        classifier = AdaptiveEmotionClassifier(model_path=model_path)
-        logger.info("✅ Adaptive emotion classifier initialized successfully")
+        # With SOMA_MODEL_SERVER set, inference runs in the shared-memory model
+        # server and this worker only loads the tokenizer
+        model_server = connect_from_environment()
+        if model_server:
+            from scripts.inference import RemoteEmotionClassifier
+            classifier_factory = lambda path: AdaptiveEmotionClassifier(
+                model_path=path,
+                base_classifier=RemoteEmotionClassifier(model_server, model_path=path)
+            )
+        elif ROUTES:
+            # Each text type goes to its configured engine (see model_routing.py)
+            from model_routing import RoutedEmotionClassifier
+            classifier_factory = lambda path: AdaptiveEmotionClassifier(
+                model_path=path,
+                base_classifier=RoutedEmotionClassifier(model_path=path)
+            )
+        elif EARLY_EXIT:
+            # Stop at the first confident exit head (see early_exit.py)
+            from scripts.inference import EarlyExitEmotionClassifier
+            classifier_factory = lambda path: AdaptiveEmotionClassifier(
+                model_path=path,
+                base_classifier=EarlyExitEmotionClassifier(model_path=path)
+            )
+        else:
+            classifier_factory = lambda path: AdaptiveEmotionClassifier(model_path=path)
+        
+        registry = ModelRegistry(classifier_factory=classifier_factory)
+        registry.load(model_path)
+        speculative_queue = SpeculativeInferenceQueue(registry)
+        logger.info(f"✅ Adaptive emotion classifier initialized successfully ({registry.active_version})")
         return True
         
     except ImportError as e:
@@ -71,19 +192,285 @@ def health_check():
     """Health check endpoint."""
     return jsonify({
         'status': 'healthy',
-        'model_loaded': classifier is not None,
+        'model_loaded': registry is not None and registry.active is not None,
+        'model_version': registry.active_version if registry else None,
         'service': 'SomaJournal Emotion Analysis API'
     })
 
+@app.route('/models', methods=['GET'])
+def model_status():
+    """Report the active model version, draining versions and cache stats."""
+    if not registry:
+        return jsonify({
+            'status': 'error',
+            'message': 'Model registry not initialized',
+            'code': 'MODEL_NOT_LOADED'
+        }), 500
+    
+    status = registry.status()
+    if speculative_queue:
+        status['speculative'] = speculative_queue.status()
+    if thread_config:
+        status['threads'] = thread_config
+    if entry_store:
+        status['entry_store'] = entry_store.stats()
+    status['similarity_index'] = similarity_index.stats()
+    if COALESCE_ANALYSES:
+        status['coalescing'] = inflight_analyses.stats()
+    if registry.active:
+        base_classifier = registry.active.classifier.base_classifier
+        if hasattr(base_classifier, 'exit_stats'):
+            status['early_exit'] = base_classifier.exit_stats()
+        if hasattr(base_classifier, 'routing_stats'):
+            status['routing'] = base_classifier.routing_stats()
+        if getattr(base_classifier, 'static_graphs', None) is not None:
+            status['static_graphs'] = base_classifier.static_graphs.stats()
+    if PSYCHOSOMATIC_AVAILABLE and personalization_engine.semantic_cache is not None:
+        status['semantic_cache'] = personalization_engine.semantic_cache.stats()
+    
+    return jsonify({'status': 'success', **status})
+
+@app.route('/models/load', methods=['POST'])
+def load_model_version():
+    """
+    Load a new model version in the background and hot-swap it in.
+    
+    Admin only: requires the X-Admin-Token header when SOMA_ADMIN_TOKEN is
+    set, otherwise a local request without a browser Origin. The model must
+    live under SOMA_MODELS_DIR.
+    
+    Request JSON:
+    {
+        "model_path": "models/bert_emotion_model_v2",
+        "version": "v2",   // Optional: derived from the model files if omitted
+        "force": false     // Optional: skip the parity gate
+    }
+    """
+    if not registry:
+        return jsonify({
+            'status': 'error',
+            'message': 'Model registry not initialized',
+            'code': 'MODEL_NOT_LOADED'
+        }), 500
+    
+    if ADMIN_TOKEN:
+        allowed = hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    else:
+        allowed = request.remote_addr in LOCAL_ADDRESSES and 'Origin' not in request.headers
+    if not allowed:
+        return jsonify({
+            'status': 'error',
+            'message': 'Loading models requires the admin token (X-Admin-Token)',
+            'code': 'FORBIDDEN'
+        }), 403
+    
+    data = request.get_json(silent=True) or {}
+    model_path = data.get('model_path')
+    if not isinstance(model_path, str) or not os.path.exists(model_path):
+        return jsonify({
+            'status': 'error',
+            'message': f'Model not found at {model_path}',
+            'code': 'MODEL_PATH_INVALID'
+        }), 400
+    if os.path.commonpath([os.path.realpath(model_path), MODELS_DIR]) != MODELS_DIR:
+        return jsonify({
+            'status': 'error',
+            'message': f'Models can only be loaded from {MODELS_DIR}',
+            'code': 'MODEL_PATH_INVALID'
+        }), 400
+    
+    started = registry.load_in_background(
+        model_path,
+        version=data.get('version'),
+        force=bool(data.get('force', False))
+    )
+    if not started:
+        return jsonify({
+            'status': 'error',
+            'message': 'A model load is already in progress',
+            'code': 'LOAD_IN_PROGRESS'
+        }), 409
+    
+    return jsonify({
+        'status': 'accepted',
+        'active_version': registry.active_version,
+        'model_path': model_path
+    }), 202
+
+@app.route('/body-regions', methods=['GET'])
+def list_body_regions():
+    """List the body regions in the psychosomatic index with their emotion counts."""
+    return Response(REGION_LIST_PAYLOAD, mimetype='application/json')
+
+@app.route('/body-regions/<region>', methods=['GET'])
+def body_region_emotions(region):
+    """
+    Which emotions affect a body region (e.g. /body-regions/chest).
+    
+    Answered from the region -> emotion inverted index with a pre-encoded
+    payload; entries carry intensity and sensation_type, strongest first.
+    """
+    payload = REGION_PAYLOADS.get(normalize_region_name(region))
+    if payload is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Unknown body region: {region}',
+            'code': 'UNKNOWN_REGION'
+        }), 404
+    
+    return Response(payload, mimetype='application/json')
+
+@app.route('/trends/<user_id>', methods=['GET'])
+def emotion_trends(user_id):
+    """
+    Emotion trends for a user, read from running aggregates (no inference).
+    
+    Query params:
+        k: number of most frequent emotions to return (default 5)
+    """
+    trends = trend_store.get_trends(user_id, k=request.args.get('k', type=int))
+    if trends is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'No analyzed entries for user {user_id}',
+            'code': 'NO_TRENDS'
+        }), 404
+    
+    trends['average_intensity'] = round(trends['average_intensity'], 3)
+    trends['recent_intensity'] = round(trends['recent_intensity'], 3)
+    return jsonify({'status': 'success', 'user_id': user_id, **trends})
+
+@app.route('/rollups/<user_id>', methods=['GET'])
+def emotion_rollups(user_id):
+    """
+    Day/week/month emotion rollups for the dashboards (no inference).
+    
+    Query params:
+        window: day, week or month (default week)
+        periods: number of most recent buckets to return (default 8)
+        since / until: epoch-second bounds on entry time
+        tz_offset: user's UTC offset in minutes for calendar boundaries
+    """
+    window = request.args.get('window', 'week')
+    if window not in WINDOWS:
+        return jsonify({
+            'status': 'error',
+            'message': f"window must be one of: {', '.join(WINDOWS)}",
+            'code': 'INVALID_WINDOW'
+        }), 400
+    
+    periods = request.args.get('periods', 8, type=int)
+    if periods < 1:
+        return jsonify({
+            'status': 'error',
+            'message': 'periods must be at least 1',
+            'code': 'INVALID_PERIODS'
+        }), 400
+    
+    rollup = rollup_engine.rollup(
+        user_id,
+        window=window,
+        since=request.args.get('since', type=float),
+        until=request.args.get('until', type=float),
+        periods=periods,
+        utc_offset_minutes=request.args.get('tz_offset', 0, type=int)
+    )
+    if rollup is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'No analyzed entries for user {user_id}',
+            'code': 'NO_ROLLUPS'
+        }), 404
+    
+    return jsonify({'status': 'success', 'user_id': user_id, **rollup})
+
+@app.route('/similar-entries', methods=['POST'])
+def similar_entries():
+    """
+    Find a user's past entries most similar to an entry (cosine similarity
+    over pooled BERT embeddings).
+    
+    Request JSON:
+    {
+        "user_id": "...",
+        "entry_id": "...",  // A stored entry to compare against, or
+        "text": "...",      // new text (embedded with the active model)
+        "k": 5              // Optional: number of matches
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({
+            'status': 'error',
+            'message': 'Missing "user_id" field in request',
+            'code': 'MISSING_USER_ID'
+        }), 400
+    
+    k = data.get('k', 5)
+    if isinstance(k, bool) or not isinstance(k, (int, str)) or not str(k).strip().isdigit():
+        return jsonify({
+            'status': 'error',
+            'message': '"k" must be a positive integer',
+            'code': 'INVALID_K'
+        }), 400
+    k = max(1, min(int(k), 50))
+    
+    entry_id = data.get('entry_id')
+    stored = entry_store.get(str(entry_id)) if entry_store and entry_id else None
+    if stored is not None and stored.get('user_id') != str(user_id):
+        # Another user's entry is treated as unknown, so its embedding is never used
+        stored = None
+    if stored is not None:
+        embedding = stored['embedding']
+        space = stored.get('embedding_space')
+        version = stored.get('model_version')
+    elif isinstance(data.get('text'), str) and data['text'].strip():
+        if not registry or not registry.active:
+            return jsonify({
+                'status': 'error',
+                'message': 'Emotion classifier not initialized',
+                'code': 'MODEL_NOT_LOADED'
+            }), 500
+        with registry.acquire() as model:
+            _, embedding, _, space = model.infer(data['text'].strip(), cache=registry.cache)
+            version = model.version
+    else:
+        return jsonify({
+            'status': 'error',
+            'message': 'Provide a stored "entry_id" or non-empty "text"',
+            'code': 'MISSING_QUERY'
+        }), 400
+    
+    # Only entries embedded by the same model version in the same space are comparable
+    matches = similarity_index.search(
+        str(user_id), embedding, k=k, exclude_id=str(entry_id) if entry_id else None,
+        space=space, model_version=version
+    )
+    return jsonify({
+        'status': 'success',
+        'user_id': user_id,
+        'matches': matches
+    })
+
 @app.route('/analyze-emotion', methods=['POST'])
 def analyze_emotion():
     """
     Analyze emotion in journal text using adaptive BERT model.
     
+    Identical requests (same normalized text, user, entry ID, context,
+    debug and attribution flags) arriving while one is being analyzed wait for it and receive
+    the same response.
+    
     Request JSON:
     {
         "text": "Your journal entry text here",
-        "debug": false  // Optional: include debug info
+        "debug": false,  // Optional: include debug info
+        "attribution": false,  // Optional: top words behind each detected emotion
+        "draft_id": "...", // Optional: releases the preview draft session
+        "user_id": "...",  // Optional: folds the result into the user's trends
+        "entry_id": "..."  // Optional: stable ID for the stored vectors (generated if omitted;
+                           // 403 if already stored for another user)
     }
     
     Response JSON:
@@ -101,6 +488,7 @@ def analyze_emotion():
             "threshold_used": 0.33,
             "max_emotions": 2
         },
+        "model_version": "bert_emotion_model-1a2b3c4d",
         "characteristics": {
             "emotional_density": 0.12,
             "complexity_score": 0.54,
@@ -108,103 +496,21 @@ def analyze_emotion():
         }
     }
     """
-    if not classifier:
-        return jsonify({
-            'status': 'error',
-            'message': 'Emotion classifier not initialized',
-            'code': 'MODEL_NOT_LOADED'
-        }), 500
+    data, text, error = parse_analysis_request()
+    if error:
+        return error
     
     try:
-        # Parse request
-        data = request.get_json()
-        if not data or 'text' not in data:
-            return jsonify({
-                'status': 'error',
-                'message': 'Missing "text" field in request',
-                'code': 'MISSING_TEXT'
-            }), 400
-        
-        text = data['text'].strip()
-        if not text:
-            return jsonify({
-                'status': 'error',
-                'message': 'Text cannot be empty',
-                'code': 'EMPTY_TEXT'
-            }), 400
-        
-        debug = data.get('debug', False)
-        
-        # Analyze with adaptive classifier
-        logger.info(f"Analyzing text: {text[:50]}...")
-        result = classifier.classify_adaptive(text, debug=debug)
-        
-        # Format response for SomaJournal
-        emotions = []
-        for emotion_data in result['emotions']:
-            emotions.append({
-                'emotion': emotion_data['emotion'],
-                'confidence': round(emotion_data['confidence'], 3)
-            })
-        
-        # Extract analysis metadata
-        analysis = {
-            'text_type': result['analysis']['text_type'],
-            'emotional_richness': result['analysis']['emotional_richness'],
-            'recommended_approach': result['analysis']['recommended_approach'],
-            'word_count': result['characteristics']['word_count'],
-            'threshold_used': round(result['adaptive_params']['threshold'], 3),
-            'max_emotions': result['adaptive_params']['max_emotions']
-        }
+        if COALESCE_ANALYSES:
+            response, shared = inflight_analyses.run(
+                coalescing_key(text, data),
+                lambda: run_full_analysis(text, data)
+            )
+            if shared:
+                logger.info("🔗 Coalesced duplicate analysis request")
+        else:
+            response = run_full_analysis(text, data)
         
-        # Optional characteristics for detailed analysis
-        characteristics = {
-            'emotional_density': round(result['characteristics']['emotional_density'], 3),
-            'complexity_score': round(result['characteristics']['complexity_score'], 3),
-            'has_multiple_emotions': result['characteristics']['has_multiple_emotions'],
-            'emotional_word_count': result['characteristics']['emotional_word_count'],
-            'sentence_count': result['characteristics']['sentence_count']
-        }
-        
-        # Convert to SomaJournal format (symptoms detection)
-        symptoms = detect_symptoms_from_emotions(emotions)
-        
-        # Add psychosomatic analysis if available
-        psychosomatic_analysis = None
-        if PSYCHOSOMATIC_AVAILABLE:
-            try:
-                psychosomatic_analysis = create_hybrid_analysis(
-                    text, 
-                    emotions,
-                    user_context=data.get('user_context')  # Optional user context
-                )
-                logger.info("✅ Psychosomatic analysis completed")
-            except Exception as e:
-                logger.warning(f"⚠️ Psychosomatic analysis failed: {e}")
-        
-        response = {
-            'status': 'success',
-            'emotions': emotions,
-            'analysis': analysis,
-            'characteristics': characteristics,
-            'symptoms': symptoms,
-            'adaptive_info': {
-                'strategy': result['analysis']['recommended_approach'],
-                'reasoning': f"Detected {len(emotions)} emotions using {analysis['text_type']} strategy"
-            }
-        }
-        
-        # Include psychosomatic analysis if available
-        if psychosomatic_analysis:
-            response['psychosomatic'] = psychosomatic_analysis
-        
-        if debug:
-            response['debug'] = {
-                'adaptive_params': result['adaptive_params'],
-                'full_characteristics': result['characteristics']
-            }
-        
-        logger.info(f"Analysis complete: {len(emotions)} emotions detected")
         return jsonify(response)
         
     except Exception as e:
@@ -215,57 +521,293 @@ def analyze_emotion():
             'code': 'ANALYSIS_FAILED'
         }), 500
 
+def run_full_analysis(text, data):
+    """
+    BERT analysis plus the psychosomatic analysis, as returned by /analyze-emotion.
+    
+    Returns:
+        Response dictionary
+    """
+    response, result = build_emotion_response(text, data)
+    
+    # Add psychosomatic analysis if available
+    psychosomatic_analysis = None
+    if PSYCHOSOMATIC_AVAILABLE:
+        try:
+            psychosomatic_analysis = create_hybrid_analysis(
+                text, 
+                response['emotions'],
+                user_context=data.get('user_context'),  # Optional user context
+                **hybrid_analysis_args(data, response, result)
+            )
+            logger.info("✅ Psychosomatic analysis completed")
+        except Exception as e:
+            logger.warning(f"⚠️ Psychosomatic analysis failed: {e}")
+    
+    # Include psychosomatic analysis if available
+    if psychosomatic_analysis:
+        response['psychosomatic'] = psychosomatic_analysis
+    
+    logger.info(f"Analysis complete: {len(response['emotions'])} emotions detected")
+    return response
+
+@app.route('/analyze-emotion/stream', methods=['POST'])
+def analyze_emotion_stream():
+    """
+    Streaming variant of /analyze-emotion using server-sent events.
+    
+    Accepts the same request JSON. Stages are sent as soon as they are ready:
+        event: emotions                - BERT emotions, analysis and symptoms
+        event: emotions_refined        - GPT re-detected emotions (weak BERT signal only)
+        event: psychosomatic_analysis  - evidence-based template
+        event: personalized_insights   - GPT personalization (or static fallback)
+        event: complete                - full response, identical to /analyze-emotion
+    Failures are sent as an "error" event.
+    """
+    data, text, error = parse_analysis_request()
+    if error:
+        return error
+    
+    def generate():
+        try:
+            response, result = build_emotion_response(text, data)
+            yield format_sse('emotions', response)
+            
+            if PSYCHOSOMATIC_AVAILABLE:
+                try:
+                    stages = iter_hybrid_analysis(
+                        text,
+                        response['emotions'],
+                        user_context=data.get('user_context'),
+                        **hybrid_analysis_args(data, response, result)
+                    )
+                    for stage, payload in stages:
+                        if stage == 'complete':
+                            response['psychosomatic'] = payload
+                        elif stage == 'emotions':
+                            yield format_sse('emotions_refined', payload)
+                        else:
+                            yield format_sse(stage, payload)
+                except Exception as e:
+                    logger.warning(f"⚠️ Psychosomatic analysis failed: {e}")
+            
+            yield format_sse('complete', response)
+            
+        except Exception as e:
+            logger.error(f"Error streaming emotion analysis: {str(e)}")
+            yield format_sse('error', {
+                'status': 'error',
+                'message': f'Analysis failed: {str(e)}',
+                'code': 'ANALYSIS_FAILED'
+            })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering so events flush immediately
+        }
+    )
+
+def format_sse(event, payload):
+    """Encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def parse_analysis_request():
+    """
+    Validate an analysis request.
+    
+    Returns:
+        Tuple of (data, text, error_response); error_response is None when valid
+    """
+    if not registry or not registry.active:
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': 'Emotion classifier not initialized',
+            'code': 'MODEL_NOT_LOADED'
+        }), 500)
+    
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('text'), str):
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': 'Missing "text" field in request',
+            'code': 'MISSING_TEXT'
+        }), 400)
+    
+    text = data['text'].strip()
+    if not text:
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': 'Text cannot be empty',
+            'code': 'EMPTY_TEXT'
+        }), 400)
+    
+    # Entry IDs are client-chosen; only their owner may overwrite a stored entry
+    entry_id = data.get('entry_id')
+    if entry_store and entry_id:
+        stored = entry_store.get(str(entry_id))
+        user_id = str(data['user_id']) if data.get('user_id') else None
+        if stored is not None and stored.get('user_id') != user_id:
+            return None, None, (jsonify({
+                'status': 'error',
+                'message': f'Entry {entry_id} belongs to another user',
+                'code': 'ENTRY_FORBIDDEN'
+            }), 403)
+    
+    return data, text, None
+
+def hybrid_analysis_args(data, response, result):
+    """
+    Model outputs passed to the hybrid analysis: the embedding for the GPT
+    semantic cache (scoped per user, and keyed by the embedding's space so
+    vectors from an exit head or a routed model are never matched against
+    final-pooler ones) and BERT's most probable labels as candidate primary
+    emotions for combined-mode GPT requests.
+    """
+    probabilities = result['probabilities']
+    top = sorted(range(len(probabilities)), key=lambda i: probabilities[i], reverse=True)[:COMBINED_CANDIDATE_COUNT]
+    return {
+        'embedding': result['embedding'],
+        'cache_scope': str(data['user_id']) if data.get('user_id') else None,
+        'model_version': '/'.join(filter(None, (response['model_version'], result['embedding_space']))),
+        'candidate_emotions': [GOEMOTIONS_LABELS[i] for i in top]
+    }
+
+def build_emotion_response(text, data):
+    """
+    Run the BERT stage of the analysis and format it for SomaJournal.
+    
+    Returns:
+        Tuple of (response dictionary without the psychosomatic analysis,
+        raw classifier result including probabilities and embedding)
+    """
+    debug = data.get('debug', False)
+    attribution = bool(data.get('attribution', False))
+    
+    if data.get('draft_id'):
+        draft_sessions.discard(data['draft_id'])
+    
+    # Analyze with adaptive classifier (pinned to one model version)
+    logger.info(f"Analyzing text: {text[:50]}...")
+    with registry.acquire() as model:
+        result = model.classify_adaptive(text, debug=debug, cache=registry.cache, attribution=attribution)
+    
+    # Format response for SomaJournal
+    emotions = []
+    for emotion_data in result['emotions']:
+        emotions.append({
+            'emotion': emotion_data['emotion'],
+            'confidence': round(emotion_data['confidence'], 3)
+        })
+    
+    # Extract analysis metadata
+    analysis = {
+        'text_type': result['analysis']['text_type'],
+        'emotional_richness': result['analysis']['emotional_richness'],
+        'recommended_approach': result['analysis']['recommended_approach'],
+        'word_count': result['characteristics']['word_count'],
+        'threshold_used': round(result['adaptive_params']['threshold'], 3),
+        'max_emotions': result['adaptive_params']['max_emotions']
+    }
+    
+    # Optional characteristics for detailed analysis
+    characteristics = {
+        'emotional_density': round(result['characteristics']['emotional_density'], 3),
+        'complexity_score': round(result['characteristics']['complexity_score'], 3),
+        'has_multiple_emotions': result['characteristics']['has_multiple_emotions'],
+        'emotional_word_count': result['characteristics']['emotional_word_count'],
+        'sentence_count': result['characteristics']['sentence_count']
+    }
+    
+    # Convert to SomaJournal format (symptoms detection)
+    symptoms = detect_symptoms_from_emotions(emotions)
+    
+    if data.get('user_id'):
+        trend_store.record(str(data['user_id']), emotions)
+        rollup_engine.record(str(data['user_id']), result['probabilities'])
+    
+    # Persist raw outputs so new decision rules can be applied without re-inference
+    entry_id = str(data.get('entry_id') or uuid.uuid4())
+    if entry_store:
+        try:
+            entry_store.put(
+                entry_id,
+                result['probabilities'],
+                result['embedding'],
+                features=result['characteristics'],
+                user_id=str(data['user_id']) if data.get('user_id') else None,
+                model_version=result['model_version'],
+                embedding_space=result['embedding_space']
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not persist entry vectors: {e}")
+    
+    if data.get('user_id'):
+        similarity_index.add(str(data['user_id']), entry_id, result['embedding'], {
+            'timestamp': time.time(),
+            'emotions': emotions[:3]
+        }, space=result['embedding_space'], model_version=result['model_version'])
+    
+    response = {
+        'status': 'success',
+        'emotions': emotions,
+        'analysis': analysis,
+        'characteristics': characteristics,
+        'symptoms': symptoms,
+        'model_version': result['model_version'],
+        'entry_id': entry_id,
+        'adaptive_info': {
+            'strategy': result['analysis']['recommended_approach'],
+            'reasoning': f"Detected {len(emotions)} emotions using {analysis['text_type']} strategy"
+        }
+    }
+    
+    if attribution:
+        # Top words behind each detected emotion, with character offsets into the text
+        response['attribution'] = result['attribution']
+    
+    if debug:
+        response['debug'] = {
+            'adaptive_params': result['adaptive_params'],
+            'full_characteristics': result['characteristics'],
+            'probability_cache_hit': result['cache_hit']
+        }
+    
+    return response, result
+
 def detect_symptoms_from_emotions(emotions):
     """
     Convert detected emotions to physical symptoms for SomaJournal compatibility.
     
+    Only high-confidence emotions (above SYMPTOM_CONFIDENCE_THRESHOLD) trigger
+    symptoms; the mapping is compiled into a matrix in psychosomatic_mapping.
+    
     Args:
         emotions: List of emotion dictionaries with 'emotion' and 'confidence'
         
     Returns:
         Dictionary of symptoms with boolean values
     """
-    symptoms = {
-        'tension': False,
-        'headache': False,
-        'fatigue': False,
-        'restlessness': False,
-        'nausea': False
-    }
-    
-    # Map emotions to potential symptoms
-    emotion_symptom_map = {
-        'anger': ['tension', 'headache'],
-        'anxiety': ['tension', 'restlessness', 'nausea'],
-        'fear': ['tension', 'nausea'],
-        'nervousness': ['restlessness', 'tension'],
-        'stress': ['tension', 'headache', 'fatigue'],
-        'annoyance': ['tension', 'headache'],
-        'frustration': ['tension'],
-        'sadness': ['fatigue'],
-        'grief': ['fatigue'],
-        'disappointment': ['fatigue']
-    }
-    
-    # Activate symptoms based on detected emotions
-    for emotion_data in emotions:
-        emotion = emotion_data['emotion']
-        confidence = emotion_data['confidence']
-        
-        # Only trigger symptoms for high-confidence negative emotions
-        if confidence > 0.5 and emotion in emotion_symptom_map:
-            for symptom in emotion_symptom_map[emotion]:
-                symptoms[symptom] = True
-    
-    return symptoms
+    flags = detect_symptoms(emotions)
+    return {symptom: bool(flag) for symptom, flag in zip(SYMPTOM_NAMES, flags)}
 
 @app.route('/preview-analysis', methods=['POST'])
 def preview_analysis():
     """
     Quick preview of what analysis would return (for real-time UI feedback).
     Returns minimal data about emotion count and strategy without full analysis.
+    
+    When a "draft_id" is supplied, the server keeps the draft's counters and
+    only scans the part of the text that changed since the previous preview.
+    
+    When "speculate" is true, the draft is also queued for low-priority
+    background inference so the final submit usually hits the probability cache.
+    The speculative budget is per client address: user and draft IDs are
+    client-chosen, so keying on them would let a client lift its own limit.
     """
-    if not classifier:
+    if not registry or not registry.active:
         return jsonify({
             'status': 'error',
             'message': 'Classifier not available'
@@ -283,7 +825,12 @@ def preview_analysis():
             })
         
         # Quick characteristics analysis (no model inference)
-        characteristics = classifier.analyze_text_characteristics(text)
+        classifier = registry.active.classifier
+        draft_id = data.get('draft_id')
+        if draft_id:
+            characteristics = draft_sessions.update(draft_id, data.get('text', ''), classifier)
+        else:
+            characteristics = classifier.analyze_text_characteristics(text)
         adaptive_params = classifier.determine_adaptive_parameters(characteristics)
         
         text_type_descriptions = {
@@ -302,13 +849,18 @@ def preview_analysis():
         
         text_type = classifier._categorize_text_type(characteristics)
         
-        return jsonify({
+        preview = {
             'emotion_count': adaptive_params['max_emotions'],
             'strategy': strategy_descriptions.get(text_type, 'Balanced approach'),
             'text_type': text_type_descriptions.get(text_type, text_type),
             'word_count': characteristics['word_count'],
             'threshold': round(adaptive_params['threshold'], 2)
-        })
+        }
+        
+        if data.get('speculate') and speculative_queue:
+            preview['speculative'] = speculative_queue.submit(request.remote_addr, text)
+        
+        return jsonify(preview)
         
     except Exception as e:
         logger.error(f"Preview analysis error: {str(e)}")
@@ -370,6 +922,7 @@ if __name__ == '__main__':
         print(f"🔗 Health check: http://localhost:8000/health")
         print(f"📝 Emotion analysis: POST http://localhost:8000/analyze-emotion")
         print(f"⚡ Preview analysis: POST http://localhost:8000/preview-analysis")
+        print(f"📦 Model versions: GET http://localhost:8000/models")
         print("=" * 60)
         
         # Run the server
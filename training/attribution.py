@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Word-Level Emotion Attribution from the Main Forward Pass
+
+Shows which words drove an emotion without gradient-based attribution
+(which would double or triple inference cost). Everything is computed from
+what the forward pass already produces:
+- Attention rollout (Abnar & Zuidema, 2020): head-averaged attention of every
+  layer, mixed with the residual connection and multiplied through the
+  layers, gives how much the [CLS] representation draws from each token
+- Per-emotion token evidence: each token's final hidden state is passed
+  through the pooler and classification head, giving the logits the head
+  would produce from that token alone; only tokens above the entry's
+  median logit for an emotion count as evidence for it
+- Token scores (rollout × evidence) are summed into words through the
+  tokenizer offsets and normalized per emotion
+
+Word scores are stored compactly (float16, words × labels) so they can be
+cached next to the probability vector and re-used for any emotion.
+"""
+
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+# Share of each layer's mixing attributed to the residual connection
+RESIDUAL_WEIGHT = 0.5
+
+
+def attention_rollout(attentions: np.ndarray, residual_weight: float = RESIDUAL_WEIGHT) -> np.ndarray:
+    """
+    Relevance of every token to the [CLS] position.
+
+    Args:
+        attentions: layers × seq × seq head-averaged attention weights
+
+    Returns:
+        seq array of rollout weights (sums to 1)
+    """
+    seq = attentions.shape[-1]
+    identity = np.eye(seq, dtype=np.float64)
+    rollout = identity
+    for layer in attentions:
+        mixed = residual_weight * identity + (1 - residual_weight) * layer
+        mixed = mixed / mixed.sum(axis=-1, keepdims=True)
+        rollout = mixed @ rollout
+    return rollout[0]
+
+
+def word_attribution(tokenized, attentions: np.ndarray, token_logits: np.ndarray) -> Dict[str, Any]:
+    """
+    Per-word, per-emotion attribution scores for one text.
+
+    Args:
+        tokenized: TokenizedText of the text (offsets and word IDs)
+        attentions: layers × seq × seq head-averaged attention weights
+        token_logits: seq × labels logits of the head applied to each token
+
+    Returns:
+        Dictionary with words [(word, start, end)] and scores (words × labels,
+        float16, each emotion's column sums to 1 where it has evidence)
+    """
+    words = tokenized.words()
+    num_labels = token_logits.shape[-1]
+    if not words:
+        return {'words': [], 'scores': np.zeros((0, num_labels), dtype=np.float16)}
+
+    relevance = attention_rollout(attentions)
+    content = [index for word in words for index in word['tokens']]
+    baseline = np.median(token_logits[content], axis=0)
+    token_scores = relevance[:, None] * np.maximum(token_logits - baseline, 0.0)
+
+    scores = np.stack([token_scores[word['tokens']].sum(axis=0) for word in words])
+    totals = scores.sum(axis=0, keepdims=True)
+    scores = np.divide(scores, totals, out=np.zeros_like(scores), where=totals > 0)
+    return {
+        'words': [(word['word'], word['start'], word['end']) for word in words],
+        'scores': scores.astype(np.float16)
+    }
+
+
+def top_words(
+    attribution: Dict[str, Any],
+    labels: List[str],
+    emotions: List[str],
+    k: int = 3,
+    min_score: float = 0.05
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    The words that contributed most to each requested emotion.
+
+    Args:
+        attribution: Output of word_attribution
+        labels: Emotion labels aligned with the score columns
+        emotions: Emotions to explain (normally the detected ones)
+        k: Words returned per emotion
+        min_score: Minimum normalized score for a word to be returned
+
+    Returns:
+        {emotion: [{word, start, end, score}]} strongest first
+    """
+    words = attribution['words']
+    scores = np.asarray(attribution['scores'], dtype=np.float32)
+    # Punctuation-only words are never shown as highlights
+    eligible = np.array([any(ch.isalnum() for ch in word) for word, _, _ in words], dtype=bool)
+
+    result = {}
+    for emotion in emotions:
+        if emotion not in labels or not words:
+            result[emotion] = []
+            continue
+        column = np.where(eligible, scores[:, labels.index(emotion)], 0.0)
+        ranked = [i for i in np.argsort(-column)[:k] if column[i] >= min_score]
+        result[emotion] = [
+            {'word': words[i][0], 'start': int(words[i][1]), 'end': int(words[i][2]), 'score': round(float(column[i]), 3)}
+            for i in ranked
+        ]
+    return result
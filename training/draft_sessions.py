@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Incremental Draft Analysis for SomaJournal
+
+The journal editor calls /preview-analysis on every debounced keystroke. Rather
+than re-running AdaptiveEmotionClassifier.analyze_text_characteristics over the
+whole draft each time, a DraftSession keeps the word, lexicon, sentence,
+amplifier and contrast counters for a draft ID and only scans the part of the
+text that changed. Appending or deleting at the end of a draft costs O(delta).
+
+The characteristics produced are identical to analyze_text_characteristics.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+WORD_PATTERN = re.compile(r'\S+')
+SENTENCE_TERMINATORS = '.!?'
+CONTRAST_WORDS = ['but', 'however', 'although', 'despite', 'yet', 'while', 'though']
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    """Length of the common prefix of two strings (binary search on C-level compares)."""
+    if b.startswith(a):
+        return len(a)
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class DraftSession:
+    """
+    Incrementally maintained text characteristics for one draft.
+    """
+
+    def __init__(self, classifier):
+        """
+        Initialize an empty draft.
+
+        Args:
+            classifier: AdaptiveEmotionClassifier providing the lexicons and
+                complexity scoring
+        """
+        self.classifier = classifier
+        self.max_pattern_length = max(
+            len(p) for p in classifier.intensity_amplifiers + CONTRAST_WORDS
+        )
+        self.updated_at = time.time()
+        self._reset()
+
+    def _reset(self):
+        self.text = ''
+        self.lower = ''
+
+        # Committed words: (start, end, category) for words followed by whitespace
+        self.words: List[Tuple[int, int, Optional[str]]] = []
+        self.emotional_word_count = 0
+        self.emotion_categories = {category: 0 for category in self.classifier.emotional_words}
+
+        # Positions of terminators that closed a non-empty sentence
+        self.sentence_marks: List[int] = []
+        self.segment_has_content = False
+
+        # End positions of amplifier / contrast substring matches
+        self.amplifier_matches: List[int] = []
+        self.contrast_matches: List[int] = []
+
+    def _categorize_word(self, word: str) -> Optional[str]:
+        for category, word_list in self.classifier.emotional_words.items():
+            if any(emotional_word in word for emotional_word in word_list):
+                return category
+        return None
+
+    def update(self, text: str) -> Dict[str, Any]:
+        """
+        Bring the session up to date with the current draft text.
+
+        Args:
+            text: Full current draft text
+
+        Returns:
+            Characteristics dictionary, same shape as analyze_text_characteristics
+        """
+        self.updated_at = time.time()
+
+        if text != self.text:
+            keep = _common_prefix_length(self.text, text)
+            delta = text[keep:]
+
+            # Case mapping that changes length breaks the position bookkeeping
+            if len(delta.lower()) != len(delta) or len(self.lower) != len(self.text):
+                self._reset()
+                keep, delta = 0, text
+
+            if keep < len(self.text):
+                self._truncate(keep)
+            if delta:
+                self._append(delta)
+
+        return self.characteristics()
+
+    def _truncate(self, position: int):
+        """Roll the counters back so they describe text[:position]."""
+        self.text = self.text[:position]
+        self.lower = self.lower[:position]
+
+        # Words ending at or after the cut are no longer followed by whitespace
+        while self.words and self.words[-1][1] >= position:
+            _, _, category = self.words.pop()
+            if category is not None:
+                self.emotional_word_count -= 1
+                self.emotion_categories[category] -= 1
+
+        while self.sentence_marks and self.sentence_marks[-1] >= position:
+            self.sentence_marks.pop()
+        segment_start = self.sentence_marks[-1] + 1 if self.sentence_marks else 0
+        self.segment_has_content = any(
+            not ch.isspace() and ch not in SENTENCE_TERMINATORS
+            for ch in self.text[segment_start:position]
+        )
+
+        while self.amplifier_matches and self.amplifier_matches[-1] > position:
+            self.amplifier_matches.pop()
+        while self.contrast_matches and self.contrast_matches[-1] > position:
+            self.contrast_matches.pop()
+
+    def _append(self, delta: str):
+        """Scan only the appended suffix (plus a small overlap for substrings)."""
+        old_length = len(self.text)
+        self.text += delta
+        self.lower += delta.lower()
+
+        # Sentences: a terminator closes the current segment if it has content
+        for offset, ch in enumerate(delta):
+            if ch in SENTENCE_TERMINATORS:
+                if self.segment_has_content:
+                    self.sentence_marks.append(old_length + offset)
+                    self.segment_has_content = False
+            elif not ch.isspace():
+                self.segment_has_content = True
+
+        # Words: rescan from the end of the last committed word
+        scan_start = self.words[-1][1] if self.words else 0
+        for match in WORD_PATTERN.finditer(self.lower, scan_start):
+            if match.end() == len(self.lower):
+                break  # Trailing word may still grow; evaluated in characteristics()
+            category = self._categorize_word(match.group())
+            self.words.append((match.start(), match.end(), category))
+            if category is not None:
+                self.emotional_word_count += 1
+                self.emotion_categories[category] += 1
+
+        # Substring flags: only matches ending inside the new text are new
+        window_start = max(0, old_length - self.max_pattern_length + 1)
+        self.amplifier_matches.extend(
+            self._find_new_matches(self.classifier.intensity_amplifiers, window_start, old_length)
+        )
+        self.contrast_matches.extend(
+            self._find_new_matches(CONTRAST_WORDS, window_start, old_length)
+        )
+
+    def _find_new_matches(self, patterns: List[str], window_start: int, old_length: int) -> List[int]:
+        ends = []
+        for pattern in patterns:
+            index = self.lower.find(pattern, window_start)
+            while index != -1:
+                end = index + len(pattern)
+                if end > old_length:
+                    ends.append(end)
+                index = self.lower.find(pattern, index + 1)
+        return sorted(ends)
+
+    def characteristics(self) -> Dict[str, Any]:
+        """Assemble the characteristics dictionary from the running counters."""
+        word_count = len(self.words)
+        emotional_word_count = self.emotional_word_count
+        emotion_categories = dict(self.emotion_categories)
+
+        # Account for the trailing (uncommitted) word, if any
+        scan_start = self.words[-1][1] if self.words else 0
+        tail = self.lower[scan_start:].split()
+        if tail:
+            word_count += 1
+            category = self._categorize_word(tail[-1])
+            if category is not None:
+                emotional_word_count += 1
+                emotion_categories[category] += 1
+
+        sentence_count = len(self.sentence_marks) + (1 if self.segment_has_content else 0)
+        intensity_count = word_count if self.amplifier_matches else 0
+        emotional_density = emotional_word_count / max(word_count, 1)
+        has_multiple_emotions = sum(1 for count in emotion_categories.values() if count > 0) > 1
+        has_contrasts = bool(self.contrast_matches)
+
+        return {
+            'word_count': word_count,
+            'sentence_count': sentence_count,
+            'avg_sentence_length': word_count / max(sentence_count, 1),
+            'emotional_word_count': emotional_word_count,
+            'emotional_density': emotional_density,
+            'emotion_categories': emotion_categories,
+            'intensity_count': intensity_count,
+            'has_multiple_emotions': has_multiple_emotions,
+            'has_contrasts': has_contrasts,
+            'complexity_score': self.classifier._calculate_complexity_score(
+                emotional_density, has_multiple_emotions, has_contrasts, intensity_count
+            )
+        }
+
+
+class DraftSessionStore:
+    """
+    Bounded, expiring store of draft sessions keyed by draft ID.
+    """
+
+    def __init__(self, max_sessions: int = 5000, ttl_seconds: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, DraftSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, draft_id: str, text: str, classifier) -> Dict[str, Any]:
+        """
+        Update (or create) the session for draft_id and return its characteristics.
+        """
+        with self._lock:
+            session = self._sessions.get(draft_id)
+            if session is None or session.classifier is not classifier:
+                session = DraftSession(classifier)
+                self._sessions[draft_id] = session
+            self._sessions.move_to_end(draft_id)
+            self._evict()
+            return session.update(text)
+
+    def discard(self, draft_id: str):
+        with self._lock:
+            self._sessions.pop(draft_id, None)
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl_seconds
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or oldest.updated_at < cutoff:
+                self._sessions.popitem(last=False)
+            else:
+                break
+
+    def __len__(self):
+        return len(self._sessions)
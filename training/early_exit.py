@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Early-Exit BERT for Emotion Classification
+
+Short, easy entries ("quick_note" texts under 10 words) rarely need all 12
+encoder layers. This module adds lightweight classification heads after
+selected layers of the fine-tuned BertForSequenceClassification and stops
+inference at the first head whose prediction is confident enough:
+- Each exit head pools the layer's [CLS] hidden state (dense + tanh, initialized
+  from the model's own pooler) and projects it to the 28 emotion logits
+- Rows of a batch that exit are removed from the batch, so the remaining
+  layers only run for the texts that still need them
+- The final layer always answers with the model's original pooler and
+  classifier, so a text that never exits gets exactly the full-depth output
+
+Confidence criteria (CRITERIA):
+    max_prob  The top emotion's probability is at least the threshold
+    entropy   Every label's binary entropy (bits) is at most the threshold
+    patience  The top emotion is unchanged across `threshold` consecutive heads
+    none      Never exit early (full-depth baseline)
+
+The heads are stored next to the model (early_exit_heads.pt and
+early_exit_config.json), so the directory still loads as a plain model.
+
+Configuration (environment variables, override early_exit_config.json):
+    SOMA_EARLY_EXIT_CRITERION  Confidence criterion (default: max_prob)
+    SOMA_EARLY_EXIT_THRESHOLD  Criterion threshold (default: the saved one when the
+                               criterion matches, else CRITERION_THRESHOLDS)
+
+Train the heads and report layers executed / latency against macro F1:
+    python scripts/train_early_exit.py --exit_layers 2,4,6,8,10
+"""
+
+import os
+import json
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+EXIT_HEADS_FILE = 'early_exit_heads.pt'
+EXIT_CONFIG_FILE = 'early_exit_config.json'
+
+DEFAULT_EXIT_LAYERS = [2, 4, 6, 8, 10]
+DEFAULT_CRITERION = 'max_prob'
+DEFAULT_THRESHOLD = 0.9
+
+# Default threshold of each criterion; thresholds don't carry over between criteria
+CRITERION_THRESHOLDS = {
+    'max_prob': DEFAULT_THRESHOLD,
+    'entropy': 0.5,
+    'patience': 3,
+    'none': 0.0
+}
+
+
+def _max_prob(probabilities: torch.Tensor, threshold: float, state: Dict[str, torch.Tensor]) -> torch.Tensor:
+    return probabilities.max(dim=-1).values >= threshold
+
+
+def _entropy(probabilities: torch.Tensor, threshold: float, state: Dict[str, torch.Tensor]) -> torch.Tensor:
+    p = probabilities.clamp(1e-6, 1 - 1e-6)
+    entropy = -(p * torch.log2(p) + (1 - p) * torch.log2(1 - p))
+    return entropy.max(dim=-1).values <= threshold
+
+
+def _patience(probabilities: torch.Tensor, threshold: float, state: Dict[str, torch.Tensor]) -> torch.Tensor:
+    top = probabilities.argmax(dim=-1)
+    previous = state.get('top')
+    streak = state.get('streak')
+    if previous is None:
+        streak = torch.ones_like(top)
+    else:
+        streak = torch.where(top == previous, streak + 1, torch.ones_like(top))
+    state['top'], state['streak'] = top, streak
+    return streak >= threshold
+
+
+def _never(probabilities: torch.Tensor, threshold: float, state: Dict[str, torch.Tensor]) -> torch.Tensor:
+    return torch.zeros(probabilities.shape[0], dtype=torch.bool, device=probabilities.device)
+
+
+# Each criterion maps (probabilities, threshold, per-row state) to a boolean exit mask
+CRITERIA = {
+    'max_prob': _max_prob,
+    'entropy': _entropy,
+    'patience': _patience,
+    'none': _never
+}
+
+
+def validate_threshold(criterion: str, threshold: float) -> float:
+    """
+    Check that a threshold makes sense for its criterion.
+
+    Raises:
+        ValueError: Unknown criterion, or a threshold outside the criterion's range
+    """
+    if criterion not in CRITERIA:
+        raise ValueError(f"Unknown early-exit criterion '{criterion}'; choose from {sorted(CRITERIA)}")
+    threshold = float(threshold)
+    if criterion == 'patience' and (threshold < 1 or threshold != int(threshold)):
+        raise ValueError(f"patience needs a whole number of heads (at least 1), got {threshold}")
+    if criterion == 'max_prob' and not 0 < threshold <= 1:
+        raise ValueError(f"max_prob needs a probability in (0, 1], got {threshold}")
+    if criterion == 'entropy' and not 0 < threshold <= 1:
+        raise ValueError(f"entropy needs a binary entropy in (0, 1] bits, got {threshold}")
+    return threshold
+
+
+class ExitHead(nn.Module):
+    """Pooler + classifier applied to one layer's [CLS] hidden state."""
+
+    def __init__(self, hidden_size: int, num_labels: int, dropout: float = 0.1):
+        super().__init__()
+        self.dense = nn.Linear(hidden_size, hidden_size)
+        self.activation = nn.Tanh()
+        self.dropout = nn.Dropout(dropout)
+        self.classifier = nn.Linear(hidden_size, num_labels)
+
+    def forward(self, cls_hidden: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        pooled = self.activation(self.dense(cls_hidden))
+        return self.classifier(self.dropout(pooled)), pooled
+
+
+class EarlyExitBert(nn.Module):
+    """
+    BertForSequenceClassification with exit heads after selected layers.
+    """
+
+    def __init__(
+        self,
+        model,
+        exit_layers: Optional[List[int]] = None,
+        criterion: str = DEFAULT_CRITERION,
+        threshold: float = DEFAULT_THRESHOLD
+    ):
+        """
+        Initialize the exit heads around a fine-tuned model.
+
+        Args:
+            model: Fine-tuned BertForSequenceClassification
+            exit_layers: Layers (1-based) followed by an exit head; the last
+                layer is served by the model's own classifier
+            criterion: Name of the confidence criterion in CRITERIA
+            threshold: Criterion threshold
+        """
+        super().__init__()
+        config = model.config
+        self.model = model
+        self.num_layers = config.num_hidden_layers
+        self.exit_layers = sorted(
+            layer for layer in (exit_layers or DEFAULT_EXIT_LAYERS) if 0 < layer < self.num_layers
+        )
+        self.heads = nn.ModuleDict({
+            str(layer): ExitHead(config.hidden_size, config.num_labels, config.hidden_dropout_prob)
+            for layer in self.exit_layers
+        })
+        # Start every head from the trained pooler so early training is stable
+        for head in self.heads.values():
+            head.dense.load_state_dict(model.bert.pooler.dense.state_dict())
+        self.backbone_frozen = False
+        self.set_criterion(criterion, threshold)
+
+    def set_criterion(self, criterion: str, threshold: float):
+        self.threshold = validate_threshold(criterion, threshold)
+        self.criterion = criterion
+
+    def freeze_backbone(self):
+        """Train only the exit heads; the full-depth output stays exactly as before."""
+        for parameter in self.model.parameters():
+            parameter.requires_grad = False
+        self.backbone_frozen = True
+
+    def train(self, mode: bool = True):
+        super().train(mode)
+        if self.backbone_frozen:
+            # No dropout in a frozen backbone: heads see the hidden states used at inference
+            self.model.eval()
+        return self
+
+    def forward(self, input_ids=None, attention_mask=None, token_type_ids=None, labels=None) -> Dict[str, Any]:
+        """
+        Training forward pass through all layers and all heads.
+
+        Returns:
+            Dictionary with logits (batch × exits × labels, final classifier
+            last) and, when labels are given, the loss: BCE of every head
+            weighted by its depth (the final classifier is left out when the
+            backbone is frozen)
+        """
+        with torch.set_grad_enabled(torch.is_grad_enabled() and not self.backbone_frozen):
+            outputs = self.model.bert(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+                output_hidden_states=True
+            )
+            final_logits = self.model.classifier(self.model.dropout(outputs.pooler_output))
+
+        exit_logits = [self.heads[str(layer)](outputs.hidden_states[layer][:, 0])[0] for layer in self.exit_layers]
+        logits = torch.stack(exit_logits + [final_logits], dim=1)
+
+        result = {'logits': logits}
+        if labels is not None:
+            loss_fn = nn.BCEWithLogitsLoss()
+            depths = self.exit_layers + ([] if self.backbone_frozen else [self.num_layers])
+            losses = [loss_fn(logits[:, i], labels.float()) * depth for i, depth in enumerate(depths)]
+            result['loss'] = torch.stack(losses).sum() / sum(depths)
+        return result
+
+    @torch.no_grad()
+    def exit_forward(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        criterion: Optional[str] = None,
+        threshold: Optional[float] = None
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Inference that stops each row at its first confident exit head.
+
+        Args:
+            input_ids: batch × seq token IDs
+            attention_mask: batch × seq mask
+            criterion: Override of the configured criterion
+            threshold: Override of the configured threshold
+
+        Returns:
+            Tuple of (batch × labels probabilities, batch × hidden pooled
+            outputs, batch layers executed)
+        """
+        should_exit = CRITERIA[criterion or self.criterion]
+        if threshold is None:
+            threshold = self.threshold
+        else:
+            threshold = validate_threshold(criterion or self.criterion, threshold)
+        bert = self.model.bert
+        config = self.model.config
+        batch_size = input_ids.shape[0]
+
+        probabilities = torch.zeros(batch_size, config.num_labels, device=input_ids.device)
+        pooled_out = torch.zeros(batch_size, config.hidden_size, device=input_ids.device)
+        layers = torch.full((batch_size,), self.num_layers, dtype=torch.long, device=input_ids.device)
+
+        hidden = bert.embeddings(input_ids=input_ids)
+        mask = bert.get_extended_attention_mask(attention_mask, input_ids.shape)
+        active = torch.arange(batch_size, device=input_ids.device)
+        state: Dict[str, torch.Tensor] = {}
+
+        for depth, layer in enumerate(bert.encoder.layer, start=1):
+            outputs = layer(hidden, attention_mask=mask)
+            hidden = outputs[0] if isinstance(outputs, tuple) else outputs
+            if depth == self.num_layers or str(depth) not in self.heads:
+                continue
+
+            logits, pooled = self.heads[str(depth)](hidden[:, 0])
+            head_probabilities = torch.sigmoid(logits)
+            done = should_exit(head_probabilities, threshold, state)
+            if not done.any():
+                continue
+
+            rows = active[done]
+            probabilities[rows] = head_probabilities[done]
+            pooled_out[rows] = pooled[done]
+            layers[rows] = depth
+
+            keep = ~done
+            if not keep.any():
+                return probabilities, pooled_out, layers
+            active, hidden, mask = active[keep], hidden[keep], mask[keep]
+            state = {name: value[keep] for name, value in state.items()}
+
+        pooled = bert.pooler(hidden)
+        probabilities[active] = torch.sigmoid(self.model.classifier(self.model.dropout(pooled)))
+        pooled_out[active] = pooled
+        return probabilities, pooled_out, layers
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'exit_layers': self.exit_layers,
+            'num_layers': self.num_layers,
+            'criterion': self.criterion,
+            'threshold': self.threshold
+        }
+
+
+def has_exit_heads(model_path: str) -> bool:
+    return os.path.exists(os.path.join(model_path, EXIT_HEADS_FILE))
+
+
+def save_exit_heads(exit_model: EarlyExitBert, model_path: str, extra: Optional[Dict[str, Any]] = None):
+    """
+    Write the exit heads and their configuration next to the model.
+
+    Args:
+        exit_model: Trained EarlyExitBert
+        model_path: Model directory (the backbone is saved separately)
+        extra: Additional fields for early_exit_config.json (e.g. the report)
+    """
+    os.makedirs(model_path, exist_ok=True)
+    torch.save(exit_model.heads.state_dict(), os.path.join(model_path, EXIT_HEADS_FILE))
+    config = {**exit_model.describe(), **(extra or {})}
+    with open(os.path.join(model_path, EXIT_CONFIG_FILE), 'w') as f:
+        json.dump(config, f, indent=2)
+
+
+def update_exit_config(model_path: str, **fields):
+    """Merge fields (e.g. a tuned criterion and threshold) into early_exit_config.json."""
+    config_path = os.path.join(model_path, EXIT_CONFIG_FILE)
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    config.update(fields)
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+
+def load_early_exit(
+    model,
+    model_path: str,
+    criterion: Optional[str] = None,
+    threshold: Optional[float] = None
+) -> Optional[EarlyExitBert]:
+    """
+    Attach the saved exit heads to a loaded model.
+
+    The criterion and threshold come from the arguments, then the
+    SOMA_EARLY_EXIT_* environment variables, then early_exit_config.json.
+    The saved threshold is only used with the criterion it was tuned for;
+    another criterion starts from its CRITERION_THRESHOLDS default.
+
+    Args:
+        model: BertForSequenceClassification loaded from model_path
+        model_path: Model directory containing the exit heads
+
+    Returns:
+        EarlyExitBert in eval mode, or None when the model has no exit heads
+    """
+    if not has_exit_heads(model_path):
+        return None
+
+    with open(os.path.join(model_path, EXIT_CONFIG_FILE), 'r') as f:
+        config = json.load(f)
+    criterion = criterion or os.getenv('SOMA_EARLY_EXIT_CRITERION') or config.get('criterion', DEFAULT_CRITERION)
+    if criterion not in CRITERIA:
+        raise ValueError(f"Unknown early-exit criterion '{criterion}'; choose from {sorted(CRITERIA)}")
+    if threshold is None and os.getenv('SOMA_EARLY_EXIT_THRESHOLD'):
+        threshold = float(os.getenv('SOMA_EARLY_EXIT_THRESHOLD'))
+    if threshold is None:
+        if config.get('threshold') is not None and config.get('criterion', DEFAULT_CRITERION) == criterion:
+            threshold = float(config['threshold'])
+        else:
+            threshold = CRITERION_THRESHOLDS[criterion]
+
+    exit_model = EarlyExitBert(model, config['exit_layers'], criterion, threshold)
+    device = next(model.parameters()).device
+    exit_model.heads.load_state_dict(torch.load(os.path.join(model_path, EXIT_HEADS_FILE), map_location=device))
+    exit_model.to(device)
+    exit_model.eval()
+    logger.info(f"⚡ Early exit enabled after layers {exit_model.exit_layers} ({criterion}, threshold {threshold})")
+    return exit_model
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Columnar Emotion Rollups for SomaJournal Dashboards
+
+Stores each analyzed entry's probability vector and timestamp in per-user
+columnar numpy arrays, and answers day/week/month rollups with vectorized
+reductions instead of shipping every raw entry to the browser:
+- Entry counts and emotion histograms per bucket
+- Mean probability per emotion and the dominant emotion per bucket
+- Net valence per bucket, emotional highs/lows and volatility for the range
+
+Columns live in the API process's memory and are rebuilt from the entry
+store at startup (load_from_store); with several workers, each one only
+adds the entries it analyzes itself until its next restart.
+"""
+
+import threading
+import time
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+from psychosomatic_mapping import GOEMOTIONS_LABELS
+
+WINDOWS = ('day', 'week', 'month')
+
+# GoEmotions labels counted as emotional highs and lows
+POSITIVE_EMOTIONS = {
+    'admiration', 'amusement', 'approval', 'caring', 'excitement',
+    'gratitude', 'joy', 'love', 'optimism', 'pride', 'relief'
+}
+NEGATIVE_EMOTIONS = {
+    'anger', 'annoyance', 'disappointment', 'disapproval', 'disgust',
+    'embarrassment', 'fear', 'grief', 'nervousness', 'remorse', 'sadness'
+}
+
+SECONDS_PER_DAY = 86400
+
+
+class UserColumns:
+    """Growable columns of entry timestamps and probability vectors for one user."""
+
+    def __init__(self, num_labels: int, initial_capacity: int = 64):
+        self.timestamps = np.empty(initial_capacity, dtype=np.float64)
+        self.probabilities = np.empty((initial_capacity, num_labels), dtype=np.float32)
+        self.size = 0
+
+    def append(self, timestamp: float, probabilities: np.ndarray):
+        if self.size == len(self.timestamps):
+            capacity = len(self.timestamps) * 2
+            timestamps = np.empty(capacity, dtype=np.float64)
+            timestamps[:self.size] = self.timestamps[:self.size]
+            vectors = np.empty((capacity, self.probabilities.shape[1]), dtype=np.float32)
+            vectors[:self.size] = self.probabilities[:self.size]
+            # Swap in whole arrays so readers holding the old views stay valid
+            self.timestamps, self.probabilities = timestamps, vectors
+
+        self.timestamps[self.size] = timestamp
+        self.probabilities[self.size] = probabilities
+        self.size += 1
+
+
+def bucket_keys(timestamps: np.ndarray, window: str, utc_offset_minutes: int = 0) -> np.ndarray:
+    """
+    Map epoch timestamps to calendar bucket keys.
+
+    Keys are days since the epoch for 'day' and 'week' (the Monday starting
+    the week, matching the dashboards) and months since the epoch for 'month'.
+    """
+    local = timestamps + utc_offset_minutes * 60
+    days = np.floor(local / SECONDS_PER_DAY).astype(np.int64)
+    if window == 'day':
+        return days
+    if window == 'week':
+        # 1970-01-01 was a Thursday, so shift by 3 to align weeks on Monday
+        return days - (days + 3) % 7
+    if window == 'month':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f"Unknown window '{window}' (expected one of {', '.join(WINDOWS)})")
+
+
+def bucket_start(key: int, window: str) -> str:
+    """ISO date of the first day of a bucket."""
+    unit = 'M' if window == 'month' else 'D'
+    return str(np.datetime64(int(key), unit).astype('datetime64[D]'))
+
+
+class EmotionRollupEngine:
+    """
+    Thread-safe per-user columnar store with time-windowed rollup queries.
+    """
+
+    def __init__(
+        self,
+        labels: Optional[List[str]] = None,
+        significance: float = 0.5,
+        initial_capacity: int = 64
+    ):
+        """
+        Initialize the engine.
+
+        Args:
+            labels: Emotion label for each probability column
+            significance: Probability at which an emotion counts as present
+            initial_capacity: Rows allocated per user before the first growth
+        """
+        self.labels = list(labels or GOEMOTIONS_LABELS)
+        self.significance = significance
+        self.initial_capacity = initial_capacity
+
+        self._label_array = np.array(self.labels)
+        self._positive = np.array([label in POSITIVE_EMOTIONS for label in self.labels])
+        self._negative = np.array([label in NEGATIVE_EMOTIONS for label in self.labels])
+        self._positive_index = np.flatnonzero(self._positive)
+        self._negative_index = np.flatnonzero(self._negative)
+
+        self._users: Dict[str, UserColumns] = {}
+        self._lock = threading.Lock()
+
+    def record(self, user_id: str, probabilities, timestamp: Optional[float] = None):
+        """
+        Append one analyzed entry to the user's columns.
+
+        Args:
+            user_id: User identifier
+            probabilities: Probability vector with one value per label
+            timestamp: Entry time in epoch seconds (defaults to now)
+        """
+        vector = np.asarray(probabilities, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != len(self.labels):
+            raise ValueError(f"Expected {len(self.labels)} probabilities, got {vector.shape[0]}")
+        timestamp = timestamp if timestamp is not None else time.time()
+
+        with self._lock:
+            columns = self._users.get(user_id)
+            if columns is None:
+                columns = self._users[user_id] = UserColumns(len(self.labels), self.initial_capacity)
+            columns.append(timestamp, vector)
+
+    def load_from_store(self, store) -> int:
+        """
+        Rebuild user columns from an EntryVectorStore (e.g. at startup).
+
+        Returns:
+            Number of entries recorded
+        """
+        if store.labels and list(store.labels) != self.labels:
+            raise ValueError("Entry store labels do not match the rollup labels")
+        count = 0
+        probabilities = store.probabilities
+        for row, record in enumerate(store.records):
+            if not record.get('user_id'):
+                continue
+            self.record(record['user_id'], probabilities[row], timestamp=record.get('timestamp'))
+            count += 1
+        return count
+
+    def entry_count(self, user_id: str) -> int:
+        with self._lock:
+            columns = self._users.get(user_id)
+            return columns.size if columns else 0
+
+    def _snapshot(self, user_id: str):
+        """Views of the user's filled rows (appends never write into them)."""
+        with self._lock:
+            columns = self._users.get(user_id)
+            if columns is None or columns.size == 0:
+                return None, None
+            return columns.timestamps[:columns.size], columns.probabilities[:columns.size]
+
+    def _extremes(self, timestamps: np.ndarray, probabilities: np.ndarray, index: np.ndarray, kind: str, limit: int):
+        """Strongest positive (highs) or negative (lows) entries in the range."""
+        if index.size == 0 or limit <= 0:
+            return []
+        subset = probabilities[:, index]
+        strongest = subset.argmax(axis=1)
+        intensity = subset[np.arange(len(subset)), strongest]
+
+        candidates = np.flatnonzero(intensity > self.significance)
+        order = candidates[np.argsort(-intensity[candidates], kind='stable')][:limit]
+        return [
+            {
+                'type': kind,
+                'emotion': self.labels[index[strongest[i]]],
+                'intensity': round(float(intensity[i]), 3),
+                'timestamp': float(timestamps[i])
+            }
+            for i in order
+        ]
+
+    def rollup(
+        self,
+        user_id: str,
+        window: str = 'week',
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        periods: Optional[int] = None,
+        utc_offset_minutes: int = 0,
+        top_k: int = 3,
+        extremes: int = 5
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Aggregate a user's entries into calendar buckets.
+
+        Args:
+            user_id: User identifier
+            window: 'day', 'week' or 'month'
+            since: Only include entries at or after this epoch time
+            until: Only include entries before this epoch time
+            periods: Keep only the most recent N buckets
+            utc_offset_minutes: User's UTC offset used for calendar boundaries
+            top_k: Number of top emotions reported per bucket
+            extremes: Number of highs and lows reported for the range
+
+        Returns:
+            Rollup dictionary, or None if nothing has been recorded for the user
+        """
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window '{window}' (expected one of {', '.join(WINDOWS)})")
+        if periods is not None and periods < 1:
+            raise ValueError(f"periods must be at least 1, got {periods}")
+
+        timestamps, probabilities = self._snapshot(user_id)
+        if timestamps is None:
+            return None
+
+        mask = np.ones(len(timestamps), dtype=bool)
+        if since is not None:
+            mask &= timestamps >= since
+        if until is not None:
+            mask &= timestamps < until
+        timestamps, probabilities = timestamps[mask], probabilities[mask]
+
+        keys = bucket_keys(timestamps, window, utc_offset_minutes)
+        if periods is not None and len(keys):
+            unique_keys = np.unique(keys)
+            keep = keys >= unique_keys[-periods:][0]
+            timestamps, probabilities, keys = timestamps[keep], probabilities[keep], keys[keep]
+
+        result = {
+            'window': window,
+            'utc_offset_minutes': utc_offset_minutes,
+            'total_entries': int(len(timestamps)),
+            'buckets': [],
+            'emotional_highs': [],
+            'emotional_lows': [],
+            'volatility_score': 0
+        }
+        if len(timestamps) == 0:
+            return result
+
+        # Sort by bucket so every per-bucket reduction is a single reduceat
+        order = np.argsort(keys, kind='stable')
+        keys, timestamps, probabilities = keys[order], timestamps[order], probabilities[order]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        counts = np.diff(np.append(starts, len(keys)))
+
+        means = np.add.reduceat(probabilities, starts, axis=0) / counts[:, None]
+        peaks = np.maximum.reduceat(probabilities, starts, axis=0)
+        present = probabilities >= self.significance
+        histograms = np.add.reduceat(present.astype(np.int32), starts, axis=0)
+
+        net = probabilities[:, self._positive].sum(axis=1) - probabilities[:, self._negative].sum(axis=1)
+        bucket_valence = np.add.reduceat(net, starts) / counts
+        top = np.argsort(-means, axis=1, kind='stable')[:, :top_k]
+
+        for b, start in enumerate(starts):
+            histogram = histograms[b]
+            nonzero = np.flatnonzero(histogram)
+            result['buckets'].append({
+                'start': bucket_start(keys[start], window),
+                'entries': int(counts[b]),
+                'dominant_emotion': self.labels[top[b, 0]],
+                'top_emotions': [
+                    {
+                        'emotion': self.labels[i],
+                        'mean': round(float(means[b, i]), 3),
+                        'peak': round(float(peaks[b, i]), 3)
+                    }
+                    for i in top[b]
+                ],
+                'emotion_histogram': {self.labels[i]: int(histogram[i]) for i in nonzero},
+                'valence': round(float(bucket_valence[b]), 3)
+            })
+
+        result['emotional_highs'] = self._extremes(timestamps, probabilities, self._positive_index, 'high', extremes)
+        result['emotional_lows'] = self._extremes(timestamps, probabilities, self._negative_index, 'low', extremes)
+        # Same scale as the dashboard's volatility (std of net score, as a percentage)
+        result['volatility_score'] = int(round(float(net.std()) * 100))
+        return result
+
+    def reset(self, user_id: str):
+        with self._lock:
+            self._users.pop(user_id, None)
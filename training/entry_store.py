@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Persistent Entry Vector Store for SomaJournal
+
+Keeps each analyzed entry's raw sigmoid probability vector and pooled [CLS]
+embedding on disk, so changed decision rules (thresholds, adaptive
+parameters, per-class thresholds) can be re-applied to every stored entry
+without running BERT again (see scripts/relabel_entries.py).
+
+Layout of a store directory:
+    meta.json           Dimensions, labels and capacity
+    probabilities.f16   float16 memmap, capacity × num_labels
+    embeddings.f16      float16 memmap, capacity × embedding_dim
+    features.f32        float32 memmap, capacity × len(FEATURES)
+    index.jsonl         Append-only ID index: one line per write
+                        {"id", "row", "user_id", "timestamp", "model_version",
+                         "embedding_space"}
+
+Re-analyzing an existing entry ID overwrites its row; the latest index line
+for an ID wins when the index is replayed on open.
+
+Several processes (API workers) can share one store directory: writes take
+an exclusive lock on store.lock and first catch up on index lines and
+capacity changes written by the other processes, so each new entry gets a
+row no other process has used.
+"""
+
+import os
+import json
+import fcntl
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+# Text characteristics needed to re-run determine_adaptive_parameters
+FEATURES = ('word_count', 'complexity_score', 'emotional_density')
+
+
+class EntryVectorStore:
+    """
+    Thread-safe, memory-mapped store of per-entry model outputs.
+    """
+
+    def __init__(self, directory: str, labels: Optional[List[str]] = None, initial_capacity: int = 1024):
+        """
+        Open (or create) a store.
+
+        Dimensions are fixed by the first entry written to a new store.
+
+        Args:
+            directory: Directory holding the store files
+            labels: Emotion label for each probability column (new stores only)
+            initial_capacity: Rows allocated when the store is created
+        """
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        self._lock = threading.Lock()
+
+        self.meta: Dict[str, Any] = {}
+        self.ids: List[str] = []
+        self.records: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        # Bytes of index.jsonl already replayed into ids/records
+        self._index_offset = 0
+        self._probabilities: Optional[np.memmap] = None
+        self._embeddings: Optional[np.memmap] = None
+        self._features: Optional[np.memmap] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.meta = {'labels': labels, 'features': list(FEATURES)}
+        with self._file_lock(fcntl.LOCK_SH):
+            self._sync()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _file_lock(self, mode: int = fcntl.LOCK_EX):
+        """Lock the store against writers in other processes."""
+        with open(self._path('store.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """Catch up on capacity changes and index lines written by other processes."""
+        meta_path = self._path('meta.json')
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if self._probabilities is None or meta.get('capacity') != self.meta.get('capacity'):
+            self.flush()
+            self._probabilities = self._embeddings = self._features = None
+            self.meta = meta
+            self._open_arrays()
+        self._replay_index()
+
+    def _write_meta(self):
+        tmp_path = self._path('meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._path('meta.json'))
+
+    def _array_specs(self):
+        return [
+            ('probabilities.f16', np.float16, self.meta['num_labels']),
+            ('embeddings.f16', np.float16, self.meta['embedding_dim']),
+            ('features.f32', np.float32, len(FEATURES))
+        ]
+
+    def _open_arrays(self):
+        capacity = self.meta['capacity']
+        arrays = []
+        for name, dtype, width in self._array_specs():
+            path = self._path(name)
+            size = capacity * width * np.dtype(dtype).itemsize
+            # Grow (or create) the backing file to the full capacity
+            with open(path, 'ab') as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            arrays.append(np.memmap(path, dtype=dtype, mode='r+', shape=(capacity, width)))
+        self._probabilities, self._embeddings, self._features = arrays
+
+    def _replay_index(self):
+        index_path = self._path('index.jsonl')
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'r') as f:
+            f.seek(self._index_offset)
+            while True:
+                line = f.readline()
+                if not line.endswith('\n'):
+                    # End of file, or a torn final line from a crash; the row it described is unused
+                    break
+                self._index_offset = f.tell()
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash; the row it described is unused
+                    continue
+                row = record['row']
+                if row == len(self.ids):
+                    self.ids.append(record['id'])
+                    self.records.append(record)
+                elif row < len(self.ids):
+                    self.records[row] = record
+                self._rows[record['id']] = row
+
+    def _ensure_capacity(self, rows: int):
+        capacity = self.meta['capacity']
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        self.flush()
+        self._probabilities = self._embeddings = self._features = None
+        self.meta['capacity'] = capacity
+        self._open_arrays()
+        self._write_meta()
+
+    def put(
+        self,
+        entry_id: str,
+        probabilities,
+        embedding,
+        features: Optional[Dict[str, float]] = None,
+        user_id: Optional[str] = None,
+        model_version: Optional[str] = None,
+        timestamp: Optional[float] = None,
+        embedding_space: Optional[str] = None
+    ) -> int:
+        """
+        Persist one entry's model outputs.
+
+        Args:
+            entry_id: Entry identifier (re-using an ID overwrites its row, if
+                it belongs to the same user)
+            probabilities: Sigmoid probability vector
+            embedding: Pooled [CLS] embedding from the same forward pass
+            features: Text characteristics (see FEATURES)
+            user_id: Owner of the entry
+            model_version: Version of the model that produced the outputs
+            timestamp: Entry time in epoch seconds (defaults to now)
+            embedding_space: Where the embedding came from if not the model's
+                final pooler (e.g. an early-exit layer or a routed model)
+
+        Returns:
+            The row the entry is stored in
+
+        Raises:
+            PermissionError: The ID is already stored for a different user
+        """
+        probabilities = np.asarray(probabilities, dtype=np.float16).reshape(-1)
+        embedding = np.asarray(embedding, dtype=np.float16).reshape(-1)
+        feature_row = np.array([(features or {}).get(name, 0.0) for name in FEATURES], dtype=np.float32)
+
+        with self._lock, self._file_lock():
+            self._sync()
+            if self._probabilities is None:
+                self.meta.update({
+                    'num_labels': int(probabilities.shape[0]),
+                    'embedding_dim': int(embedding.shape[0]),
+                    'capacity': self.initial_capacity
+                })
+                self._open_arrays()
+                self._write_meta()
+
+            if probabilities.shape[0] != self.meta['num_labels'] or embedding.shape[0] != self.meta['embedding_dim']:
+                raise ValueError(
+                    f"Expected {self.meta['num_labels']} probabilities and a {self.meta['embedding_dim']}-dim "
+                    f"embedding, got {probabilities.shape[0]} and {embedding.shape[0]}"
+                )
+
+            row = self._rows.get(entry_id)
+            if row is not None and self.records[row].get('user_id') != user_id:
+                raise PermissionError(f"Entry {entry_id} belongs to another user")
+            if row is None:
+                row = len(self.ids)
+                self._ensure_capacity(row + 1)
+
+            self._probabilities[row] = probabilities
+            self._embeddings[row] = embedding
+            self._features[row] = feature_row
+
+            record = {
+                'id': entry_id,
+                'row': row,
+                'user_id': user_id,
+                'timestamp': timestamp if timestamp is not None else time.time(),
+                'model_version': model_version,
+                'embedding_space': embedding_space
+            }
+            # Rows are written before the index line that makes them visible
+            with open(self._path('index.jsonl'), 'a') as f:
+                if f.tell() > self._index_offset:
+                    # Drop a torn final line left by a crash (replay stopped before
+                    # it) so this record doesn't get appended onto the fragment
+                    f.truncate(self._index_offset)
+                f.write(json.dumps(record) + '\n')
+                self._index_offset = f.tell()
+
+            if row == len(self.ids):
+                self.ids.append(entry_id)
+                self.records.append(record)
+            else:
+                self.records[row] = record
+            self._rows[entry_id] = row
+            return row
+
+    def get(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Read one entry's outputs as float32 arrays."""
+        with self._lock:
+            row = self._rows.get(entry_id)
+            if row is None:
+                # Possibly written by another process since the last sync
+                with self._file_lock(fcntl.LOCK_SH):
+                    self._sync()
+                row = self._rows.get(entry_id)
+            if row is None:
+                return None
+            return {
+                **self.records[row],
+                'probabilities': np.asarray(self._probabilities[row], dtype=np.float32),
+                'embedding': np.asarray(self._embeddings[row], dtype=np.float32),
+                'features': dict(zip(FEATURES, self._features[row].tolist()))
+            }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self._rows
+
+    @property
+    def labels(self) -> Optional[List[str]]:
+        return self.meta.get('labels')
+
+    @property
+    def probabilities(self) -> np.ndarray:
+        """Memory-mapped float16 probabilities of all stored rows."""
+        if self._probabilities is None:
+            return np.empty((0, 0), dtype=np.float16)
+        return self._probabilities[:len(self.ids)]
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Memory-mapped float16 embeddings of all stored rows."""
+        if self._embeddings is None:
+            return np.empty((0, 0), dtype=np.float16)
+        return self._embeddings[:len(self.ids)]
+
+    @property
+    def features(self) -> np.ndarray:
+        """Memory-mapped float32 text characteristics of all stored rows."""
+        if self._features is None:
+            return np.empty((0, len(FEATURES)), dtype=np.float32)
+        return self._features[:len(self.ids)]
+
+    def flush(self):
+        for array in (self._probabilities, self._embeddings, self._features):
+            if array is not None:
+                array.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'directory': self.directory,
+            'entries': len(self.ids),
+            'capacity': self.meta.get('capacity', 0),
+            'num_labels': self.meta.get('num_labels'),
+            'embedding_dim': self.meta.get('embedding_dim')
+        }
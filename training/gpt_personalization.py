@@ -44,6 +44,14 @@ VALID_GOEMOTIONS = {
     'relief', 'remorse', 'sadness', 'surprise', 'neutral'
 }
 
+# How weak BERT signals are handled: 'two_step' (GPT detection, then a
+# personalization call) or 'combined' (one request returning both)
+WEAK_SIGNAL_MODES = ('two_step', 'combined')
+DEFAULT_WEAK_SIGNAL_MODE = os.getenv('SOMA_GPT_WEAK_SIGNAL_MODE', 'two_step')
+
+# Plausible primary emotions whose templates are sent in combined mode
+COMBINED_CANDIDATE_COUNT = int(os.getenv('SOMA_GPT_COMBINED_CANDIDATES', '3'))
+
 # OpenAI import (will be optional)
 try:
     import openai
@@ -54,9 +62,12 @@ except ImportError:
 
 from psychosomatic_mapping import (
     get_psychosomatic_analysis,
+    get_body_map_activation,
     PSYCHOSOMATIC_TEMPLATES,
     WELLNESS_TEMPLATES
 )
+from semantic_cache import SemanticPersonalizationCache
+from prompt_compiler import PromptCompiler
 
 logger = logging.getLogger(__name__)
 
@@ -66,18 +77,44 @@ class GPTPersonalizationEngine:
     with GPT-3.5-Turbo for contextual wellness recommendations.
     """
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        semantic_cache: Optional[SemanticPersonalizationCache] = None,
+        prompt_compiler: Optional[PromptCompiler] = None,
+        weak_signal_mode: Optional[str] = None,
+        client=None
+    ):
         """
         Initialize the personalization engine.
         
         Args:
             api_key: OpenAI API key. If None, will try to get from environment.
+            semantic_cache: Cache for reusing personalizations of near-duplicate entries
+            prompt_compiler: Builds compact, token-budgeted user prompts
+            weak_signal_mode: 'two_step' or 'combined' GPT calls when BERT signals are weak
+            client: Pre-built chat completions client (e.g. MockOpenAIClient); set
+                SOMA_GPT_MOCK=1 to use the local mock without an API key
         """
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
         self.client = None
         self.gpt_available = False
+        self.semantic_cache = semantic_cache if semantic_cache is not None else SemanticPersonalizationCache()
+        self.prompt_compiler = prompt_compiler or PromptCompiler()
+        self.weak_signal_mode = weak_signal_mode or DEFAULT_WEAK_SIGNAL_MODE
+        if self.weak_signal_mode not in WEAK_SIGNAL_MODES:
+            logger.warning(f"⚠️ Unknown weak signal mode '{self.weak_signal_mode}', using two_step")
+            self.weak_signal_mode = 'two_step'
         
-        if OPENAI_AVAILABLE and self.api_key:
+        if client is None and os.getenv('SOMA_GPT_MOCK') == '1':
+            from mock_openai import MockOpenAIClient
+            client = MockOpenAIClient.from_environment()
+            logger.info(f"🧪 Using mock OpenAI client (latency {client.latency}, errors {client.error_rate:.0%})")
+        
+        if client is not None:
+            self.client = client
+            self.gpt_available = True
+        elif OPENAI_AVAILABLE and self.api_key:
             try:
                 self.client = openai.OpenAI(api_key=self.api_key)
                 self.gpt_available = True
@@ -95,7 +132,11 @@ class GPTPersonalizationEngine:
         self, 
         journal_text: str, 
         detected_emotions: List[Dict[str, Any]],
-        user_context: Optional[Dict[str, Any]] = None
+        user_context: Optional[Dict[str, Any]] = None,
+        embedding=None,
+        cache_scope: Optional[str] = None,
+        model_version: Optional[str] = None,
+        candidate_emotions: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
         Create comprehensive hybrid analysis combining evidence-based templates
@@ -105,44 +146,150 @@ class GPTPersonalizationEngine:
             journal_text: The user's journal entry text
             detected_emotions: List of emotions with confidence scores from BERT
             user_context: Optional user context for personalization
+            embedding: Pooled BERT embedding of the entry (enables the semantic cache)
+            cache_scope: Semantic cache scope, normally the user ID (no caching without one)
+            model_version: Version of the model that produced the embedding,
+                including its embedding space when not the final pooler
+            candidate_emotions: BERT's most probable labels, used as plausible
+                primary emotions in combined mode
             
         Returns:
             Dictionary containing hybrid analysis with psychosomatic insights
         """
+        result = None
+        stages = self.iter_hybrid_analysis(
+            journal_text, detected_emotions, user_context,
+            embedding=embedding, cache_scope=cache_scope, model_version=model_version,
+            candidate_emotions=candidate_emotions
+        )
+        for stage, payload in stages:
+            if stage == 'complete':
+                result = payload
+        return result
+    
+    def iter_hybrid_analysis(
+        self,
+        journal_text: str,
+        detected_emotions: List[Dict[str, Any]],
+        user_context: Optional[Dict[str, Any]] = None,
+        embedding=None,
+        cache_scope: Optional[str] = None,
+        model_version: Optional[str] = None,
+        candidate_emotions: Optional[List[str]] = None
+    ):
+        """
+        Produce the hybrid analysis in stages, as soon as each one is ready.
+        
+        With an embedding and a cache scope, a personalization cached for the
+        same user's near-duplicate entry with the same primary emotion is
+        reused instead of calling GPT.
+        In 'combined' weak signal mode, GPT detection and personalization
+        share one request.
+        
+        Yields (stage, payload) tuples in this order:
+            'emotions'               - only when GPT re-detected weak BERT emotions
+            'psychosomatic_analysis' - evidence-based template (no network call)
+            'personalized_insights'  - GPT personalization, or the static fallback
+            'complete'               - the full result returned by create_hybrid_analysis
+        """
+        # Prompt-token accounting for each GPT call made for this request
+        prompt_stats: Dict[str, Any] = {}
+        
         # Check if BERT detected strong emotions
         has_strong_emotions = self._has_strong_emotions(detected_emotions)
         
+        combined_personalization = None
+        weak_signal_mode = None
         if not has_strong_emotions and self.gpt_available:
             logger.info("🔍 BERT detected weak emotions, using GPT for advanced emotion analysis")
             # Use GPT to analyze emotions when BERT doesn't detect strong ones
-            detected_emotions = self._gpt_emotion_analysis(journal_text)
+            weak_signal_mode = self.weak_signal_mode
+            if weak_signal_mode == 'combined':
+                candidates = self._candidate_emotions(candidate_emotions, detected_emotions)
+                detected_emotions, combined_personalization = self._gpt_combined_analysis(
+                    journal_text, candidates, user_context, prompt_stats
+                )
+            else:
+                detected_emotions = self._gpt_emotion_analysis(journal_text, prompt_stats)
+            yield 'emotions', {'emotions': detected_emotions, 'source': 'gpt'}
         
         primary_emotion = self._get_primary_emotion(detected_emotions)
         
         # Step 1: Get evidence-based templates
         base_analysis = get_psychosomatic_analysis(primary_emotion)
+        template_result = self._combine_analyses(base_analysis, None, journal_text, detected_emotions)
+        yield 'psychosomatic_analysis', {
+            key: template_result[key]
+            for key in ('primary_emotion', 'evidence_based', 'research_basis',
+                        'psychosomatic_analysis', 'wellness_recommendations',
+                        'body_map_activation')
+        }
         
-        # Step 2: Attempt GPT personalization if available
-        personalized_analysis = None
+        # Step 2: Attempt GPT personalization if available (a combined-mode
+        # response already carries it; otherwise reuse a near-duplicate
+        # entry's personalization when there is one)
+        personalized_analysis = combined_personalization
+        semantic_cache_info = None
         if self.gpt_available:
-            try:
-                personalized_analysis = self._personalize_with_gpt(
-                    journal_text, 
-                    primary_emotion, 
-                    base_analysis,
-                    user_context,
-                    detected_emotions
+            # Anonymous requests are never cached: without a user scope a
+            # personalization could be served to a different person
+            cache_key = None
+            if embedding is not None and cache_scope and self.semantic_cache is not None:
+                cache_key = self.semantic_cache.bucket_key(
+                    primary_emotion, cache_scope, model_version, user_context
                 )
-            except Exception as e:
-                logger.warning(f"⚠️ GPT personalization failed: {e}")
+            
+            if combined_personalization is not None:
+                if cache_key is not None:
+                    self.semantic_cache.store(cache_key, embedding, combined_personalization)
+            elif cache_key is not None:
+                cached = self.semantic_cache.lookup(cache_key, embedding)
+                if cached:
+                    personalized_analysis, similarity = cached
+                    semantic_cache_info = {'hit': True, 'similarity': round(similarity, 4)}
+                    logger.info(f"♻️ Reusing personalization of a similar entry (similarity {similarity:.3f})")
+                else:
+                    semantic_cache_info = {'hit': False}
+            
+            if personalized_analysis is None:
+                try:
+                    personalized_analysis = self._personalize_with_gpt(
+                        journal_text, 
+                        primary_emotion, 
+                        base_analysis,
+                        user_context,
+                        detected_emotions,
+                        prompt_stats
+                    )
+                except Exception as e:
+                    logger.warning(f"⚠️ GPT personalization failed: {e}")
+                
+                if personalized_analysis and cache_key is not None:
+                    self.semantic_cache.store(cache_key, embedding, personalized_analysis)
         
         # Step 3: Combine results
-        return self._combine_analyses(
-            base_analysis, 
-            personalized_analysis,
-            journal_text,
-            detected_emotions
-        )
+        if personalized_analysis:
+            result = self._combine_analyses(
+                base_analysis, 
+                personalized_analysis,
+                journal_text,
+                detected_emotions
+            )
+        else:
+            result = template_result
+        
+        if semantic_cache_info is not None:
+            result['performance']['semantic_cache'] = semantic_cache_info
+        if prompt_stats:
+            result['performance']['prompt_tokens'] = prompt_stats
+        if weak_signal_mode:
+            result['performance']['weak_signal_mode'] = weak_signal_mode
+        
+        yield 'personalized_insights', {
+            'personalized_insights': result['personalized_insights'],
+            'personalization_level': result['personalization_level']
+        }
+        yield 'complete', result
     
     def _has_strong_emotions(self, detected_emotions: List[Dict[str, Any]], threshold: float = 0.5) -> bool:
         """
@@ -169,13 +316,18 @@ class GPTPersonalizationEngine:
         primary = max(detected_emotions, key=lambda x: x.get('confidence', 0))
         return primary.get('emotion', 'neutral')
     
-    def _gpt_emotion_analysis(self, journal_text: str) -> List[Dict[str, Any]]:
+    def _gpt_emotion_analysis(
+        self,
+        journal_text: str,
+        prompt_stats: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Use GPT to analyze emotions when BERT detection is weak.
         Applies the same adaptive strategy as BERT based on text length.
         
         Args:
             journal_text: The user's journal entry text
+            prompt_stats: Optional dict that receives the prompt-token accounting
             
         Returns:
             List of detected emotions with confidence scores
@@ -184,33 +336,15 @@ class GPTPersonalizationEngine:
             logger.warning("⚠️ GPT client not available for emotion analysis")
             return [{"emotion": "neutral", "confidence": 0.5}]
         
-        # Calculate text characteristics for adaptive approach
-        word_count = len(journal_text.split())
-        
-        # Determine emotion count based on text length (same as BERT adaptive strategy)
-        if word_count < 10:
-            max_emotions = 1
-            text_type = "quick_note"
-            strategy = "Focus on primary emotion only"
-        elif word_count < 50:
-            max_emotions = 3
-            text_type = "short_entry"
-            strategy = "Show 2-3 emotions"
-        elif word_count < 100:
-            max_emotions = 4
-            text_type = "medium_entry"
-            strategy = "Comprehensive analysis"
-        else:
-            max_emotions = 5
-            text_type = "detailed_journal"
-            strategy = "Full emotional landscape"
+        max_emotions, text_type, strategy = self._detection_strategy(journal_text)
         
         try:
-            # Create specialized emotion detection prompt
+            # Create specialized emotion detection prompt (compact, within budget)
             system_prompt = self._create_emotion_detection_system_prompt()
-            user_prompt = self._create_emotion_detection_user_prompt(
-                journal_text, max_emotions, text_type, strategy
+            compiled = self.prompt_compiler.detection_prompt(
+                system_prompt, journal_text, max_emotions, text_type, strategy
             )
+            user_prompt = compiled['user_prompt']
             
             response = self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
@@ -222,45 +356,141 @@ class GPTPersonalizationEngine:
                 max_tokens=300,
                 response_format={"type": "json_object"}
             )
+            self._record_prompt_tokens(prompt_stats, 'detection', compiled, response)
             
             content = response.choices[0].message.content
             result = json.loads(content)
             
-            # Validate and format the response
-            detected_emotions = result.get('emotions', [])
-            if not detected_emotions:
-                return [{"emotion": "neutral", "confidence": 0.5}]
+            return self._format_gpt_emotions(result.get('emotions', []), max_emotions)
             
-            # Validate and format the response - ensure only valid GoEmotions
-            formatted_emotions = []
-            for emotion_data in detected_emotions[:max_emotions]:
-                emotion = emotion_data.get('emotion', 'neutral').lower().strip()
-                confidence = min(max(emotion_data.get('confidence', 0.5), 0.1), 0.95)  # Clamp to reasonable range
-                
-                # Validate against GoEmotions categories
-                if emotion in VALID_GOEMOTIONS:
+        except Exception as e:
+            logger.error(f"❌ GPT emotion analysis failed: {e}")
+            return [{"emotion": "neutral", "confidence": 0.5}]
+    
+    def _detection_strategy(self, journal_text: str) -> Tuple[int, str, str]:
+        """
+        Emotion count, text type and strategy for GPT detection, based on
+        text length (same as the BERT adaptive strategy).
+        """
+        word_count = len(journal_text.split())
+        
+        if word_count < 10:
+            return 1, "quick_note", "Focus on primary emotion only"
+        elif word_count < 50:
+            return 3, "short_entry", "Show 2-3 emotions"
+        elif word_count < 100:
+            return 4, "medium_entry", "Comprehensive analysis"
+        else:
+            return 5, "detailed_journal", "Full emotional landscape"
+    
+    def _format_gpt_emotions(self, detected_emotions: List[Dict[str, Any]], max_emotions: int) -> List[Dict[str, Any]]:
+        """Validate GPT-detected emotions against the GoEmotions labels."""
+        if not detected_emotions:
+            return [{"emotion": "neutral", "confidence": 0.5}]
+        
+        # Validate and format the response - ensure only valid GoEmotions
+        formatted_emotions = []
+        for emotion_data in detected_emotions[:max_emotions]:
+            emotion = emotion_data.get('emotion', 'neutral').lower().strip()
+            confidence = min(max(emotion_data.get('confidence', 0.5), 0.1), 0.95)  # Clamp to reasonable range
+            
+            # Validate against GoEmotions categories
+            if emotion in VALID_GOEMOTIONS:
+                formatted_emotions.append({
+                    "emotion": emotion,
+                    "confidence": confidence
+                })
+            else:
+                # Map common invalid emotions to valid ones
+                mapped_emotion = self._map_to_valid_emotion(emotion)
+                if mapped_emotion:
+                    logger.warning(f"⚠️ Mapped invalid emotion '{emotion}' to '{mapped_emotion}'")
                     formatted_emotions.append({
-                        "emotion": emotion,
-                        "confidence": confidence
+                        "emotion": mapped_emotion,
+                        "confidence": confidence * 0.8  # Reduce confidence for mapped emotions
                     })
                 else:
-                    # Map common invalid emotions to valid ones
-                    mapped_emotion = self._map_to_valid_emotion(emotion)
-                    if mapped_emotion:
-                        logger.warning(f"⚠️ Mapped invalid emotion '{emotion}' to '{mapped_emotion}'")
-                        formatted_emotions.append({
-                            "emotion": mapped_emotion,
-                            "confidence": confidence * 0.8  # Reduce confidence for mapped emotions
-                        })
-                    else:
-                        logger.warning(f"⚠️ Discarded invalid emotion: '{emotion}'")
+                    logger.warning(f"⚠️ Discarded invalid emotion: '{emotion}'")
+        
+        logger.info(f"🎭 GPT detected {len(formatted_emotions)} emotions: {[e['emotion'] for e in formatted_emotions]}")
+        return formatted_emotions
+    
+    def _candidate_emotions(
+        self,
+        candidate_emotions: Optional[List[str]],
+        detected_emotions: List[Dict[str, Any]]
+    ) -> List[str]:
+        """Plausible primary emotions (BERT's top labels) for combined mode."""
+        names = list(candidate_emotions or []) + [e.get('emotion') for e in detected_emotions]
+        candidates = [name for name in dict.fromkeys(names) if name in VALID_GOEMOTIONS]
+        return candidates[:COMBINED_CANDIDATE_COUNT] or ['neutral']
+    
+    def _gpt_combined_analysis(
+        self,
+        journal_text: str,
+        candidates: List[str],
+        user_context: Optional[Dict[str, Any]] = None,
+        prompt_stats: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Detect emotions and personalize the analysis in a single GPT request.
+        
+        The templates of the candidate primary emotions are supplied in compact
+        form. The personalization is only used if it was written from the
+        template of the primary emotion GPT detected; otherwise it is dropped
+        and the regular personalization call runs instead.
+        
+        Returns:
+            Tuple of (validated emotions, personalization or None)
+        """
+        if not self.client:
+            logger.warning("⚠️ GPT client not available for emotion analysis")
+            return [{"emotion": "neutral", "confidence": 0.5}], None
+        
+        max_emotions, text_type, strategy = self._detection_strategy(journal_text)
+        
+        try:
+            system_prompt = self._create_combined_system_prompt()
+            compiled = self.prompt_compiler.combined_prompt(
+                system_prompt, journal_text, candidates, max_emotions, text_type, strategy, user_context
+            )
+            
+            response = self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": compiled['user_prompt']}
+                ],
+                temperature=0.5,  # Between the detection (0.3) and personalization (0.7) settings
+                max_tokens=1000,
+                response_format={"type": "json_object"}
+            )
+            self._record_prompt_tokens(prompt_stats, 'combined', compiled, response)
             
-            logger.info(f"🎭 GPT detected {len(formatted_emotions)} emotions: {[e['emotion'] for e in formatted_emotions]}")
-            return formatted_emotions
+            result = json.loads(response.choices[0].message.content)
             
         except Exception as e:
-            logger.error(f"❌ GPT emotion analysis failed: {e}")
-            return [{"emotion": "neutral", "confidence": 0.5}]
+            logger.error(f"❌ GPT combined analysis failed: {e}")
+            return [{"emotion": "neutral", "confidence": 0.5}], None
+        
+        detected_emotions = self._format_gpt_emotions(result.get('emotions', []), max_emotions)
+        personalization = result.get('personalization')
+        if not isinstance(personalization, dict):
+            return detected_emotions, None
+        
+        template_emotion = str(personalization.pop('template_emotion', '')).lower().strip()
+        primary_emotion = self._get_primary_emotion(detected_emotions)
+        if f"template:{template_emotion}" in compiled['dropped_context']:
+            # The template was cut to fit the budget, so GPT had nothing to personalize
+            return detected_emotions, None
+        if template_emotion != primary_emotion:
+            logger.info(
+                f"🔁 Combined personalization used the '{template_emotion}' template but the "
+                f"primary emotion is '{primary_emotion}'; personalizing separately"
+            )
+            return detected_emotions, None
+        
+        return detected_emotions, personalization
     
     def _map_to_valid_emotion(self, invalid_emotion: str) -> Optional[str]:
         """
@@ -339,72 +569,38 @@ CRITICAL RULES:
 
 Respond with a JSON object containing an "emotions" array with exact emotion names from the list."""
     
-    def _create_emotion_detection_user_prompt(
-        self, 
-        journal_text: str, 
-        max_emotions: int, 
-        text_type: str, 
-        strategy: str
-    ) -> str:
-        """Create user prompt for emotion detection with adaptive strategy."""
-        return f"""Analyze the following journal entry for emotions:
-
-TEXT: "{journal_text}"
-
-ANALYSIS REQUIREMENTS:
-- Text Type: {text_type}
-- Strategy: {strategy}
-- Maximum Emotions: {max_emotions}
-- Focus on the {max_emotions} most prominent emotions
-- Provide confidence scores between 0.1 and 0.95
-
-REMINDER: Use ONLY these 28 GoEmotions categories:
-admiration, amusement, anger, annoyance, approval, caring, confusion, curiosity, desire, disappointment, disapproval, disgust, embarrassment, excitement, fear, gratitude, grief, joy, love, nervousness, optimism, pride, realization, relief, remorse, sadness, surprise, neutral
-
-Consider:
-1. Explicit emotional words and phrases
-2. Contextual emotional meaning  
-3. Implied emotions from situations described
-4. Overall emotional tone
-5. Map common emotions to valid categories (overwhelmed→nervousness, happy→joy, etc.)
-
-Respond with JSON format using ONLY valid emotion names:
-{{
-  "emotions": [
-    {{"emotion": "nervousness", "confidence": 0.75}},
-    {{"emotion": "annoyance", "confidence": 0.65}}
-  ]
-}}
-
-CRITICAL: Double-check each emotion name against the GoEmotions list before responding."""
-    
     def _personalize_with_gpt(
         self,
         journal_text: str,
         primary_emotion: str,
         base_analysis: Dict[str, Any],
         user_context: Optional[Dict[str, Any]] = None,
-        detected_emotions: Optional[List[Dict[str, Any]]] = None
+        detected_emotions: Optional[List[Dict[str, Any]]] = None,
+        prompt_stats: Optional[Dict[str, Any]] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Use GPT-3.5-Turbo to personalize the evidence-based analysis.
         
+        The evidence-based templates for primary_emotion (base_analysis) are
+        sent as the compiler's pre-rendered compact section.
+        
         Returns None if GPT call fails.
         """
         if not self.client:
             return None
         
-        # Construct intelligent prompt
-        system_prompt = self._create_system_prompt()
-        user_prompt = self._create_user_prompt(
-            journal_text, 
-            primary_emotion, 
-            base_analysis,
-            user_context,
-            detected_emotions
-        )
-        
         try:
+            # Construct compact, token-budgeted prompt
+            system_prompt = self._create_system_prompt()
+            compiled = self.prompt_compiler.personalization_prompt(
+                system_prompt,
+                journal_text,
+                primary_emotion,
+                user_context,
+                self._emotion_source(detected_emotions)
+            )
+            user_prompt = compiled['user_prompt']
+            
             response = self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
@@ -415,6 +611,7 @@ CRITICAL: Double-check each emotion name against the GoEmotions list before resp
                 max_tokens=800,
                 response_format={"type": "json_object"}
             )
+            self._record_prompt_tokens(prompt_stats, 'personalization', compiled, response)
             
             content = response.choices[0].message.content
             return json.loads(content)
@@ -447,52 +644,61 @@ Respond with a JSON object containing exactly these keys:
   "encouragement": "Brief, warm encouragement specific to their experience"
 }"""
     
-    def _create_user_prompt(
-        self,
-        journal_text: str,
-        primary_emotion: str,
-        base_analysis: Dict[str, Any],
-        user_context: Optional[Dict[str, Any]] = None,
-        detected_emotions: Optional[List[Dict[str, Any]]] = None
-    ) -> str:
-        """Create the user prompt with context and templates."""
-        psychosomatic_template = base_analysis.get('psychosomatic', {})
-        wellness_template = base_analysis.get('wellness', {})
-        
-        context_info = ""
-        if user_context:
-            context_info = f"\nUser Context: {json.dumps(user_context, indent=2)}"
-        
-        # Add emotion detection method information
-        emotion_source_info = ""
-        if detected_emotions:
-            has_high_confidence = any(e.get('confidence', 0) >= 0.5 for e in detected_emotions)
-            if has_high_confidence:
-                emotion_source_info = "\nEmotion Detection: High-confidence BERT analysis"
-            else:
-                emotion_source_info = "\nEmotion Detection: Advanced GPT analysis (BERT detected weak signals)"
-        
-        return f"""Here is the user's journal entry:
----
-{journal_text}
----
-
-Primary emotion detected: {primary_emotion}{emotion_source_info}
-Research basis: {psychosomatic_template.get('research_basis', 'Evidence-based analysis')}
-
-EVIDENCE-BASED TEMPLATES (DO NOT INVENT NEW INFORMATION):
-
-Psychosomatic Pattern:
-{psychosomatic_template.get('bodily_sensations', 'General bodily awareness')}
+    def _create_combined_system_prompt(self) -> str:
+        """Create the system prompt for single-request detection and personalization."""
+        return """You are an expert emotion analyst and compassionate wellness coach for SomaJournal, an evidence-based wellness app. In one response you detect the emotions in a journal entry and personalize the evidence-based analysis for its primary emotion.
 
-Physiological Description:
-{psychosomatic_template.get('physiological_description', 'Natural body responses')}
+EMOTIONS: Use ONLY these 28 GoEmotions categories:
+admiration, amusement, anger, annoyance, approval, caring, confusion, curiosity, desire, disappointment, disapproval, disgust, embarrassment, excitement, fear, gratitude, grief, joy, love, nervousness, optimism, pride, realization, relief, remorse, sadness, surprise, neutral
+Map other words to the closest category (overwhelmed/stressed/anxious/worried → nervousness, frustrated → annoyance, happy → joy, upset → sadness). Confidence between 0.1 and 0.95; list the primary (highest confidence) emotion first.
 
-Wellness Recommendations:
-{json.dumps(wellness_template, indent=2)}
-{context_info}
+PERSONALIZATION: Use the template of the primary emotion you detected, chosen from the provided templates. If the primary emotion has no template, use the closest provided one and name it in "template_emotion". Base everything on the template (Nummenmaa et al. research); do NOT invent new medical advice. Be warm, supportive and non-judgmental.
 
-TASK: Rewrite these evidence-based templates to be personally relevant to this user's specific journal entry. Keep the scientific foundation but make the language and examples specific to their situation. Focus on how the bodily sensations and wellness recommendations apply to their particular context."""
+Respond with a JSON object containing exactly these keys:
+{
+  "emotions": [{"emotion": "nervousness", "confidence": 0.75}],
+  "personalization": {
+    "template_emotion": "emotion whose template you used",
+    "personalized_psychosomatic": "Personalized description of bodily sensations relevant to their situation",
+    "personalized_wellness": {
+      "immediate_techniques": ["2-3 personalized immediate techniques"],
+      "body_work": ["2-3 personalized body work suggestions"],
+      "mindful_approaches": ["2-3 personalized mindfulness practices"],
+      "contextual_insight": "One personalized insight about their situation"
+    },
+    "encouragement": "Brief, warm encouragement specific to their experience"
+  }
+}"""
+    
+    def _emotion_source(self, detected_emotions: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+        """Describe which detector produced the emotions, for the prompt."""
+        if not detected_emotions:
+            return None
+        if any(e.get('confidence', 0) >= 0.5 for e in detected_emotions):
+            return "high-confidence BERT analysis"
+        return "GPT analysis; BERT detected weak signals"
+    
+    def _record_prompt_tokens(
+        self,
+        prompt_stats: Optional[Dict[str, Any]],
+        call: str,
+        compiled: Dict[str, Any],
+        response
+    ):
+        """Store a call's prompt-token accounting (and the API's own count when reported)."""
+        stats = {
+            'prompt_tokens': compiled['prompt_tokens'],
+            'journal_tokens': compiled['journal_tokens'],
+            'journal_trimmed': compiled['journal_trimmed']
+        }
+        if compiled['dropped_context']:
+            stats['dropped_context'] = compiled['dropped_context']
+        usage = getattr(response, 'usage', None)
+        if usage is not None and getattr(usage, 'prompt_tokens', None) is not None:
+            stats['api_prompt_tokens'] = usage.prompt_tokens
+        logger.info(f"🧮 GPT {call} prompt: {stats}")
+        if prompt_stats is not None:
+            prompt_stats[call] = stats
     
     def _combine_analyses(
         self,
@@ -520,6 +726,7 @@ TASK: Rewrite these evidence-based templates to be personally relevant to this u
                 'traditional_understanding': base_analysis.get('psychosomatic', {}).get('traditional_understanding', '')
             },
             'wellness_recommendations': base_analysis.get('wellness', {}),
+            'body_map_activation': get_body_map_activation(detected_emotions),
             'personalization_level': 'evidence_based_only'
         }
         
@@ -595,15 +802,37 @@ personalization_engine = GPTPersonalizationEngine()
 def create_hybrid_analysis(
     journal_text: str,
     detected_emotions: List[Dict[str, Any]],
-    user_context: Optional[Dict[str, Any]] = None
+    user_context: Optional[Dict[str, Any]] = None,
+    **cache_kwargs
 ) -> Dict[str, Any]:
     """
     Convenience function for creating hybrid analysis.
     
     This is the main entry point for the psychosomatic analysis system.
+    Optional arguments (embedding, cache_scope, model_version, candidate_emotions) are passed through.
     """
     return personalization_engine.create_hybrid_analysis(
         journal_text, 
         detected_emotions, 
-        user_context
-    )
\ No newline at end of file
+        user_context,
+        **cache_kwargs
+    )
+
+
+def iter_hybrid_analysis(
+    journal_text: str,
+    detected_emotions: List[Dict[str, Any]],
+    user_context: Optional[Dict[str, Any]] = None,
+    **cache_kwargs
+):
+    """
+    Convenience function for the staged (streaming) hybrid analysis.
+    
+    Yields (stage, payload) tuples; see GPTPersonalizationEngine.iter_hybrid_analysis.
+    """
+    return personalization_engine.iter_hybrid_analysis(
+        journal_text,
+        detected_emotions,
+        user_context,
+        **cache_kwargs
+    )
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+CPU Thread and Core-Affinity Configuration for Inference Workers
+
+By default every process running EmotionClassifier lets torch size its
+intra-op and inter-op pools to the whole machine. With several API workers on
+one node they oversubscribe the cores and latency becomes unstable. This
+module sets per-worker torch thread counts, optionally pins each worker to a
+disjoint CPU set, and can autotune the thread/worker split by benchmarking.
+
+Configuration (environment variables):
+    SOMA_NUM_WORKERS          Number of inference worker processes on the node
+    SOMA_WORKER_INDEX         This worker's index (0-based)
+    SOMA_TORCH_THREADS        Intra-op threads (default: cores // workers)
+    SOMA_TORCH_INTEROP_THREADS  Inter-op threads (default: 1)
+    SOMA_CPU_AFFINITY         "1" to pin this worker to its own CPU set
+    SOMA_THREAD_AUTOTUNE      "1" to apply the autotuned split at startup
+    SOMA_THREAD_TARGET_P95_MS Latency target used by the autotuner (default: 150)
+    SOMA_THREAD_TUNING_FILE   Saved autotune result (default: data/thread_tuning.json)
+    SOMA_THREAD_AUTOTUNE_TIMEOUT  Seconds a benchmark process may take to start (default: 120)
+
+The autotuner runs once per node: either ahead of time from the command line,
+or at startup by the first worker to take the tuning file's lock, while the
+other workers wait, so their startup does not skew the measurements. Every
+worker then applies the saved split; a SOMA_NUM_WORKERS that disagrees with
+it is an error, since the tuned thread counts assume that many workers.
+Candidates whose benchmark processes crash or hang are skipped; if none
+complete, the saved result has no best split and workers fall back to the
+environment's configuration instead of waiting on the lock forever.
+
+Usage:
+    python inference_threads.py --autotune
+"""
+
+import os
+import sys
+import json
+import fcntl
+import queue
+import time
+import logging
+import multiprocessing as mp
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TUNING_FILE = os.getenv('SOMA_THREAD_TUNING_FILE', 'data/thread_tuning.json')
+# Model load and warmup time allowed on top of the measured duration
+BENCHMARK_STARTUP_TIMEOUT = float(os.getenv('SOMA_THREAD_AUTOTUNE_TIMEOUT', '120'))
+
+BENCHMARK_TEXTS = [
+    "Good day",
+    "I'm happy today!",
+    "I'm really worried about the exam tomorrow. I don't feel prepared.",
+    "Yo I felt super amazing today the weather the vibes it was immaculate had a wonderful day",
+    "Today was bittersweet. I'm excited about my new job opportunity, but I'm also really sad "
+    "about leaving my current team. They've been like family to me. I feel grateful for everything "
+    "I've learned here, yet anxious about starting over somewhere new."
+]
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on (all cores when affinity is unsupported)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cpus(cpus: List[int], num_workers: int, worker_index: int) -> List[int]:
+    """
+    Split the CPU list into num_workers disjoint contiguous chunks.
+
+    Args:
+        cpus: CPUs available on the node
+        num_workers: Number of worker processes sharing the node
+        worker_index: Which chunk to return
+
+    Returns:
+        The CPUs assigned to worker_index
+    """
+    num_workers = max(1, min(num_workers, len(cpus)))
+    chunk, remainder = divmod(len(cpus), num_workers)
+    index = worker_index % num_workers
+    start = index * chunk + min(index, remainder)
+    end = start + chunk + (1 if index < remainder else 0)
+    return cpus[start:end]
+
+
+def configure_torch_threads(intra_op: int, inter_op: Optional[int] = None) -> Dict[str, int]:
+    """
+    Set torch's thread pools for this process.
+
+    Inter-op threads can only be set before torch starts any parallel work,
+    so a failure there is logged and the current value is kept.
+    """
+    import torch
+
+    torch.set_num_threads(max(1, intra_op))
+    if inter_op is not None:
+        try:
+            torch.set_interop_threads(max(1, inter_op))
+        except RuntimeError as e:
+            logger.warning(f"⚠️ Could not set inter-op threads: {e}")
+
+    return {
+        'intra_op_threads': torch.get_num_threads(),
+        'inter_op_threads': torch.get_num_interop_threads()
+    }
+
+
+def pin_to_cpus(cpus: List[int]) -> bool:
+    """Pin the current process to the given CPUs (Linux only)."""
+    if not hasattr(os, 'sched_setaffinity'):
+        logger.warning("⚠️ CPU affinity is not supported on this platform")
+        return False
+    os.sched_setaffinity(0, set(cpus))
+    return True
+
+
+def apply_thread_config(
+    num_workers: Optional[int] = None,
+    worker_index: Optional[int] = None,
+    intra_op: Optional[int] = None,
+    inter_op: Optional[int] = None,
+    pin: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Apply thread and affinity settings, taking unset values from the environment.
+
+    Returns:
+        Dictionary describing the applied configuration
+    """
+    num_workers = num_workers or int(os.getenv('SOMA_NUM_WORKERS', '1'))
+    worker_index = worker_index if worker_index is not None else int(os.getenv('SOMA_WORKER_INDEX', '0'))
+    pin = pin if pin is not None else os.getenv('SOMA_CPU_AFFINITY') == '1'
+
+    cpus = available_cpus()
+    worker_cpus = partition_cpus(cpus, num_workers, worker_index)
+
+    if intra_op is None:
+        env_threads = os.getenv('SOMA_TORCH_THREADS')
+        intra_op = int(env_threads) if env_threads else len(worker_cpus)
+    if inter_op is None:
+        inter_op = int(os.getenv('SOMA_TORCH_INTEROP_THREADS', '1'))
+
+    pinned = pin_to_cpus(worker_cpus) if pin else False
+    threads = configure_torch_threads(intra_op, inter_op)
+
+    config = {
+        'num_workers': num_workers,
+        'worker_index': worker_index,
+        'cpus': worker_cpus if pinned else cpus,
+        'pinned': pinned,
+        **threads
+    }
+    logger.info(f"🧵 Inference threads configured: {config}")
+    return config
+
+
+def _benchmark_worker(model_path: str, cpus: List[int], threads: int, duration: float, results):
+    """Run inference in a loop on a pinned CPU set and report per-request latencies."""
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    pin_to_cpus(cpus)
+    configure_torch_threads(threads, 1)
+
+    from scripts.inference import EmotionClassifier
+    classifier = EmotionClassifier(model_path=model_path)
+
+    # Warm up before timing
+    for text in BENCHMARK_TEXTS:
+        classifier.predict_probabilities(text)
+
+    latencies = []
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        classifier.predict_probabilities(BENCHMARK_TEXTS[i % len(BENCHMARK_TEXTS)])
+        latencies.append((time.perf_counter() - start) * 1000)
+        i += 1
+    results.put(latencies)
+
+
+def _run_candidate(ctx, model_path: str, cpus: List[int], workers: int, threads: int, duration: float) -> Optional[List[float]]:
+    """
+    Latencies from `workers` pinned benchmark processes, or None if any of them failed.
+
+    Results are collected against one deadline, so a process that crashed
+    before reporting (or hangs loading the model) fails the candidate
+    instead of blocking the autotuner.
+    """
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(
+            target=_benchmark_worker,
+            args=(model_path, partition_cpus(cpus, workers, i), threads, duration, results)
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    latencies = []
+    deadline = time.monotonic() + duration + BENCHMARK_STARTUP_TIMEOUT
+    try:
+        for _ in processes:
+            while True:
+                try:
+                    latencies.extend(results.get(timeout=1.0))
+                    break
+                except queue.Empty:
+                    if time.monotonic() > deadline:
+                        logger.warning(f"⚠️ Autotune candidate {workers}×{threads} timed out")
+                        return None
+                    crashed = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+                    if crashed:
+                        logger.warning(f"⚠️ Autotune candidate {workers}×{threads} failed (exit code {crashed[0]})")
+                        return None
+        return latencies
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+def candidate_configs(num_cpus: int) -> List[Tuple[int, int]]:
+    """(workers, threads_per_worker) pairs that fit the node without oversubscription."""
+    candidates = []
+    workers = 1
+    while workers <= num_cpus:
+        candidates.append((workers, num_cpus // workers))
+        workers *= 2
+    return candidates
+
+
+def autotune(
+    model_path: str = 'models/bert_emotion_model',
+    target_p95_ms: Optional[float] = None,
+    duration: float = 5.0,
+    candidates: Optional[List[Tuple[int, int]]] = None
+) -> Dict[str, Any]:
+    """
+    Benchmark worker/thread combinations and pick the best one.
+
+    Each candidate runs `workers` processes, each pinned to a disjoint CPU set
+    with `threads` intra-op threads. The winner is the candidate with the
+    highest throughput whose p95 latency meets the target; if none meet it,
+    the candidate with the lowest p95 is chosen. Candidates that fail are
+    skipped; if every one fails, 'best' is None.
+    """
+    import numpy as np
+
+    target_p95_ms = target_p95_ms or float(os.getenv('SOMA_THREAD_TARGET_P95_MS', '150'))
+    cpus = available_cpus()
+    candidates = candidates or candidate_configs(len(cpus))
+    ctx = mp.get_context('spawn')
+
+    results = []
+    for workers, threads in candidates:
+        latencies = _run_candidate(ctx, model_path, cpus, workers, threads, duration)
+        if not latencies:
+            continue
+
+        latencies = np.array(latencies)
+        result = {
+            'workers': workers,
+            'threads_per_worker': threads,
+            'throughput_rps': round(len(latencies) / duration, 2),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 2)
+        }
+        results.append(result)
+        logger.info(f"🧪 Autotune candidate: {result}")
+
+    meeting_target = [r for r in results if r['p95_ms'] <= target_p95_ms]
+    if meeting_target:
+        best = max(meeting_target, key=lambda r: r['throughput_rps'])
+    elif results:
+        best = min(results, key=lambda r: r['p95_ms'])
+    else:
+        best = None
+        logger.error("❌ Every autotune candidate failed; workers will use the default thread configuration")
+
+    return {
+        'num_cpus': len(cpus),
+        'target_p95_ms': target_p95_ms,
+        'met_target': bool(meeting_target),
+        'best': best,
+        'candidates': results
+    }
+
+
+def save_tuning(tuned: Dict[str, Any], path: str = TUNING_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(tuned, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_or_autotune(model_path: str = 'models/bert_emotion_model', path: str = TUNING_FILE) -> Dict[str, Any]:
+    """
+    The saved autotune result for this node, running the autotuner if there is none.
+
+    Workers starting together serialize on a lock file, so only the first
+    one benchmarks (the others wait instead of competing for the CPUs) and
+    the rest read its result. A result from a node with a different CPU
+    count is re-tuned. A failed run is saved too (with 'best' None), so the
+    waiting workers fall back instead of each repeating it; re-run
+    `python inference_threads.py --autotune` to retry.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    tuned = json.load(f)
+                if tuned.get('num_cpus') == len(available_cpus()):
+                    return tuned
+            tuned = autotune(model_path)
+            save_tuning(tuned, path)
+            return tuned
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def configure_from_environment(model_path: str = 'models/bert_emotion_model') -> Dict[str, Any]:
+    """
+    Server startup hook: apply the autotuned split if requested, else the environment's.
+
+    Raises:
+        RuntimeError: SOMA_NUM_WORKERS disagrees with the autotuned worker count
+    """
+    if os.getenv('SOMA_THREAD_AUTOTUNE') == '1':
+        tuned = load_or_autotune(model_path)
+        best = tuned['best']
+        if best is None:
+            logger.warning("⚠️ No autotuned split available; using the environment's thread configuration")
+            config = apply_thread_config()
+            config['autotune'] = tuned
+            return config
+        env_workers = os.getenv('SOMA_NUM_WORKERS')
+        if env_workers and int(env_workers) != best['workers']:
+            raise RuntimeError(
+                f"SOMA_NUM_WORKERS={env_workers} but the autotuned split is {best['workers']} workers × "
+                f"{best['threads_per_worker']} threads; start {best['workers']} workers or unset SOMA_THREAD_AUTOTUNE"
+            )
+        config = apply_thread_config(num_workers=best['workers'], intra_op=best['threads_per_worker'])
+        config['autotune'] = tuned
+        logger.info(
+            f"🎯 Applied autotuned split: {best['workers']} workers × {best['threads_per_worker']} threads "
+            f"({best['throughput_rps']} req/s, p95 {best['p95_ms']}ms)"
+        )
+        return config
+    return apply_thread_config()
+
+
+def main():
+    """Run the autotuner from the command line and print the results."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inference thread/worker autotuning")
+    parser.add_argument('--autotune', action='store_true', help='Benchmark thread/worker combinations')
+    parser.add_argument('--model_path', type=str, default='models/bert_emotion_model')
+    parser.add_argument('--target_p95_ms', type=float, default=None)
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per candidate')
+    parser.add_argument('--output', type=str, default=TUNING_FILE, help='Where workers read the result from')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.autotune:
+        tuned = autotune(args.model_path, args.target_p95_ms, args.duration)
+        save_tuning(tuned, args.output)
+        print(json.dumps(tuned, indent=2))
+        if tuned['best'] is None:
+            print(f"❌ No candidate completed; see the log above (result saved to {args.output})")
+            return
+        print(f"💾 Saved to {args.output}; start {tuned['best']['workers']} workers with SOMA_THREAD_AUTOTUNE=1")
+    else:
+        print(json.dumps(apply_thread_config(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-Compatible Stand-in for Offline Load Testing
+
+Implements the `chat.completions` contract used by GPTPersonalizationEngine
+without network calls or API spend, with configurable latency, error rate and
+deterministic canned responses for the three request schemas:
+- Emotion detection       -> {"emotions": [...]}
+- Personalization         -> {"personalized_psychosomatic", "personalized_wellness", "encouragement"}
+- Combined single request -> {"emotions": [...], "personalization": {...}}
+
+Two ways to use it:
+1. Injectable client:
+       engine = GPTPersonalizationEngine(client=MockOpenAIClient(latency='lognormal:400,0.5'))
+   or set SOMA_GPT_MOCK=1 to have the server's global engine use one.
+2. HTTP server speaking POST /v1/chat/completions, for the real openai client:
+       python mock_openai.py --port 8089 --latency lognormal:400,0.5 --error_rate 0.02
+       OPENAI_BASE_URL=http://localhost:8089/v1 OPENAI_API_KEY=mock python api_server.py
+
+Latency specs (milliseconds): fixed:300, uniform:100,600, normal:300,80,
+lognormal:<median>,<sigma>.
+
+Configuration for SOMA_GPT_MOCK=1 (environment variables):
+    SOMA_GPT_MOCK_LATENCY     Latency spec (default: lognormal:400,0.5)
+    SOMA_GPT_MOCK_ERROR_RATE  Fraction of requests that fail (default: 0)
+    SOMA_GPT_MOCK_SEED        Random seed for latency and errors (default: 0)
+"""
+
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Any, Optional, Tuple
+
+# Keyword -> GoEmotions label used for deterministic canned detection
+EMOTION_KEYWORDS = [
+    ('nervousness', ('worried', 'anxious', 'nervous', 'overwhelmed', 'stressed', 'tense', 'terrified')),
+    ('sadness', ('sad', 'lonely', 'miss', 'gray', 'crying', 'down', 'harder')),
+    ('anger', ('angry', 'furious', 'mad', 'argument', 'annoyed')),
+    ('gratitude', ('grateful', 'thankful', 'thank', 'appreciate')),
+    ('joy', ('happy', 'great', 'amazing', 'wonderful', 'perfect')),
+    ('excitement', ('excited', 'promotion', 'can\'t wait', 'thrilled')),
+    ('love', ('love', 'family', 'partner')),
+    ('fear', ('scared', 'afraid', 'fear', 'chest feels tight')),
+    ('relief', ('relieved', 'finally', 'calm', 'peaceful'))
+]
+
+JOURNAL_PATTERN = re.compile(r'(?:TEXT: "|Journal entry:\n---\n)(.*?)(?:"\n|\n---)', re.DOTALL)
+TEMPLATE_PATTERN = re.compile(r'^\[([a-z]+)\]$', re.MULTILINE)
+
+
+class MockAPIError(Exception):
+    """Simulated API failure (status_code 429 for rate limits, 500 otherwise)."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_latency(spec: str):
+    """
+    Build a latency sampler (seconds) from a spec such as 'lognormal:400,0.5'.
+
+    Returns:
+        Callable taking a random.Random and returning a delay in seconds
+    """
+    kind, _, params = (spec or 'fixed:0').partition(':')
+    values = [float(v) for v in params.split(',') if v.strip()] or [0.0]
+
+    if kind == 'fixed':
+        return lambda rng: values[0] / 1000
+    if kind == 'uniform':
+        low, high = values[0], values[1] if len(values) > 1 else values[0]
+        return lambda rng: rng.uniform(low, high) / 1000
+    if kind == 'normal':
+        mean, std = values[0], values[1] if len(values) > 1 else 0.0
+        return lambda rng: max(0.0, rng.gauss(mean, std)) / 1000
+    if kind == 'lognormal':
+        median, sigma = values[0], values[1] if len(values) > 1 else 0.5
+        return lambda rng: rng.lognormvariate(math.log(max(median, 1e-3)), sigma) / 1000
+    raise ValueError(f"Unknown latency distribution '{kind}'")
+
+
+def detect_schema(messages: List[Dict[str, str]]) -> str:
+    """Which response schema a request expects: 'combined', 'detection' or 'personalization'."""
+    system = messages[0].get('content', '') if messages else ''
+    if 'template_emotion' in system:
+        return 'combined'
+    if '"emotions"' in system or 'GoEmotions' in system:
+        return 'detection'
+    return 'personalization'
+
+
+def canned_emotions(journal_text: str, max_emotions: int = 3) -> List[Dict[str, Any]]:
+    """Deterministic emotions for a text (keyword matches, confidence from a hash)."""
+    lowered = journal_text.lower()
+    digest = int(hashlib.sha1(journal_text.encode('utf-8')).hexdigest()[:8], 16)
+    emotions = []
+    for emotion, keywords in EMOTION_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            confidence = 0.55 + ((digest >> (len(emotions) * 4)) % 35) / 100
+            emotions.append({'emotion': emotion, 'confidence': round(confidence, 2)})
+    if not emotions:
+        emotions = [{'emotion': 'neutral', 'confidence': 0.6}]
+    emotions.sort(key=lambda e: e['confidence'], reverse=True)
+    return emotions[:max_emotions]
+
+
+def canned_personalization(primary_emotion: str) -> Dict[str, Any]:
+    return {
+        'personalized_psychosomatic': f"You may notice the bodily sensations typical of {primary_emotion} as you go through this.",
+        'personalized_wellness': {
+            'immediate_techniques': ['Take three slow breaths with longer exhales', 'Relax your shoulders and jaw'],
+            'body_work': ['Gentle stretching for the areas holding tension', 'A short walk to reset'],
+            'mindful_approaches': ['A two-minute body scan', 'Name the feeling without judging it'],
+            'contextual_insight': f"Noticing {primary_emotion} in your body is a useful first step."
+        },
+        'encouragement': 'Thank you for taking the time to check in with yourself.'
+    }
+
+
+def canned_response(messages: List[Dict[str, str]]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the deterministic response body for a request.
+
+    Returns:
+        Tuple of (schema, response JSON object)
+    """
+    schema = detect_schema(messages)
+    user = messages[-1].get('content', '') if messages else ''
+    match = JOURNAL_PATTERN.search(user)
+    journal_text = match.group(1) if match else user
+
+    if schema == 'personalization':
+        primary = re.search(r'Primary emotion: ([a-z]+)', user)
+        return schema, canned_personalization(primary.group(1) if primary else 'neutral')
+
+    limit = re.search(r'(?:at most|Maximum Emotions:) (\d+)', user)
+    emotions = canned_emotions(journal_text, int(limit.group(1)) if limit else 3)
+    if schema == 'detection':
+        return schema, {'emotions': emotions}
+
+    primary = emotions[0]['emotion']
+    templates = TEMPLATE_PATTERN.findall(user)
+    template_emotion = primary if primary in templates or not templates else templates[0]
+    return schema, {
+        'emotions': emotions,
+        'personalization': {'template_emotion': template_emotion, **canned_personalization(template_emotion)}
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+class MockChatCompletions:
+    """The `client.chat.completions` object of the mock client."""
+
+    def __init__(self, client: 'MockOpenAIClient'):
+        self._client = client
+
+    def create(self, model: str = 'gpt-3.5-turbo', messages: Optional[List[Dict[str, str]]] = None, **kwargs):
+        return self._client._complete(model, messages or [], kwargs)
+
+
+class MockOpenAIClient:
+    """
+    Drop-in replacement for openai.OpenAI covering chat.completions.create.
+    """
+
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0.0, seed: int = 0):
+        """
+        Initialize the mock client.
+
+        Args:
+            latency: Latency spec (see module docstring)
+            error_rate: Fraction of requests that raise MockAPIError
+            seed: Random seed for latency and error sampling
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self._sample_latency = parse_latency(latency)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=MockChatCompletions(self))
+        self.stats = {'requests': 0, 'errors': 0, 'detection': 0, 'personalization': 0, 'combined': 0}
+
+    @classmethod
+    def from_environment(cls) -> 'MockOpenAIClient':
+        return cls(
+            latency=os.getenv('SOMA_GPT_MOCK_LATENCY', 'lognormal:400,0.5'),
+            error_rate=float(os.getenv('SOMA_GPT_MOCK_ERROR_RATE', '0')),
+            seed=int(os.getenv('SOMA_GPT_MOCK_SEED', '0'))
+        )
+
+    def _draw(self) -> Tuple[float, Optional[MockAPIError]]:
+        with self._lock:
+            delay = self._sample_latency(self._rng)
+            error = None
+            if self._rng.random() < self.error_rate:
+                if self._rng.random() < 0.5:
+                    error = MockAPIError('Rate limit reached (mock)', status_code=429)
+                else:
+                    error = MockAPIError('The server had an error (mock)', status_code=500)
+            return delay, error
+
+    def _complete(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any]):
+        delay, error = self._draw()
+        time.sleep(delay)
+
+        schema, body = canned_response(messages)
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats[schema] += 1
+            if error:
+                self.stats['errors'] += 1
+        if error:
+            raise error
+
+        content = json.dumps(body)
+        prompt_tokens = sum(estimate_tokens(m.get('content', '')) + 3 for m in messages) + 3
+        completion_tokens = estimate_tokens(content)
+        return SimpleNamespace(
+            id=f"chatcmpl-mock-{self.stats['requests']}",
+            object='chat.completion',
+            created=int(time.time()),
+            model=model,
+            choices=[SimpleNamespace(
+                index=0,
+                message=SimpleNamespace(role='assistant', content=content),
+                finish_reason='stop'
+            )],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+
+def to_openai_json(response) -> Dict[str, Any]:
+    """Serialize a mock response in the OpenAI chat.completion wire format."""
+    return {
+        'id': response.id,
+        'object': response.object,
+        'created': response.created,
+        'model': response.model,
+        'choices': [
+            {
+                'index': choice.index,
+                'message': {'role': choice.message.role, 'content': choice.message.content},
+                'finish_reason': choice.finish_reason
+            }
+            for choice in response.choices
+        ],
+        'usage': vars(response.usage)
+    }
+
+
+def create_app(client: MockOpenAIClient):
+    """Flask app exposing the mock client as POST /v1/chat/completions."""
+    from flask import Flask, request, jsonify
+
+    app = Flask(__name__)
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        data = request.get_json(silent=True) or {}
+        options = {k: v for k, v in data.items() if k not in ('model', 'messages')}
+        try:
+            response = client.chat.completions.create(
+                model=data.get('model', 'gpt-3.5-turbo'),
+                messages=data.get('messages', []),
+                **options
+            )
+        except MockAPIError as e:
+            return jsonify({'error': {'message': str(e), 'type': 'mock_error', 'code': e.status_code}}), e.status_code
+        return jsonify(to_openai_json(response))
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        return jsonify({'latency': client.latency, 'error_rate': client.error_rate, **client.stats})
+
+    return app
+
+
+def main():
+    """Run the mock server."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat.completions stand-in")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=str, default='lognormal:400,0.5', help='Latency spec in ms')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of failed requests')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    client = MockOpenAIClient(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    print(f"🧪 Mock OpenAI server on http://localhost:{args.port}/v1 (latency {args.latency}, errors {args.error_rate:.0%})")
+    create_app(client).run(host='0.0.0.0', port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Versioned Model Registry for SomaJournal
+
+Holds the emotion classifier that serves live traffic and allows a retrained
+model to be hot-swapped without restarting the API server:
+1. A new model version is loaded in a background thread
+2. It is warmed up and parity-checked against the active version
+3. It is swapped in atomically; in-flight requests finish on the old version
+
+Model outputs (probability vector and pooled embedding) are cached per
+(model_version, text), so outputs produced by an older model are never served
+once a new version is active.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from attribution import top_words
+
+logger = logging.getLogger(__name__)
+
+# Texts used to warm up and parity-check a candidate model before it goes live
+PARITY_TEXTS = [
+    "Good day",
+    "I'm so excited about my new job! I can't wait to start.",
+    "I'm really worried about the exam tomorrow. I don't feel prepared.",
+    "Thank you so much for your help. I really appreciate it!",
+    "I feel sad and lonely since my friend moved away.",
+    "Today was bittersweet. I'm excited about the move, but I'll miss my team."
+]
+
+DEFAULT_CACHE_SIZE = int(os.getenv('SOMA_PROBABILITY_CACHE_SIZE', '2048'))
+
+# Appended to the version in cache keys of full-model attribution results
+ATTRIBUTION_SUFFIX = '+attribution'
+
+
+def compute_model_version(model_path: str) -> str:
+    """
+    Derive a stable version identifier from the model files on disk.
+
+    Args:
+        model_path: Path to the saved model directory
+
+    Returns:
+        Version string such as 'bert_emotion_model-1a2b3c4d'
+    """
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(model_path)):
+        file_path = os.path.join(model_path, name)
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            digest.update(f"{name}:{stat.st_size}:{int(stat.st_mtime)}".encode('utf-8'))
+
+    base_name = os.path.basename(os.path.normpath(model_path))
+    return f"{base_name}-{digest.hexdigest()[:8]}"
+
+
+class ProbabilityCache:
+    """
+    Thread-safe LRU cache of model outputs keyed by model version and text.
+    
+    Values are (probabilities, embedding, attribution, embedding_space) from
+    one forward pass; attribution is None unless word attribution was
+    requested, embedding_space None for the model's final pooler.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, np.ndarray, Optional[Dict], Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_version: str, text: str) -> Tuple[str, str]:
+        """Build the cache key for a text under a given model version."""
+        return (model_version, text.strip())
+
+    def get(self, model_version: str, text: str) -> Optional[Tuple[np.ndarray, np.ndarray, Optional[Dict], Optional[str]]]:
+        key = self.make_key(model_version, text)
+        with self._lock:
+            outputs = self._entries.get(key)
+            if outputs is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return outputs
+
+    def put(
+        self,
+        model_version: str,
+        text: str,
+        probabilities: np.ndarray,
+        embedding: np.ndarray,
+        attribution: Optional[Dict] = None,
+        embedding_space: Optional[str] = None
+    ):
+        key = self.make_key(model_version, text)
+        with self._lock:
+            self._entries[key] = (probabilities, embedding, attribution, embedding_space)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def contains(self, model_version: str, text: str) -> bool:
+        with self._lock:
+            return self.make_key(model_version, text) in self._entries
+
+    def purge_other_versions(self, model_version: str) -> int:
+        """Drop entries produced by any version other than model_version."""
+        keep = (model_version, model_version + ATTRIBUTION_SUFFIX)
+        with self._lock:
+            stale = [key for key in self._entries if key[0] not in keep]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+
+class ModelVersion:
+    """
+    A loaded classifier together with its version and in-flight request count.
+    """
+
+    def __init__(self, version: str, model_path: str, classifier):
+        self.version = version
+        self.model_path = model_path
+        self.classifier = classifier
+        self.loaded_at = time.time()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def infer(self, text: str, cache: Optional[ProbabilityCache] = None) -> Tuple[np.ndarray, np.ndarray, bool, Optional[str]]:
+        """
+        Get the probability vector and pooled embedding for a text, using the cache when possible.
+
+        Returns:
+            Tuple of (probabilities, embedding, cache_hit, embedding_space);
+            embedding_space is None for the model's final pooler (see
+            EmotionClassifier.predict_with_embedding_space)
+        """
+        probabilities, embedding, cache_hit, _, space = self._infer(text, cache)
+        return probabilities, embedding, cache_hit, space
+
+    def _infer(
+        self,
+        text: str,
+        cache: Optional[ProbabilityCache] = None,
+        attribution: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray, bool, Optional[Dict], Optional[str]]:
+        """
+        infer(), optionally also computing word attribution in the same forward pass.
+
+        Attribution always runs the full model, while the regular path may exit
+        early or be routed to another model, so the two are cached under
+        separate keys: an attribution request never replaces (or is served
+        from) the regular entry for the same text.
+        """
+        base = self.classifier.base_classifier
+        attribution = attribution and getattr(base, 'supports_attribution', False)
+        cache_key = self.version + ATTRIBUTION_SUFFIX if attribution else self.version
+        if cache is not None:
+            cached = cache.get(cache_key, text)
+            if cached is not None:
+                return cached[0], cached[1], True, cached[2], cached[3]
+
+        word_scores = None
+        space = None
+        if attribution:
+            # The embedding is the final pooler's
+            probabilities, embedding, word_scores = base.predict_with_attribution(text)
+        else:
+            probabilities, embedding, space = base.predict_with_embedding_space(text)
+        if cache is not None:
+            cache.put(cache_key, text, probabilities, embedding, attribution=word_scores, embedding_space=space)
+        return probabilities, embedding, False, word_scores, space
+
+    def classify_adaptive(
+        self,
+        text: str,
+        debug: bool = False,
+        cache: Optional[ProbabilityCache] = None,
+        attribution: bool = False
+    ) -> Dict:
+        """
+        Run adaptive classification on this version, tagging the result with it.
+
+        With attribution=True the result also carries 'attribution': the top
+        words behind each detected emotion (None when the classifier cannot
+        produce attribution, e.g. behind the shared model server).
+        """
+        probabilities, embedding, cache_hit, word_scores, space = self._infer(text, cache, attribution=attribution)
+        result = self.classifier.classify_adaptive(text, debug=debug, probabilities=probabilities)
+        result['model_version'] = self.version
+        result['cache_hit'] = cache_hit
+        result['probabilities'] = probabilities
+        result['embedding'] = embedding
+        result['embedding_space'] = space
+        if attribution:
+            result['attribution'] = None if word_scores is None else top_words(
+                word_scores,
+                self.classifier.base_classifier.emotion_labels,
+                [emotion['emotion'] for emotion in result['emotions']]
+            )
+        return result
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'version': self.version,
+            'model_path': self.model_path,
+            'loaded_at': self.loaded_at,
+            'in_flight': self.in_flight
+        }
+
+
+class ModelRegistry:
+    """
+    Registry that serves one active model version and hot-swaps new ones.
+    """
+
+    def __init__(
+        self,
+        classifier_factory,
+        cache: Optional[ProbabilityCache] = None,
+        parity_min_agreement: float = 0.5,
+        parity_max_mean_diff: float = 0.25
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            classifier_factory: Callable taking a model path and returning an
+                AdaptiveEmotionClassifier-compatible object
+            cache: Probability cache shared by all versions
+            parity_min_agreement: Minimum fraction of parity texts on which the
+                candidate must agree with the active version's primary emotion
+            parity_max_mean_diff: Maximum mean absolute probability difference
+                between candidate and active version on the parity texts
+        """
+        self.classifier_factory = classifier_factory
+        self.cache = cache if cache is not None else ProbabilityCache()
+        self.parity_min_agreement = parity_min_agreement
+        self.parity_max_mean_diff = parity_max_mean_diff
+
+        self._active: Optional[ModelVersion] = None
+        self._retired: List[ModelVersion] = []
+        self._swap_lock = threading.Lock()
+        self._load_thread: Optional[threading.Thread] = None
+        self._load_lock = threading.Lock()
+        self.last_load_status: Dict[str, Any] = {'state': 'idle'}
+
+    @property
+    def active(self) -> Optional[ModelVersion]:
+        return self._active
+
+    @property
+    def active_version(self) -> Optional[str]:
+        return self._active.version if self._active else None
+
+    @contextmanager
+    def acquire(self):
+        """
+        Pin the active version for the duration of a request.
+
+        A swap during the request does not affect it: the request keeps using
+        the version it acquired until it exits the context. The version is
+        read and entered under the swap lock, so a swap cannot retire it (and
+        prune it as idle) between the two.
+        """
+        with self._swap_lock:
+            model_version = self._active
+            if model_version is None:
+                raise RuntimeError("No model version loaded")
+            model_version._enter()
+        try:
+            yield model_version
+        finally:
+            model_version._exit()
+
+    def load(self, model_path: str, version: Optional[str] = None, force: bool = False) -> ModelVersion:
+        """
+        Load, warm up, parity-check and activate a model version synchronously.
+
+        Args:
+            model_path: Path to the saved model directory
+            version: Explicit version label (derived from the files if None)
+            force: Skip the parity gate (warmup still runs)
+
+        Returns:
+            The newly activated ModelVersion
+        """
+        version = version or compute_model_version(model_path)
+        self.last_load_status = {'state': 'loading', 'version': version, 'model_path': model_path}
+        logger.info(f"📦 Loading model version {version} from {model_path}")
+
+        candidate = ModelVersion(version, model_path, self.classifier_factory(model_path))
+
+        warmup_ms, candidate_probs = self._warmup(candidate)
+        parity = self._check_parity(candidate_probs)
+        self.last_load_status.update({'warmup_ms': warmup_ms, 'parity': parity})
+
+        if not parity['passed'] and not force:
+            self.last_load_status['state'] = 'rejected'
+            raise ValueError(f"Model version {version} failed parity check: {parity}")
+
+        self._activate(candidate)
+        self.last_load_status['state'] = 'active'
+        return candidate
+
+    def load_in_background(self, model_path: str, version: Optional[str] = None, force: bool = False) -> bool:
+        """
+        Start loading a model version in a background thread.
+
+        Returns:
+            False if another load is already in progress, True otherwise
+        """
+        def _run():
+            try:
+                self.load(model_path, version=version, force=force)
+            except Exception as e:
+                logger.error(f"❌ Background model load failed: {e}")
+                if self.last_load_status.get('state') != 'rejected':
+                    self.last_load_status = {'state': 'failed', 'model_path': model_path, 'error': str(e)}
+
+        with self._load_lock:
+            if self._load_thread is not None and self._load_thread.is_alive():
+                return False
+            self._load_thread = threading.Thread(target=_run, name='model-registry-load', daemon=True)
+            self._load_thread.start()
+            return True
+
+    def _warmup(self, candidate: ModelVersion) -> Tuple[float, np.ndarray]:
+        """Run the parity texts through the candidate and validate the outputs."""
+        start = time.perf_counter()
+        probabilities = np.stack([
+            candidate.classifier.base_classifier.predict_probabilities(text)
+            for text in PARITY_TEXTS
+        ])
+        warmup_ms = (time.perf_counter() - start) * 1000
+
+        expected_labels = len(candidate.classifier.base_classifier.emotion_labels)
+        if probabilities.shape != (len(PARITY_TEXTS), expected_labels):
+            raise ValueError(f"Unexpected output shape {probabilities.shape}")
+        if not np.all(np.isfinite(probabilities)) or probabilities.min() < 0 or probabilities.max() > 1:
+            raise ValueError("Model produced invalid probabilities during warmup")
+
+        return round(warmup_ms, 1), probabilities
+
+    def _check_parity(self, candidate_probs: np.ndarray) -> Dict[str, Any]:
+        """Compare candidate outputs with the active version on the parity texts."""
+        active = self._active
+        if active is None:
+            return {'passed': True, 'reason': 'no active version'}
+
+        active_probs = np.stack([
+            active.classifier.base_classifier.predict_probabilities(text)
+            for text in PARITY_TEXTS
+        ])
+        if active_probs.shape != candidate_probs.shape:
+            return {'passed': False, 'reason': 'label count changed'}
+
+        agreement = float(np.mean(active_probs.argmax(axis=1) == candidate_probs.argmax(axis=1)))
+        mean_diff = float(np.mean(np.abs(active_probs - candidate_probs)))
+        passed = agreement >= self.parity_min_agreement and mean_diff <= self.parity_max_mean_diff
+
+        return {
+            'passed': passed,
+            'primary_agreement': round(agreement, 3),
+            'mean_abs_diff': round(mean_diff, 4),
+            'compared_with': active.version
+        }
+
+    def _activate(self, candidate: ModelVersion):
+        """Atomically make candidate the active version."""
+        with self._swap_lock:
+            previous = self._active
+            self._active = candidate
+            if previous is not None:
+                self._retired.append(previous)
+            # Forget retired versions once their last request has finished
+            self._retired = [v for v in self._retired if v.in_flight > 0]
+
+        purged = self.cache.purge_other_versions(candidate.version)
+        logger.info(f"✅ Model version {candidate.version} active (purged {purged} cached vectors)")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'active': self._active.describe() if self._active else None,
+            'draining': [v.describe() for v in self._retired if v.in_flight > 0],
+            'last_load': self.last_load_status,
+            'cache': self.cache.stats()
+        }
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Cost-Aware Model Routing by Text Type
+
+AdaptiveEmotionClassifier decides how to present an entry from its text
+type (quick_note, short_entry, medium_entry, detailed_journal), which is
+known from the word count before inference. This module uses the same
+categorization to pick an inference engine per text type, so quick notes
+can go to a cheaper model while long journals get full coverage.
+
+Engines:
+    bert          The fine-tuned model, truncated to 128 tokens (default)
+    bert_chunked  The same model over overlapping 128-token windows; emotion
+                  probabilities are the max over windows, the embedding the mean
+    early_exit    The same model with exit heads (see early_exit.py)
+    model:<path>  Another BERT-architecture model, e.g. a distilled 6-layer
+                  student (same labels and hidden size, so stored embeddings
+                  keep their shape)
+
+Only bert produces final-pooler embeddings. The other engines tag their
+embeddings with an embedding space ('bert_chunked', 'exit<layer>',
+'model:<path>'; see EmotionClassifier.predict_with_embedding_space) so
+they are never compared with, or cached against, full-BERT embeddings.
+
+Per-engine latency is recorded for every call. For agreement statistics a
+sample of routed texts (SOMA_ROUTE_SHADOW_RATE) is re-run on the full model
+in a background thread and compared with the routed output.
+
+Configuration (environment variables):
+    SOMA_ROUTES             e.g. "quick_note=model:models/bert_emotion_student,detailed_journal=bert_chunked"
+                            (text types not listed use bert; empty disables routing)
+    SOMA_ROUTE_SHADOW_RATE  Share of routed texts re-run on full BERT (default: 0.05)
+"""
+
+import os
+import random
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from scripts.inference import EmotionClassifier
+from scripts.adaptive_classifier import AdaptiveEmotionClassifier
+from tokenization import TokenizedText, TokenizedBatch
+from early_exit import load_early_exit
+
+logger = logging.getLogger(__name__)
+
+ROUTES_SPEC = os.getenv('SOMA_ROUTES', '')
+SHADOW_RATE = float(os.getenv('SOMA_ROUTE_SHADOW_RATE', '0.05'))
+
+TEXT_TYPES = ('quick_note', 'short_entry', 'medium_entry', 'detailed_journal')
+ENGINE_KINDS = ('bert', 'bert_chunked', 'early_exit', 'model')
+
+# Tokens shared by neighbouring windows of a chunked text
+CHUNK_STRIDE = 32
+# Shadow comparisons waiting at most; further samples are skipped
+MAX_PENDING_SHADOWS = 8
+LATENCY_WINDOW = 1000
+
+
+def parse_routes(spec: str) -> Dict[str, str]:
+    """
+    Parse "text_type=engine,..." into a route table.
+
+    Raises:
+        ValueError: Unknown text type or engine
+    """
+    routes = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        text_type, _, engine = item.partition('=')
+        text_type, engine = text_type.strip(), engine.strip()
+        if text_type not in TEXT_TYPES:
+            raise ValueError(f"Unknown text type '{text_type}' in SOMA_ROUTES; choose from {TEXT_TYPES}")
+        if engine.split(':', 1)[0] not in ENGINE_KINDS or (engine.startswith('model') and ':' not in engine):
+            raise ValueError(f"Unknown engine '{engine}' in SOMA_ROUTES; choose from bert, bert_chunked, early_exit, model:<path>")
+        routes[text_type] = engine
+    return routes
+
+
+# Engine outputs: (N × labels probabilities, N × hidden embeddings, N embedding spaces)
+EngineOutput = Tuple[np.ndarray, np.ndarray, List[Optional[str]]]
+
+
+class BertEngine:
+    """The fine-tuned model, one forward pass per (length-sorted) batch."""
+
+    def __init__(self, classifier: EmotionClassifier):
+        self.classifier = classifier
+
+    def predict(self, texts: List[str], batch_size: int = 32) -> EngineOutput:
+        probabilities, embeddings = EmotionClassifier.predict_batch_with_embedding(self.classifier, texts, batch_size)
+        return probabilities, embeddings, [None] * len(texts)
+
+
+class ChunkedBertEngine:
+    """The fine-tuned model over overlapping windows covering the whole text."""
+
+    def __init__(self, classifier: EmotionClassifier, stride: int = CHUNK_STRIDE):
+        self.classifier = classifier
+        self.stride = stride
+
+    def _windows(self, text: str) -> List[TokenizedText]:
+        tokenizer = self.classifier.tokenizer
+        ids = tokenizer(text, add_special_tokens=False)['input_ids']
+        width = self.classifier.tokenization.max_length - 2
+        starts = list(range(0, max(len(ids) - width, 0) + 1, width - self.stride))
+        if starts[-1] + width < len(ids):
+            starts.append(len(ids) - width)
+
+        windows = []
+        for start in starts:
+            input_ids = [tokenizer.cls_token_id] + ids[start:start + width] + [tokenizer.sep_token_id]
+            windows.append(TokenizedText(text, input_ids, [(0, 0)] * len(input_ids), [None] * len(input_ids)))
+        return windows
+
+    def predict(self, texts: List[str], batch_size: int = 32) -> EngineOutput:
+        windows, owners = [], []
+        for index, text in enumerate(texts):
+            for window in self._windows(text):
+                windows.append(window)
+                owners.append(index)
+
+        probabilities, embeddings = [], []
+        for start in range(0, len(windows), batch_size):
+            batch = TokenizedBatch(windows[start:start + batch_size], self.classifier.tokenization.pad_token_id)
+            window_probabilities, window_embeddings = self.classifier.predict_encoded(batch)
+            probabilities.append(window_probabilities)
+            embeddings.append(window_embeddings)
+        probabilities = np.concatenate(probabilities)
+        embeddings = np.concatenate(embeddings)
+
+        owners = np.array(owners)
+        counts = np.bincount(owners, minlength=len(texts))
+        return (
+            np.stack([probabilities[owners == i].max(axis=0) for i in range(len(texts))]),
+            np.stack([embeddings[owners == i].mean(axis=0) for i in range(len(texts))]),
+            # A single window is exactly the bert embedding; a window mean is not
+            [None if count == 1 else 'bert_chunked' for count in counts]
+        )
+
+
+class EarlyExitEngine:
+    """The fine-tuned model stopping at the first confident exit head."""
+
+    def __init__(self, classifier: EmotionClassifier, exit_model):
+        self.classifier = classifier
+        self.exit_model = exit_model
+        self.layers = deque(maxlen=LATENCY_WINDOW)
+
+    def predict(self, texts: List[str], batch_size: int = 32) -> EngineOutput:
+        probabilities, embeddings, spaces = [], [], []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.classifier.tokenization.encode_batch(texts[start:start + batch_size]).to_tensors(self.classifier.device)
+            batch_probabilities, pooled, layers = self.exit_model.exit_forward(inputs['input_ids'], inputs['attention_mask'])
+            probabilities.append(batch_probabilities.cpu().numpy())
+            embeddings.append(pooled.cpu().numpy())
+            layers = layers.cpu().tolist()
+            self.layers.extend(layers)
+            spaces.extend(None if layer >= self.exit_model.num_layers else f'exit{layer}' for layer in layers)
+        return np.concatenate(probabilities), np.concatenate(embeddings), spaces
+
+    def stats(self) -> Dict[str, Any]:
+        layers = list(self.layers)
+        return {'avg_layers': round(float(np.mean(layers)), 2) if layers else None}
+
+
+class ModelEngine:
+    """A separately loaded model, e.g. a distilled student."""
+
+    def __init__(self, classifier: EmotionClassifier, model_path: str):
+        self.model = EmotionClassifier(model_path=model_path, threshold=classifier.threshold)
+        # Same shape as the full model's embeddings, but not the same vector space
+        self.space = f'model:{model_path}'
+        if self.model.emotion_labels != classifier.emotion_labels:
+            raise ValueError(f"{model_path} predicts different emotion labels than {classifier.model_path}")
+        if self.model.model.config.hidden_size != classifier.model.config.hidden_size:
+            raise ValueError(
+                f"{model_path} has hidden size {self.model.model.config.hidden_size}, expected "
+                f"{classifier.model.config.hidden_size} (stored embeddings must keep their shape)"
+            )
+
+    def predict(self, texts: List[str], batch_size: int = 32) -> EngineOutput:
+        probabilities, embeddings = self.model.predict_batch_with_embedding(texts, batch_size)
+        return probabilities, embeddings, [self.space] * len(texts)
+
+
+class RouteStats:
+    """Latency and agreement-with-full-BERT statistics of one engine."""
+
+    def __init__(self):
+        self.texts = 0
+        self.calls = 0
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self.shadowed = 0
+        self.top_emotion_matches = 0
+        self.label_agreement_sum = 0.0
+        self.abs_diff_sum = 0.0
+
+    def record_call(self, count: int, elapsed_ms: float):
+        self.calls += 1
+        self.texts += count
+        self.latencies_ms.append(elapsed_ms / count)
+
+    def record_shadow(self, routed: np.ndarray, full: np.ndarray, threshold: float):
+        routed_labels = set(np.flatnonzero(routed >= threshold))
+        full_labels = set(np.flatnonzero(full >= threshold))
+        union = routed_labels | full_labels
+        self.shadowed += 1
+        self.top_emotion_matches += int(routed.argmax() == full.argmax())
+        self.label_agreement_sum += len(routed_labels & full_labels) / len(union) if union else 1.0
+        self.abs_diff_sum += float(np.abs(routed - full).mean())
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = list(self.latencies_ms)
+        stats = {
+            'texts': self.texts,
+            'calls': self.calls,
+            'mean_ms_per_text': round(float(np.mean(latencies)), 2) if latencies else None,
+            'p50_ms_per_text': round(float(np.percentile(latencies, 50)), 2) if latencies else None,
+            'p95_ms_per_text': round(float(np.percentile(latencies, 95)), 2) if latencies else None,
+            'shadowed': self.shadowed
+        }
+        if self.shadowed:
+            stats['top_emotion_agreement'] = round(self.top_emotion_matches / self.shadowed, 3)
+            stats['label_agreement'] = round(self.label_agreement_sum / self.shadowed, 3)
+            stats['mean_abs_probability_diff'] = round(self.abs_diff_sum / self.shadowed, 4)
+        return stats
+
+
+class RoutedEmotionClassifier(EmotionClassifier):
+    """
+    EmotionClassifier that sends each text to the engine configured for its text type.
+
+    Word attribution always runs on the full model.
+    """
+
+    def __init__(
+        self,
+        model_path: str = 'models/bert_emotion_model',
+        threshold: float = 0.3,
+        routes: Optional[Dict[str, str]] = None,
+        shadow_rate: float = SHADOW_RATE
+    ):
+        """
+        Initialize the routed classifier.
+
+        Args:
+            model_path: Path to the trained (full) model
+            threshold: Confidence threshold for emotion detection
+            routes: {text_type: engine}; default parsed from SOMA_ROUTES
+            shadow_rate: Share of routed texts compared against full BERT
+        """
+        self.routes = parse_routes(ROUTES_SPEC) if routes is None else dict(routes)
+        self.shadow_rate = shadow_rate
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._shadow_pending = 0
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='route-shadow')
+        super().__init__(model_path=model_path, threshold=threshold)
+        self._load_engines()
+
+    def _load_engines(self):
+        """Build every engine the routes refer to (after the full model and labels)."""
+        self.engines: Dict[str, Any] = {'bert': BertEngine(self)}
+        for text_type, engine in list(self.routes.items()):
+            if engine not in self.engines:
+                built = self._build_engine(engine)
+                if built is None:
+                    self.routes[text_type] = engine = 'bert'
+                else:
+                    self.engines[engine] = built
+        self.route_stats = {engine: RouteStats() for engine in self.engines}
+        routes = ', '.join(f"{text_type}→{self.routes.get(text_type, 'bert')}" for text_type in TEXT_TYPES)
+        print(f"🔀 Routing: {routes}")
+
+    def _build_engine(self, engine: str):
+        if engine == 'bert_chunked':
+            return ChunkedBertEngine(self)
+        if engine == 'early_exit':
+            exit_model = load_early_exit(self.model, self.model_path)
+            if exit_model is None:
+                print(f"⚠️ No exit heads in {self.model_path}; routing early_exit texts to bert")
+                return None
+            return EarlyExitEngine(self, exit_model)
+        return ModelEngine(self, engine.split(':', 1)[1])
+
+    def route_for(self, text: str) -> str:
+        return self.routes.get(AdaptiveEmotionClassifier.categorize_text(text), 'bert')
+
+    def predict_with_embedding(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        return self.predict_with_embedding_space(text)[:2]
+
+    def predict_with_embedding_space(self, text: str) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
+        probabilities, embeddings, spaces = self.predict_batch_with_spaces([text])
+        return probabilities[0], embeddings[0], spaces[0]
+
+    def predict_batch_with_embedding(
+        self,
+        texts: List[str],
+        batch_size: int = 32
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        return self.predict_batch_with_spaces(texts, batch_size)[:2]
+
+    def predict_batch_with_spaces(self, texts: List[str], batch_size: int = 32) -> EngineOutput:
+        """
+        Route every text to its engine and run each engine once on its texts.
+
+        Returns:
+            Tuple of (N × labels probabilities, N × hidden pooled embeddings,
+            N embedding spaces)
+        """
+        groups: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            groups.setdefault(self.route_for(text), []).append(index)
+
+        probabilities = np.zeros((len(texts), len(self.emotion_labels)), dtype=np.float32)
+        embeddings = np.zeros((len(texts), self.model.config.hidden_size), dtype=np.float32)
+        spaces: List[Optional[str]] = [None] * len(texts)
+        for engine, rows in groups.items():
+            group_texts = [texts[i] for i in rows]
+            start = time.perf_counter()
+            probabilities[rows], embeddings[rows], group_spaces = self.engines[engine].predict(group_texts, batch_size)
+            for row, space in zip(rows, group_spaces):
+                spaces[row] = space
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.route_stats[engine].record_call(len(rows), elapsed_ms)
+            if engine != 'bert':
+                for row, text in zip(rows, group_texts):
+                    self._maybe_shadow(engine, text, probabilities[row].copy())
+
+        return probabilities, embeddings, spaces
+
+    def _maybe_shadow(self, engine: str, text: str, routed: np.ndarray):
+        """Compare a sample of routed outputs with full BERT, off the request path."""
+        with self._lock:
+            if self._random.random() >= self.shadow_rate or self._shadow_pending >= MAX_PENDING_SHADOWS:
+                return
+            self._shadow_pending += 1
+        self._shadow_executor.submit(self._shadow, engine, text, routed)
+
+    def _shadow(self, engine: str, text: str, routed: np.ndarray):
+        try:
+            full, _, _ = self.engines['bert'].predict([text])
+            with self._lock:
+                self.route_stats[engine].record_shadow(routed, full[0], self.threshold)
+        except Exception as e:
+            logger.warning(f"⚠️ Route shadow comparison failed: {e}")
+        finally:
+            with self._lock:
+                self._shadow_pending -= 1
+
+    def routing_stats(self) -> Dict[str, Any]:
+        """Route table plus per-engine latency and agreement statistics."""
+        with self._lock:
+            engines = {name: stats.to_dict() for name, stats in self.route_stats.items()}
+        for name, engine in self.engines.items():
+            if hasattr(engine, 'stats'):
+                engines[name].update(engine.stats())
+        return {
+            'routes': {text_type: self.routes.get(text_type, 'bert') for text_type in TEXT_TYPES},
+            'shadow_rate': self.shadow_rate,
+            'engines': engines
+        }
@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""
+Shared-Memory Model Server for Multiple HTTP Workers
+
+With several Flask workers per node, each one holds its own copy of the BERT
+weights, runs its own torch thread pool and only batches its own requests.
+This module moves inference into one (or a few) dedicated model processes:
+
+- The model server owns a shared-memory segment of request slots
+  (token IDs in, probability row and pooled embedding out)
+- Each connected HTTP worker is assigned a block of slots that it uses as a
+  ring: it tokenizes locally, writes the token IDs into a free slot and
+  rings a doorbell (a 4-byte slot index over a local socket)
+- The server gathers doorbells from all workers into batches (up to
+  max_batch, waiting at most max_wait_ms), runs one forward pass and writes
+  the outputs straight into the slots - nothing is pickled or copied through
+  the socket
+- HTTP workers only load the tokenizer, so the weights are stored once per
+  model process instead of once per worker
+
+Several model processes can share a node (--replicas/--replica_index split
+the CPUs); workers pick a server by PID from a comma-separated address list.
+
+Usage:
+    python model_server.py --model_path models/bert_emotion_model --address /tmp/soma-model.sock
+    SOMA_MODEL_SERVER=/tmp/soma-model.sock python api_server.py
+
+Configuration (environment variables, API server side):
+    SOMA_MODEL_SERVER          Comma-separated model server addresses (unset: in-process model)
+    SOMA_MODEL_SERVER_TIMEOUT  Seconds to wait for a slot result (default: 30)
+
+Authentication (both sides):
+    SOMA_MODEL_SERVER_AUTHKEY  Shared secret for the connection handshake; when unset,
+                               a random key is generated into SOMA_MODEL_SERVER_KEYFILE
+    SOMA_MODEL_SERVER_KEYFILE  Key file, mode 0600 (default: ~/.somajournal/model-server.key)
+
+Only Unix sockets (mode 0600) and loopback TCP addresses are accepted. The
+handshake is JSON over send_bytes/recv_bytes, so nothing received from a
+peer is ever unpickled.
+
+A worker whose model server restarts reconnects on its next request (and
+maps the new segment); requests in flight during the restart fail.
+"""
+
+import os
+import sys
+import json
+import queue
+import secrets
+import struct
+import logging
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_FILE = os.path.expanduser(os.getenv('SOMA_MODEL_SERVER_KEYFILE', '~/.somajournal/model-server.key'))
+DEFAULT_TIMEOUT = float(os.getenv('SOMA_MODEL_SERVER_TIMEOUT', '30'))
+
+# Seconds between reconnect attempts after the model server went away
+RECONNECT_INTERVAL = 1.0
+
+DOORBELL = struct.Struct('<i')
+
+
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1', '[::1]')
+
+
+def load_authkey(create: bool = False) -> bytes:
+    """
+    The shared handshake secret: SOMA_MODEL_SERVER_AUTHKEY, else the key file.
+
+    Args:
+        create: Generate the key file (mode 0600) if it does not exist (model server side)
+
+    Raises:
+        RuntimeError: No key configured and none to read
+    """
+    key = os.getenv('SOMA_MODEL_SERVER_AUTHKEY')
+    if key:
+        return key.encode('utf-8')
+    if create and not os.path.exists(KEY_FILE):
+        os.makedirs(os.path.dirname(KEY_FILE), mode=0o700, exist_ok=True)
+        try:
+            fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+        except FileExistsError:
+            pass
+    if not os.path.exists(KEY_FILE):
+        raise RuntimeError(
+            f"No model server key: set SOMA_MODEL_SERVER_AUTHKEY or start the model server to create {KEY_FILE}"
+        )
+    with open(KEY_FILE, 'r') as f:
+        return f.read().strip().encode('utf-8')
+
+
+def parse_address(address: str):
+    """
+    'host:port' for TCP on loopback, anything else is a Unix socket path.
+
+    Raises:
+        ValueError: A TCP address that is not loopback
+    """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        if host not in LOOPBACK_HOSTS:
+            raise ValueError(f"Model server TCP addresses must be loopback, got {host}")
+        return host.strip('[]'), int(port)
+    return address
+
+
+def send_json(conn, message: Dict[str, Any]):
+    conn.send_bytes(json.dumps(message).encode('utf-8'))
+
+
+def recv_json(conn) -> Dict[str, Any]:
+    message = json.loads(conn.recv_bytes(maxlength=1 << 20).decode('utf-8'))
+    if not isinstance(message, dict):
+        raise ValueError("Expected a JSON object")
+    return message
+
+
+class SlotBuffer:
+    """
+    Views over the shared-memory slot arrays.
+
+    Layout (one contiguous segment):
+        lengths        int32   [slots]
+        input_ids      int32   [slots, max_length]
+        probabilities  float32 [slots, num_labels]
+        embeddings     float32 [slots, hidden_size]
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int, max_length: int, num_labels: int, hidden_size: int):
+        self.shm = shm
+        self.slots = slots
+        self.max_length = max_length
+        offset = 0
+        arrays = {}
+        for name, dtype, shape in (
+            ('lengths', np.int32, (slots,)),
+            ('input_ids', np.int32, (slots, max_length)),
+            ('probabilities', np.float32, (slots, num_labels)),
+            ('embeddings', np.float32, (slots, hidden_size))
+        ):
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            offset += arrays[name].nbytes
+        self.lengths = arrays['lengths']
+        self.input_ids = arrays['input_ids']
+        self.probabilities = arrays['probabilities']
+        self.embeddings = arrays['embeddings']
+
+    @staticmethod
+    def size(slots: int, max_length: int, num_labels: int, hidden_size: int) -> int:
+        return 4 * slots * (1 + max_length + num_labels + hidden_size)
+
+
+class ModelServer:
+    """
+    Dedicated inference process serving HTTP workers through shared memory.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        address: str,
+        slots: int = 512,
+        slots_per_client: int = 64,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        max_length: int = 128
+    ):
+        """
+        Load the model and allocate the slot segment.
+
+        Args:
+            model_path: Path to the trained model
+            address: Unix socket path or host:port to listen on
+            slots: Total request slots in shared memory
+            slots_per_client: Slots assigned to each connected HTTP worker
+            max_batch: Maximum requests per forward pass
+            max_wait_ms: How long to wait for more requests before running a partial batch
+            max_length: Maximum token length (matches the tokenizer truncation)
+        """
+        from scripts.inference import EmotionClassifier
+        from model_registry import compute_model_version
+
+        self.classifier = EmotionClassifier(model_path=model_path)
+        self.model_path = os.path.abspath(model_path)
+        self.model_version = compute_model_version(model_path)
+        self.address = address
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.slots_per_client = slots_per_client
+
+        num_labels = len(self.classifier.emotion_labels)
+        hidden_size = self.classifier.model.config.hidden_size
+        self.layout = {'slots': slots, 'max_length': max_length, 'num_labels': num_labels, 'hidden_size': hidden_size}
+        self.shm = shared_memory.SharedMemory(create=True, size=SlotBuffer.size(**self.layout))
+        self.buffer = SlotBuffer(self.shm, **self.layout)
+
+        # Free slot blocks handed to clients on connect
+        self._free_blocks = list(range(0, slots - slots_per_client + 1, slots_per_client))
+        self._blocks_lock = threading.Lock()
+        self._requests: "queue.Queue[Tuple[Any, int]]" = queue.Queue()
+
+        self.batches = 0
+        self.requests = 0
+
+    def serve_forever(self):
+        """Accept HTTP worker connections and run the batching loop."""
+        listener = Listener(parse_address(self.address), authkey=load_authkey(create=True))
+        if isinstance(parse_address(self.address), str):
+            os.chmod(self.address, 0o600)
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        logger.info(f"🧠 Model server {self.model_version} listening on {self.address} "
+                    f"({self.layout['slots']} slots, batch ≤{self.max_batch}, wait ≤{self.max_wait * 1000:g}ms)")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    logger.warning(f"⚠️ Rejected model server connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            self.shm.close()
+            self.shm.unlink()
+
+    def _serve_client(self, conn):
+        with self._blocks_lock:
+            block = self._free_blocks.pop(0) if self._free_blocks else None
+        try:
+            hello = recv_json(conn)
+            if block is None:
+                send_json(conn, {'error': 'No free slots; raise --slots or lower the number of workers'})
+                return
+            send_json(conn, {
+                'shm_name': self.shm.name,
+                'slot_start': block,
+                'slot_count': self.slots_per_client,
+                'labels': self.classifier.emotion_labels,
+                'model_path': self.model_path,
+                'model_version': self.model_version,
+                **self.layout
+            })
+            logger.info(f"🔌 Worker {hello.get('pid')} connected (slots {block}-{block + self.slots_per_client - 1})")
+            while True:
+                (slot,) = DOORBELL.unpack(conn.recv_bytes())
+                if block <= slot < block + self.slots_per_client:
+                    self._requests.put((conn, slot))
+        except (EOFError, OSError, ValueError, struct.error):
+            pass
+        finally:
+            conn.close()
+            if block is not None:
+                with self._blocks_lock:
+                    self._free_blocks.append(block)
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[Tuple[Any, int]]):
+        import torch
+
+        slots = np.array([slot for _, slot in batch])
+        status = 0
+        try:
+            lengths = self.buffer.lengths[slots]
+            width = int(lengths.max())
+            input_ids = torch.from_numpy(self.buffer.input_ids[slots, :width].astype(np.int64))
+            attention_mask = torch.from_numpy((np.arange(width)[None, :] < lengths[:, None]).astype(np.int64))
+            input_ids = input_ids * attention_mask
+
+            if getattr(self.classifier, 'static_graphs', None) is not None:
+                # Shape-bucketed precompiled graphs (SOMA_STATIC_GRAPHS)
+                probabilities, embeddings = self.classifier.static_graphs.run_arrays(
+                    input_ids.numpy(), attention_mask.numpy()
+                )
+                self.buffer.probabilities[slots] = probabilities
+                self.buffer.embeddings[slots] = embeddings
+            else:
+                model = self.classifier.model
+                device = self.classifier.device
+                with torch.no_grad():
+                    pooled = model.bert(input_ids=input_ids.to(device), attention_mask=attention_mask.to(device)).pooler_output
+                    logits = model.classifier(model.dropout(pooled))
+                    self.buffer.probabilities[slots] = torch.sigmoid(logits).cpu().numpy()
+                    self.buffer.embeddings[slots] = pooled.cpu().numpy()
+            self.batches += 1
+            self.requests += len(batch)
+        except Exception as e:
+            logger.error(f"❌ Batch of {len(batch)} failed: {e}")
+            status = -1
+
+        for (conn, slot) in batch:
+            try:
+                # A negative slot index reports a failure
+                conn.send_bytes(DOORBELL.pack(slot if status == 0 else -slot - 1))
+            except OSError:
+                pass
+
+
+class ModelServerClient:
+    """
+    HTTP-worker side of the model server: owns a ring of slots and submits
+    tokenized requests to it.
+    """
+
+    def __init__(self, address: str, timeout: float = DEFAULT_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+        self._state_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._generation = 0
+        self._last_attempt = 0.0
+        self._connect()
+
+    def _connect(self):
+        """Open a connection and map the slot segment (again after a server restart)."""
+        conn = Client(parse_address(self.address), authkey=load_authkey())
+        send_json(conn, {'pid': os.getpid()})
+        info = recv_json(conn)
+        if 'error' in info:
+            conn.close()
+            raise RuntimeError(f"Model server refused connection: {info['error']}")
+        if getattr(self, 'info', None) and info['model_path'] != self.info['model_path']:
+            conn.close()
+            raise RuntimeError(
+                f"Model server at {self.address} now serves {info['model_path']}, not {self.info['model_path']}"
+            )
+
+        shm = shared_memory.SharedMemory(name=info['shm_name'])
+        try:
+            # The server owns the segment; don't let this process's tracker unlink it
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+
+        with self._state_lock:
+            self._generation += 1
+            self.conn = conn
+            self.info = info
+            self.shm = shm
+            self.buffer = SlotBuffer(
+                shm, info['slots'], info['max_length'], info['num_labels'], info['hidden_size']
+            )
+            self._free: "queue.Queue[int]" = queue.Queue()
+            for slot in range(info['slot_start'], info['slot_start'] + info['slot_count']):
+                self._free.put(slot)
+            self._waiting: Dict[int, List[Any]] = {}
+            # Timed-out slots the server may still write; freed when their late doorbell arrives
+            self._abandoned = set()
+            self._closed = False
+        threading.Thread(target=self._receive_loop, args=(conn, self._generation), daemon=True).start()
+
+    def _reconnect(self):
+        """Reconnect after the server went away, at most once per RECONNECT_INTERVAL."""
+        with self._connect_lock:
+            if not self._closed:
+                return
+            if time.monotonic() - self._last_attempt < RECONNECT_INTERVAL:
+                raise ConnectionError(f"Model server at {self.address} disconnected")
+            self._last_attempt = time.monotonic()
+            try:
+                self._connect()
+            except (OSError, EOFError) as e:
+                raise ConnectionError(f"Model server at {self.address} unavailable: {e}") from e
+            logger.info(f"🔌 Reconnected to model server at {self.address}")
+
+    @property
+    def labels(self) -> List[str]:
+        return self.info['labels']
+
+    @property
+    def model_path(self) -> str:
+        return self.info['model_path']
+
+    def _receive_loop(self, conn, generation: int):
+        try:
+            while True:
+                (value,) = DOORBELL.unpack(conn.recv_bytes())
+                slot, ok = (value, True) if value >= 0 else (-value - 1, False)
+                with self._state_lock:
+                    if generation != self._generation:
+                        return
+                    waiter = self._waiting.pop(slot, None)
+                    if waiter is None and slot in self._abandoned:
+                        # Late answer for a timed-out request: the slot is safe to reuse now
+                        self._abandoned.discard(slot)
+                        self._free.put(slot)
+                if waiter is not None:
+                    waiter[1] = ok
+                    waiter[0].set()
+        except (EOFError, OSError):
+            with self._state_lock:
+                if generation != self._generation:
+                    return
+                self._closed = True
+                waiters = list(self._waiting.values())
+            for waiter in waiters:
+                waiter[0].set()
+
+    def _submit(self, input_ids: List[int]) -> Tuple[int, List[Any]]:
+        if self._closed:
+            self._reconnect()
+        # Pin this request to one connection's segment, even if a reconnect happens meanwhile
+        with self._state_lock:
+            conn, buffer, free, generation = self.conn, self.buffer, self._free, self._generation
+        slot = free.get(timeout=self.timeout)
+        length = min(len(input_ids), buffer.max_length)
+        buffer.input_ids[slot, :length] = input_ids[:length]
+        buffer.lengths[slot] = length
+        # [done, ok, generation, buffer, free slots]
+        waiter = [threading.Event(), None, generation, buffer, free]
+        with self._state_lock:
+            if generation != self._generation:
+                raise ConnectionError(f"Model server at {self.address} reconnected; retry")
+            self._waiting[slot] = waiter
+        try:
+            with self._send_lock:
+                conn.send_bytes(DOORBELL.pack(slot))
+        except OSError as e:
+            raise ConnectionError(f"Model server at {self.address} disconnected") from e
+        return slot, waiter
+
+    def _collect(self, slot: int, waiter: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        done, _, generation, buffer, free = waiter
+        if not done.wait(self.timeout):
+            with self._state_lock:
+                if generation == self._generation and self._waiting.pop(slot, None) is not None:
+                    # The server may still write this slot; reuse it once it answers
+                    self._abandoned.add(slot)
+                    raise TimeoutError(f"Model server did not answer within {self.timeout}s")
+            if not done.is_set():
+                raise ConnectionError(f"Model server at {self.address} disconnected")
+        if waiter[1] is None:
+            raise ConnectionError(f"Model server at {self.address} disconnected")
+        if not waiter[1]:
+            free.put(slot)
+            raise RuntimeError("Model server failed to run the batch")
+        # Copy the small output rows out before the slot is recycled
+        result = buffer.probabilities[slot].copy(), buffer.embeddings[slot].copy()
+        free.put(slot)
+        return result
+
+    def infer(self, input_ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Run one tokenized text through the model server.
+
+        Returns:
+            Tuple of (probabilities, pooled embedding)
+        """
+        slot, waiter = self._submit(input_ids)
+        return self._collect(slot, waiter)
+
+    def infer_many(self, batch_ids: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Submit several tokenized texts at once so they can share server batches.
+
+        Returns:
+            Tuple of (N × labels probabilities, N × hidden embeddings)
+        """
+        probabilities = np.zeros((len(batch_ids), self.buffer.probabilities.shape[1]), dtype=np.float32)
+        embeddings = np.zeros((len(batch_ids), self.buffer.embeddings.shape[1]), dtype=np.float32)
+        window = self.info['slot_count']
+        for start in range(0, len(batch_ids), window):
+            submitted = [self._submit(ids) for ids in batch_ids[start:start + window]]
+            for offset, (slot, waiter) in enumerate(submitted):
+                probabilities[start + offset], embeddings[start + offset] = self._collect(slot, waiter)
+        return probabilities, embeddings
+
+    def close(self):
+        self.conn.close()
+        self.shm.close()
+
+
+def connect_from_environment() -> Optional[ModelServerClient]:
+    """
+    Connect to a model server listed in SOMA_MODEL_SERVER (picked by PID), if set.
+    """
+    addresses = [a.strip() for a in os.getenv('SOMA_MODEL_SERVER', '').split(',') if a.strip()]
+    if not addresses:
+        return None
+    address = addresses[os.getpid() % len(addresses)]
+    return ModelServerClient(address)
+
+
+def main():
+    """Run a model server process."""
+    import argparse
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Shared-memory BERT model server")
+    parser.add_argument('--model_path', type=str, default='models/bert_emotion_model')
+    parser.add_argument('--address', type=str, default='/tmp/soma-model.sock', help='Unix socket path or host:port')
+    parser.add_argument('--slots', type=int, default=512, help='Request slots in shared memory')
+    parser.add_argument('--slots_per_client', type=int, default=64, help='Slots per connected HTTP worker')
+    parser.add_argument('--max_batch', type=int, default=32)
+    parser.add_argument('--max_wait_ms', type=float, default=5.0)
+    parser.add_argument('--replicas', type=int, default=1, help='Model server processes on this node')
+    parser.add_argument('--replica_index', type=int, default=0, help="This process's index (CPU share)")
+    parser.add_argument('--pin', action='store_true', help='Pin this process to its CPU share')
+    args = parser.parse_args()
+
+    from inference_threads import apply_thread_config
+    apply_thread_config(num_workers=args.replicas, worker_index=args.replica_index, pin=args.pin)
+
+    if not args.address.count(':') and os.path.exists(args.address):
+        os.remove(args.address)
+
+    ModelServer(
+        args.model_path,
+        args.address,
+        slots=args.slots,
+        slots_per_client=args.slots_per_client,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
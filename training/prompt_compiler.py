@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Token-Budgeted Prompt Compiler for GPT Calls
+
+Builds the user prompts sent by the GPT personalization engine (detection,
+personalization, and the combined single-request mode) in compact form and
+keeps them within an input-token budget:
+- Static per-emotion template sections (psychosomatic pattern and wellness
+  recommendations) are rendered once as compact text instead of indented
+  JSON, and their token counts are cached
+- The emotion-detection prompt relies on the label list in the system
+  prompt instead of repeating it in every user prompt
+- Long journals are trimmed to fit the budget, keeping the opening, the
+  ending and the most emotionally expressive sentences
+- When the rest of the prompt leaves too little room for the journal,
+  lower-priority context (user context, then the least likely candidate
+  templates) is dropped first; a prompt that still cannot fit raises
+  PromptBudgetError rather than exceeding the budget
+
+Token counts use tiktoken when it is installed and a character-based
+estimate otherwise.
+
+Configuration (environment variables):
+    SOMA_PROMPT_MAX_INPUT_TOKENS  Input-token budget per GPT request (default: 1500)
+"""
+
+import os
+import re
+import json
+import math
+import threading
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+# Optional exact tokenizer
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+    tiktoken = None
+
+from psychosomatic_mapping import get_psychosomatic_analysis
+
+DEFAULT_MAX_INPUT_TOKENS = int(os.getenv('SOMA_PROMPT_MAX_INPUT_TOKENS', '1500'))
+
+# Chat format overhead per message and per request (OpenAI cookbook figures)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REQUEST = 3
+
+TRIM_MARKER = ' […] '
+
+# Fewest journal tokens worth sending; context is dropped to keep this much room
+MIN_JOURNAL_TOKENS = 32
+
+# Cues that a sentence carries the writer's feelings (kept first when trimming)
+FEELING_CUES = re.compile(
+    r"\b(i\s+feel|i\s+felt|i'm|i\s+am|i\s+was|feeling|felt|really|"
+    r"happy|sad|angry|anxious|worried|scared|afraid|grateful|excited|"
+    r"stressed|tired|lonely|proud|hurt|upset|frustrated|overwhelmed|calm)\b",
+    re.IGNORECASE
+)
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+
+WELLNESS_SECTION_NAMES = [
+    ('immediate_techniques', 'Immediate'),
+    ('body_work', 'Body work'),
+    ('mindful_approaches', 'Mindful'),
+    ('long_term_care', 'Long-term')
+]
+
+
+class PromptBudgetError(ValueError):
+    """The prompt cannot fit the input-token budget even with all optional context dropped."""
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken, or estimates ~4 characters per token."""
+
+    def __init__(self, model: str = 'gpt-3.5-turbo'):
+        self.model = model
+        self.encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                self.encoding = tiktoken.get_encoding('cl100k_base')
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return math.ceil(len(text) / 4)
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        """Prompt tokens of a chat request, including the per-message overhead."""
+        return TOKENS_PER_REQUEST + sum(
+            TOKENS_PER_MESSAGE + self.count(message['content']) for message in messages
+        )
+
+
+def format_user_context(user_context: Optional[Dict[str, Any]]) -> str:
+    return f"\nUser context: {json.dumps(user_context, separators=(',', ':'))}" if user_context else ''
+
+
+class PromptCompiler:
+    """
+    Compiles compact, budgeted user prompts for the personalization engine.
+    """
+
+    def __init__(self, max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS, model: str = 'gpt-3.5-turbo'):
+        """
+        Initialize the compiler.
+
+        Args:
+            max_input_tokens: Budget for system + user prompt tokens per request
+            model: Model name used to pick the tokenizer
+        """
+        self.max_input_tokens = max_input_tokens
+        self.counter = TokenCounter(model)
+        self._sections: Dict[str, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def emotion_section(self, emotion: str) -> Tuple[str, int]:
+        """
+        Compact evidence-based section for an emotion, rendered once.
+
+        Returns:
+            Tuple of (section text, token count)
+        """
+        emotion = (emotion or 'neutral').lower()
+        section = self._sections.get(emotion)
+        if section is None:
+            section = self._render_section(get_psychosomatic_analysis(emotion))
+            with self._lock:
+                self._sections[emotion] = section
+        return section
+
+    def _render_section(self, base_analysis: Dict[str, Any]) -> Tuple[str, int]:
+        psychosomatic = base_analysis.get('psychosomatic', {})
+        wellness = base_analysis.get('wellness', {})
+
+        lines = [
+            f"Research: {psychosomatic.get('research_basis', 'Evidence-based analysis')}",
+            f"Pattern: {psychosomatic.get('bodily_sensations', 'General bodily awareness')}",
+            f"Physiology: {psychosomatic.get('physiological_description', 'Natural body responses')}"
+        ]
+        for key, label in WELLNESS_SECTION_NAMES:
+            items = wellness.get(key)
+            if items:
+                lines.append(f"{label}: " + '; '.join(items))
+        # Any other wellness fields, compactly
+        for key, value in wellness.items():
+            if key not in dict(WELLNESS_SECTION_NAMES):
+                lines.append(f"{key}: {json.dumps(value, separators=(',', ':'))}")
+
+        text = '\n'.join(lines)
+        return text, self.counter.count(text)
+
+    def trim_journal(self, journal_text: str, max_tokens: int) -> Tuple[str, bool]:
+        """
+        Fit a journal into max_tokens, keeping its most informative sentences.
+
+        The first and last sentences are kept first, then sentences with the
+        most feeling cues; kept sentences stay in their original order with a
+        marker where text was dropped.
+
+        Returns:
+            Tuple of (possibly trimmed text, whether it was trimmed)
+        """
+        if self.counter.count(journal_text) <= max_tokens:
+            return journal_text, False
+
+        sentences = [s for s in SENTENCE_SPLIT.split(journal_text.strip()) if s]
+        costs = [self.counter.count(s) + 1 for s in sentences]
+        last = len(sentences) - 1
+
+        def priority(i: int) -> Tuple[int, int]:
+            edge = 2 if i == 0 else 1 if i == last else 0
+            return (edge, len(FEELING_CUES.findall(sentences[i])))
+
+        marker_cost = self.counter.count(TRIM_MARKER)
+        kept, used = set(), 0
+        for i in sorted(range(len(sentences)), key=priority, reverse=True):
+            if used + costs[i] + marker_cost <= max_tokens:
+                kept.add(i)
+                used += costs[i] + marker_cost
+
+        if not kept:
+            # A single oversized sentence: hard-truncate by characters
+            cut = int(len(journal_text) * max_tokens / max(self.counter.count(journal_text), 1))
+            return journal_text[:cut].rstrip() + TRIM_MARKER.rstrip(), True
+
+        parts, previous = [], -1
+        for i in sorted(kept):
+            if i != previous + 1:
+                parts.append(TRIM_MARKER.strip())
+            parts.append(sentences[i])
+            previous = i
+        if previous != last:
+            parts.append(TRIM_MARKER.strip())
+        return ' '.join(parts), True
+
+    def _fit(
+        self,
+        system_prompt: str,
+        variants: List[Tuple[List[str], Callable[[str], str]]],
+        journal_text: str
+    ) -> Dict[str, Any]:
+        """
+        Render a user prompt, trimming the journal to stay within budget.
+
+        Args:
+            system_prompt: System prompt sent with the user prompt
+            variants: (dropped context, render) pairs from the full prompt to
+                the leanest; the first one leaving MIN_JOURNAL_TOKENS for the
+                journal is used
+            journal_text: Journal entry to fit
+
+        Raises:
+            PromptBudgetError: Even the leanest variant leaves too little room
+        """
+        for dropped, render in variants:
+            fixed_tokens = self.counter.count_messages([
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': render('')}
+            ])
+            journal_budget = self.max_input_tokens - fixed_tokens
+            if journal_budget >= MIN_JOURNAL_TOKENS:
+                break
+        else:
+            raise PromptBudgetError(
+                f"Prompt needs {fixed_tokens + MIN_JOURNAL_TOKENS} tokens with all optional context "
+                f"dropped, over the {self.max_input_tokens}-token budget"
+            )
+
+        journal, trimmed = self.trim_journal(journal_text, journal_budget)
+        user_prompt = render(journal)
+        return {
+            'user_prompt': user_prompt,
+            'prompt_tokens': self.counter.count_messages([
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': user_prompt}
+            ]),
+            'journal_tokens': self.counter.count(journal),
+            'journal_trimmed': trimmed,
+            'dropped_context': dropped,
+            'token_count_exact': self.counter.exact
+        }
+
+    def personalization_prompt(
+        self,
+        system_prompt: str,
+        journal_text: str,
+        primary_emotion: str,
+        user_context: Optional[Dict[str, Any]] = None,
+        emotion_source: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Compile the personalization user prompt.
+
+        Returns:
+            Dictionary with the user_prompt and its token accounting
+        """
+        section, _ = self.emotion_section(primary_emotion)
+        source = f" ({emotion_source})" if emotion_source else ''
+
+        def renderer(context: str):
+            def render(journal: str) -> str:
+                return (
+                    f"Journal entry:\n---\n{journal}\n---\n"
+                    f"Primary emotion: {primary_emotion}{source}\n\n"
+                    f"EVIDENCE-BASED TEMPLATE (do not invent new information):\n{section}{context}\n\n"
+                    "TASK: Rewrite the template to be personally relevant to this entry. Keep the "
+                    "scientific foundation; make the language and examples specific to their situation."
+                )
+            return render
+
+        variants = [([], renderer(format_user_context(user_context)))]
+        if user_context:
+            variants.append((['user_context'], renderer('')))
+        return self._fit(system_prompt, variants, journal_text)
+
+    def detection_prompt(
+        self,
+        system_prompt: str,
+        journal_text: str,
+        max_emotions: int,
+        text_type: str,
+        strategy: str
+    ) -> Dict[str, Any]:
+        """
+        Compile the emotion-detection user prompt (labels live in the system prompt).
+
+        Returns:
+            Dictionary with the user_prompt and its token accounting
+        """
+        def render(journal: str) -> str:
+            return (
+                f'Analyze this journal entry for emotions:\nTEXT: "{journal}"\n\n'
+                f"Text type: {text_type}. Strategy: {strategy}. "
+                f"Return at most {max_emotions} emotions, confidence 0.1-0.95, "
+                "using only the 28 GoEmotions names from the system prompt.\n"
+                'JSON: {"emotions":[{"emotion":"nervousness","confidence":0.75}]}'
+            )
+
+        return self._fit(system_prompt, [([], render)], journal_text)
+
+    def combined_prompt(
+        self,
+        system_prompt: str,
+        journal_text: str,
+        candidates: List[str],
+        max_emotions: int,
+        text_type: str,
+        strategy: str,
+        user_context: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Compile the single-request detection + personalization user prompt,
+        with the pre-rendered template of each candidate primary emotion.
+
+        Candidates are ordered most likely first; under budget pressure the
+        user context and then the trailing candidates' templates are dropped
+        (a primary emotion without a template falls back to the regular
+        personalization call).
+
+        Returns:
+            Dictionary with the user_prompt and its token accounting
+        """
+        def renderer(kept: List[str], context: str):
+            templates = '\n\n'.join(
+                f"[{emotion}]\n{self.emotion_section(emotion)[0]}" for emotion in kept
+            )
+
+            def render(journal: str) -> str:
+                return (
+                    f"Journal entry:\n---\n{journal}\n---\n"
+                    f"Text type: {text_type}. Strategy: {strategy}. Return at most {max_emotions} emotions.\n\n"
+                    f"EVIDENCE-BASED TEMPLATES (likely primary emotions; do not invent new information):\n"
+                    f"{templates}{context}\n\n"
+                    "TASK: Detect the emotions, then rewrite the primary emotion's template to be "
+                    "personally relevant to this entry."
+                )
+            return render
+
+        variants = [([], renderer(candidates, format_user_context(user_context)))]
+        dropped = ['user_context'] if user_context else []
+        if user_context:
+            variants.append((list(dropped), renderer(candidates, '')))
+        for count in range(len(candidates) - 1, 0, -1):
+            dropped.append(f"template:{candidates[count]}")
+            variants.append((list(dropped), renderer(candidates[:count], '')))
+        return self._fit(system_prompt, variants, journal_text)
@@ -7,10 +7,17 @@ Evidence-based mapping of emotions to bodily sensations based on:
 - 3-tier mapping strategy for 28 GoEmotions categories
 - Scientific foundation for wellness recommendations
 
+The templates are also compiled at import time into emotion x body-region and
+emotion x symptom weight matrices, so the activation for a whole confidence
+vector (or a batch of them) is a single matrix product.
+
 This is the core differentiator for SomaJournal's premium analysis experience.
 """
 
-from typing import Dict, List, Any
+import re
+from typing import Dict, List, Any, Union
+
+import numpy as np
 
 # Evidence-based psychosomatic mapping based on Nummenmaa et al. research
 PSYCHOSOMATIC_TEMPLATES: Dict[str, Dict[str, Any]] = {
@@ -752,4 +759,209 @@ def get_scientific_basis(emotion: str) -> str:
     """Get the scientific research basis for an emotion mapping."""
     emotion_key = emotion.lower()
     template = PSYCHOSOMATIC_TEMPLATES.get(emotion_key, {})
-    return template.get('research_basis', 'General emotional wellness principles')
\ No newline at end of file
+    return template.get('research_basis', 'General emotional wellness principles')
+
+# GoEmotions label order used by the BERT model's output vector
+GOEMOTIONS_LABELS: List[str] = [
+    "admiration", "amusement", "anger", "annoyance", "approval", "caring",
+    "confusion", "curiosity", "desire", "disappointment", "disapproval",
+    "disgust", "embarrassment", "excitement", "fear", "gratitude", "grief",
+    "joy", "love", "nervousness", "optimism", "pride", "realization",
+    "relief", "remorse", "sadness", "surprise", "neutral"
+]
+
+# Physical symptoms tracked by SomaJournal and the emotions that can trigger them
+SYMPTOM_NAMES: List[str] = ['tension', 'headache', 'fatigue', 'restlessness', 'nausea']
+
+EMOTION_SYMPTOM_MAP: Dict[str, List[str]] = {
+    'anger': ['tension', 'headache'],
+    'anxiety': ['tension', 'restlessness', 'nausea'],
+    'fear': ['tension', 'nausea'],
+    'nervousness': ['restlessness', 'tension'],
+    'stress': ['tension', 'headache', 'fatigue'],
+    'annoyance': ['tension', 'headache'],
+    'frustration': ['tension'],
+    'sadness': ['fatigue'],
+    'grief': ['fatigue'],
+    'disappointment': ['fatigue']
+}
+
+# Minimum confidence for an emotion to trigger a symptom
+SYMPTOM_CONFIDENCE_THRESHOLD = 0.5
+
+# Relative activation strength of each template intensity level
+INTENSITY_WEIGHTS: Dict[str, float] = {
+    'none': 0.0,
+    'low': 0.3,
+    'moderate': 0.6,
+    'high': 0.85,
+    'very_high': 1.0
+}
+
+# Emotion axis of the projection matrices: the model's labels first, then any
+# extra (non-GoEmotions) names that appear in the symptom map
+EMOTION_AXIS: List[str] = GOEMOTIONS_LABELS + sorted(
+    set(EMOTION_SYMPTOM_MAP) - set(GOEMOTIONS_LABELS)
+)
+EMOTION_AXIS_INDEX: Dict[str, int] = {emotion: i for i, emotion in enumerate(EMOTION_AXIS)}
+
+BODY_REGIONS: List[str] = sorted({
+    region
+    for template in PSYCHOSOMATIC_TEMPLATES.values()
+    for region in template.get('primary_regions', [])
+    if region != 'none'
+})
+
+
+def _compile_region_matrix() -> np.ndarray:
+    """Emotion x region weights: each primary region gets the template's intensity weight."""
+    matrix = np.zeros((len(EMOTION_AXIS), len(BODY_REGIONS)), dtype=np.float32)
+    region_index = {region: j for j, region in enumerate(BODY_REGIONS)}
+    for emotion, template in PSYCHOSOMATIC_TEMPLATES.items():
+        if emotion not in EMOTION_AXIS_INDEX:
+            continue
+        weight = INTENSITY_WEIGHTS.get(template.get('intensity', 'moderate'), 0.6)
+        for region in template.get('primary_regions', []):
+            if region in region_index:
+                matrix[EMOTION_AXIS_INDEX[emotion], region_index[region]] = weight
+    return matrix
+
+
+def _compile_symptom_matrix() -> np.ndarray:
+    """Emotion x symptom 0/1 matrix from EMOTION_SYMPTOM_MAP."""
+    matrix = np.zeros((len(EMOTION_AXIS), len(SYMPTOM_NAMES)), dtype=np.float32)
+    symptom_index = {symptom: j for j, symptom in enumerate(SYMPTOM_NAMES)}
+    for emotion, symptoms in EMOTION_SYMPTOM_MAP.items():
+        for symptom in symptoms:
+            matrix[EMOTION_AXIS_INDEX[emotion], symptom_index[symptom]] = 1.0
+    return matrix
+
+
+REGION_MATRIX: np.ndarray = _compile_region_matrix()
+SYMPTOM_MATRIX: np.ndarray = _compile_symptom_matrix()
+
+
+def normalize_region_name(region: str) -> str:
+    """Normalize a region name the same way the body-map UI builds region IDs."""
+    return re.sub(r'[^a-z_]', '_', region.strip().lower())
+
+
+def _build_region_index() -> Dict[str, List[Dict[str, Any]]]:
+    """Inverted index: body region -> emotions that affect it, strongest first."""
+    index: Dict[str, List[Dict[str, Any]]] = {region: [] for region in BODY_REGIONS}
+    for emotion, template in PSYCHOSOMATIC_TEMPLATES.items():
+        regions = [r for r in template.get('primary_regions', []) if r != 'none']
+        intensity = template.get('intensity', 'moderate')
+        for region in regions:
+            index[region].append({
+                'emotion': emotion,
+                'intensity': intensity,
+                'intensity_weight': INTENSITY_WEIGHTS.get(intensity, 0.6),
+                'sensation_type': template.get('sensation_type', ''),
+                'pattern_type': template.get('pattern_type', ''),
+                'co_regions': [r for r in regions if r != region]
+            })
+    for entries in index.values():
+        entries.sort(key=lambda entry: (-entry['intensity_weight'], entry['emotion']))
+    return {normalize_region_name(region): entries for region, entries in index.items()}
+
+
+REGION_EMOTION_INDEX: Dict[str, List[Dict[str, Any]]] = _build_region_index()
+
+
+def get_emotions_for_region(region: str) -> List[Dict[str, Any]]:
+    """Get the emotions affecting a body region, strongest first (empty if unknown)."""
+    return REGION_EMOTION_INDEX.get(normalize_region_name(region), [])
+
+ConfidenceInput = Union[List[Dict[str, Any]], np.ndarray]
+
+
+def confidence_vector(emotions: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Convert a list of {'emotion', 'confidence'} dictionaries to a vector over EMOTION_AXIS.
+
+    Unknown emotion names are ignored; repeated names keep the highest confidence.
+    """
+    vector = np.zeros(len(EMOTION_AXIS), dtype=np.float32)
+    for emotion_data in emotions:
+        index = EMOTION_AXIS_INDEX.get(str(emotion_data.get('emotion', '')).lower())
+        if index is not None:
+            vector[index] = max(vector[index], float(emotion_data.get('confidence', 0.0)))
+    return vector
+
+
+def _as_confidences(confidences: ConfidenceInput) -> np.ndarray:
+    """
+    Accept emotion dictionaries, a model probability vector/batch over the 28
+    GoEmotions labels, or vectors already over EMOTION_AXIS.
+    """
+    if isinstance(confidences, list):
+        return confidence_vector(confidences)
+
+    confidences = np.asarray(confidences, dtype=np.float32)
+    padding = len(EMOTION_AXIS) - confidences.shape[-1]
+    if padding > 0:
+        pad_width = [(0, 0)] * (confidences.ndim - 1) + [(0, padding)]
+        confidences = np.pad(confidences, pad_width)
+    return confidences
+
+
+def project_body_regions(confidences: ConfidenceInput) -> np.ndarray:
+    """
+    Confidence-weighted body-region activation for all detected emotions.
+
+    Args:
+        confidences: Emotion dictionaries, a (E,) vector or an (N, E) batch
+
+    Returns:
+        (R,) or (N, R) activations aligned with BODY_REGIONS, clipped to [0, 1]
+    """
+    return np.clip(_as_confidences(confidences) @ REGION_MATRIX, 0.0, 1.0)
+
+
+def project_symptoms(confidences: ConfidenceInput) -> np.ndarray:
+    """
+    Confidence-weighted symptom scores for all detected emotions.
+
+    Args:
+        confidences: Emotion dictionaries, a (E,) vector or an (N, E) batch
+
+    Returns:
+        (S,) or (N, S) scores aligned with SYMPTOM_NAMES, clipped to [0, 1]
+    """
+    return np.clip(_as_confidences(confidences) @ SYMPTOM_MATRIX, 0.0, 1.0)
+
+
+def detect_symptoms(confidences: ConfidenceInput) -> np.ndarray:
+    """
+    Boolean symptom flags: a symptom is present when any emotion mapped to it
+    exceeds SYMPTOM_CONFIDENCE_THRESHOLD.
+
+    Returns:
+        (S,) or (N, S) boolean array aligned with SYMPTOM_NAMES
+    """
+    gated = (_as_confidences(confidences) > SYMPTOM_CONFIDENCE_THRESHOLD).astype(np.float32)
+    return (gated @ SYMPTOM_MATRIX) > 0
+
+
+def get_body_map_activation(emotions: List[Dict[str, Any]], top_k: int = 3) -> Dict[str, Any]:
+    """
+    Body-map activation and symptom scores for every detected emotion.
+
+    Args:
+        emotions: List of emotions with confidence scores
+        top_k: Number of most activated regions to list
+
+    Returns:
+        Dictionary with per-region activation, top regions and symptom scores
+    """
+    vector = confidence_vector(emotions)
+    regions = project_body_regions(vector)
+    symptoms = project_symptoms(vector)
+    top = np.argsort(-regions)[:top_k]
+
+    return {
+        'regions': {region: round(float(score), 3) for region, score in zip(BODY_REGIONS, regions) if score > 0},
+        'top_regions': [BODY_REGIONS[i] for i in top if regions[i] > 0],
+        'symptom_scores': {symptom: round(float(score), 3) for symptom, score in zip(SYMPTOM_NAMES, symptoms)}
+    }
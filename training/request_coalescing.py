@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Single-Flight Coalescing of Identical Analyses
+
+Double-submits, client retries and the Next.js proxy retrying after a
+timeout put several identical /analyze-emotion requests in flight at once.
+The first request for a key runs the pipeline; duplicates that arrive while
+it is still running wait on the same future and receive the same result
+(or the same exception). Nothing is cached once the leader finishes - a
+later identical request runs the pipeline again.
+
+Keys combine the whitespace-normalized text with the options that change
+the response (user, entry ID, user context, debug), so requests from
+different users are never merged.
+"""
+
+import json
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, Optional, Tuple
+
+WHITESPACE = re.compile(r'\s+')
+
+# Request fields that change the analysis or where it is recorded
+KEY_FIELDS = ('user_id', 'entry_id', 'user_context', 'debug', 'attribution')
+
+
+def coalescing_key(text: str, data: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Key for an analysis request: normalized text plus response-affecting options.
+
+    Args:
+        text: Journal text
+        data: Request JSON
+
+    Returns:
+        Stable string key
+    """
+    options = {field: (data or {}).get(field) for field in KEY_FIELDS}
+    return json.dumps([WHITESPACE.sub(' ', text.strip()), options], sort_keys=True, default=str)
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and shares its outcome with
+    concurrent callers of the same key.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.followers = 0
+        self.failures = 0
+        self.saved_seconds = 0.0
+
+    def run(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn for key, or wait for the identical call already in flight.
+
+        Args:
+            key: Coalescing key (see coalescing_key)
+            fn: Zero-argument callable producing the result
+
+        Returns:
+            Tuple of (result, shared) where shared is True for callers that
+            received another request's result
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.leaders += 1
+
+        if not leader:
+            waited = time.perf_counter()
+            result = future.result()
+            with self._lock:
+                self.followers += 1
+                # The follower's own run would have taken about as long as the leader's
+                self.saved_seconds += getattr(future, 'duration', time.perf_counter() - waited)
+            return result, True
+
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self.failures += 1
+            self._finish(key, future, start)
+            future.set_exception(e)
+            raise
+        self._finish(key, future, start)
+        future.set_result(result)
+        return result, False
+
+    def _finish(self, key: str, future: Future, start: float):
+        future.duration = time.perf_counter() - start
+        with self._lock:
+            # Later requests for this key start a new flight
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                'in_flight': len(self._inflight),
+                'executions': self.leaders,
+                'coalesced': self.followers,
+                'failures': self.failures,
+                'coalesced_rate': round(self.followers / total, 4) if total else 0.0,
+                'saved_seconds': round(self.saved_seconds, 3)
+            }
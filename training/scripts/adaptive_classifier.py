@@ -15,7 +15,7 @@ import os
 import sys
 import re
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import statistics
 
 # Add the project root to the path for imports
@@ -32,9 +32,15 @@ class AdaptiveEmotionClassifier:
     Adaptive emotion classifier that adjusts detection based on text characteristics.
     """
     
-    def __init__(self, model_path: str = 'models/bert_emotion_model'):
-        """Initialize the adaptive classifier."""
-        self.base_classifier = EmotionClassifier(model_path=model_path)
+    def __init__(self, model_path: str = 'models/bert_emotion_model', base_classifier: Optional[EmotionClassifier] = None):
+        """
+        Initialize the adaptive classifier.
+        
+        Args:
+            model_path: Path to the trained model
+            base_classifier: Pre-built classifier to wrap (e.g. RemoteEmotionClassifier)
+        """
+        self.base_classifier = base_classifier or EmotionClassifier(model_path=model_path)
         
         # Emotional richness indicators
         self.emotional_words = {
@@ -150,10 +156,14 @@ class AdaptiveEmotionClassifier:
         
         return min(score, 1.0)
     
-    def determine_adaptive_parameters(self, characteristics: Dict) -> Dict:
+    @staticmethod
+    def determine_adaptive_parameters(characteristics: Dict) -> Dict:
         """
         Determine optimal parameters based on text characteristics.
         
+        Only word_count, complexity_score and emotional_density are used, so
+        stored entries can be relabeled without the text (see relabel_entries.py).
+        
         Args:
             characteristics: Text analysis results
             
@@ -215,13 +225,19 @@ class AdaptiveEmotionClassifier:
             }
         }
     
-    def classify_adaptive(self, text: str, debug: bool = False) -> Dict:
+    def classify_adaptive(
+        self,
+        text: str,
+        debug: bool = False,
+        probabilities: Optional[np.ndarray] = None
+    ) -> Dict:
         """
         Classify emotions with adaptive parameters.
         
         Args:
             text: Input text
             debug: Whether to show reasoning
+            probabilities: Optional precomputed probability vector, skips inference
             
         Returns:
             Adaptive classification results
@@ -232,15 +248,14 @@ class AdaptiveEmotionClassifier:
         # Determine adaptive parameters
         adaptive_params = self.determine_adaptive_parameters(characteristics)
         
-        # Set adaptive threshold
-        original_threshold = self.base_classifier.threshold
-        self.base_classifier.threshold = adaptive_params['threshold']
-        
-        # Get emotions with adaptive threshold
-        result = self.base_classifier.classify_emotion(text, top_k=adaptive_params['max_emotions'])
-        
-        # Restore original threshold
-        self.base_classifier.threshold = original_threshold
+        # Get emotions with adaptive threshold (passed per call so concurrent
+        # requests never see each other's threshold)
+        result = self.base_classifier.classify_emotion(
+            text,
+            top_k=adaptive_params['max_emotions'],
+            threshold=adaptive_params['threshold'],
+            probabilities=probabilities
+        )
         
         # Limit to max emotions
         limited_emotions = result['emotions'][:adaptive_params['max_emotions']]
@@ -263,7 +278,13 @@ class AdaptiveEmotionClassifier:
         
         return adaptive_result
     
-    def _categorize_text_type(self, characteristics: Dict) -> str:
+    @staticmethod
+    def categorize_text(text: str) -> str:
+        """Text type from the text alone (word count), available before inference."""
+        return AdaptiveEmotionClassifier._categorize_text_type({'word_count': len(text.split())})
+    
+    @staticmethod
+    def _categorize_text_type(characteristics: Dict) -> str:
         """Categorize the type of text based on characteristics."""
         word_count = characteristics['word_count']
         
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Resumable Bulk Backfill of Journal Exports
+
+Re-analyzes whole journal exports (hundreds of thousands of entries) with a
+new model:
+- Streams a JSONL or CSV export in fixed-size chunks (never fully in memory)
+- Fans chunks out to N worker processes, each holding one model copy with
+  its own slice of the CPUs, using batched inference
+- Each chunk is written as its own output part (JSONL or Parquet) via an
+  atomic rename, so a part on disk is always complete
+- An interrupted run resumes by skipping chunks whose part already exists;
+  the manifest refuses to resume with a different input, model or chunk size
+- Progress, throughput and ETA are reported as chunks complete
+
+Usage:
+    python scripts/backfill.py --input export.jsonl --output backfill_out --workers 4
+    python scripts/backfill.py --input export.csv --output backfill_out --format parquet --include_probabilities
+    python scripts/backfill.py --input export.jsonl --output backfill_out --restart
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+# Add the project root to the path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MANIFEST_NAME = 'manifest.json'
+OUTPUT_FORMATS = ('jsonl', 'parquet')
+
+# Per-process state set up by init_worker
+_worker: Dict[str, Any] = {}
+
+
+def iter_records(input_path: str, text_field: str = 'text') -> Iterator[Dict[str, Any]]:
+    """Stream records from a JSONL or CSV export, skipping rows without text."""
+    with open(input_path, 'r', newline='', encoding='utf-8') as f:
+        if input_path.endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            if isinstance(row.get(text_field), str):
+                yield row
+
+
+def iter_chunks(records: Iterator[Dict[str, Any]], chunk_size: int) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """Group records into numbered chunks (the unit of work and of resumption)."""
+    chunk, index = [], 0
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield index, chunk
+            chunk, index = [], index + 1
+    if chunk:
+        yield index, chunk
+
+
+def count_records(input_path: str, text_field: str = 'text') -> int:
+    """
+    Number of records iter_records yields (used for chunk counts and the ETA).
+
+    Rows without text are skipped when chunking, so they must not be counted
+    either: chunk sizes, already-done records on resume and the ETA would
+    drift from the real chunks.
+    """
+    return sum(1 for _ in iter_records(input_path, text_field))
+
+
+def part_path(output_dir: str, chunk_index: int, output_format: str) -> str:
+    return os.path.join(output_dir, f"part-{chunk_index:06d}.{output_format}")
+
+
+def init_worker(model_path: str, num_workers: int, worker_counter, pin: bool):
+    """Load one model copy per process, on its own share of the CPUs."""
+    from inference_threads import apply_thread_config
+    from model_registry import compute_model_version
+    from scripts.adaptive_classifier import AdaptiveEmotionClassifier
+
+    with worker_counter.get_lock():
+        worker_index = worker_counter.value
+        worker_counter.value += 1
+
+    apply_thread_config(num_workers=num_workers, worker_index=worker_index, pin=pin)
+    _worker['classifier'] = AdaptiveEmotionClassifier(model_path=model_path)
+    _worker['model_version'] = compute_model_version(model_path)
+
+
+def analyze_chunk(
+    chunk_index: int,
+    records: List[Dict[str, Any]],
+    options: Dict[str, Any]
+) -> Tuple[int, int]:
+    """
+    Analyze one chunk and write its output part.
+
+    Returns:
+        Tuple of (chunk_index, records written)
+    """
+    classifier = _worker['classifier']
+    text_field = options['text_field']
+    texts = [record[text_field].strip() for record in records]
+    probabilities, _ = classifier.base_classifier.predict_batch_with_embedding(texts, options['batch_size'])
+
+    rows = []
+    for record, text, probs in zip(records, texts, probabilities):
+        result = classifier.classify_adaptive(text, probabilities=probs)
+        row = {field: record.get(field) for field in options['passthrough_fields'] if field in record}
+        row.update({
+            'model_version': _worker['model_version'],
+            'emotions': [
+                {'emotion': e['emotion'], 'confidence': round(e['confidence'], 4)} for e in result['emotions']
+            ],
+            'text_type': result['analysis']['text_type'],
+            'threshold_used': round(result['adaptive_params']['threshold'], 4),
+            'max_emotions': result['adaptive_params']['max_emotions']
+        })
+        if options['include_probabilities']:
+            row['probabilities'] = [round(float(p), 5) for p in probs]
+        rows.append(row)
+
+    write_part(part_path(options['output_dir'], chunk_index, options['format']), rows, options['format'])
+    return chunk_index, len(rows)
+
+
+def write_part(path: str, rows: List[Dict[str, Any]], output_format: str):
+    """Write an output part atomically (temporary file, then rename)."""
+    tmp_path = path + '.tmp'
+    if output_format == 'parquet':
+        import pandas as pd
+        frame = pd.DataFrame(rows)
+        if 'emotions' in frame:
+            frame['emotions'] = frame['emotions'].map(json.dumps)
+        frame.to_parquet(tmp_path, index=False)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, default=str) + '\n')
+    os.replace(tmp_path, path)
+
+
+def prepare_output(args, model_version: str) -> set:
+    """
+    Create or validate the output directory's manifest.
+
+    Returns:
+        Set of chunk indices already completed
+    """
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST_NAME)
+    manifest = {
+        'input': os.path.abspath(args.input),
+        'input_size': os.path.getsize(args.input),
+        'model_path': os.path.abspath(args.model_path),
+        'model_version': model_version,
+        'chunk_size': args.chunk_size,
+        'format': args.format,
+        'include_probabilities': args.include_probabilities
+    }
+
+    if args.restart:
+        for name in os.listdir(args.output):
+            if name.startswith('part-'):
+                os.remove(os.path.join(args.output, name))
+    elif os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            previous = json.load(f)
+        changed = [key for key in manifest if previous.get(key) != manifest[key]]
+        if changed:
+            raise SystemExit(
+                f"❌ {args.output} holds a backfill with different {', '.join(changed)}; "
+                "use --restart or another --output directory"
+            )
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    suffix = f".{args.format}"
+    completed = set()
+    for name in os.listdir(args.output):
+        if name.startswith('part-') and name.endswith(suffix):
+            completed.add(int(name[len('part-'):-len(suffix)]))
+        elif name.endswith('.tmp'):
+            # Left behind by an interrupted write
+            os.remove(os.path.join(args.output, name))
+    return completed
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s" if seconds >= 3600 \
+        else f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+def run_backfill(args) -> Dict[str, Any]:
+    """
+    Run (or resume) a backfill.
+
+    Returns:
+        Summary with records written, chunks and elapsed time
+    """
+    from model_registry import compute_model_version
+
+    if args.format == 'parquet':
+        try:
+            import pandas  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("❌ Parquet output needs pandas and pyarrow: pip install pandas pyarrow")
+
+    model_version = compute_model_version(args.model_path)
+    completed = prepare_output(args, model_version)
+    total = None if args.no_count else count_records(args.input, args.text_field)
+    total_chunks = None if total is None else -(-total // args.chunk_size)
+    skipped_records = sum(
+        min(args.chunk_size, total - index * args.chunk_size) for index in completed
+    ) if total is not None else 0
+
+    print(f"🚀 Backfilling {args.input} with {model_version} on {args.workers} workers")
+    if completed:
+        print(f"↩️ Resuming: {len(completed)} chunks already done")
+
+    options = {
+        'text_field': args.text_field,
+        'passthrough_fields': [args.id_field] + [f for f in args.passthrough.split(',') if f],
+        'batch_size': args.batch_size,
+        'include_probabilities': args.include_probabilities,
+        'output_dir': args.output,
+        'format': args.format
+    }
+
+    start = time.time()
+    processed = 0
+    chunks_done = 0
+    pending = set()
+    max_pending = args.workers * 2
+    context = mp.get_context('spawn')
+    worker_counter = context.Value('i', 0)
+
+    def report(done_futures):
+        nonlocal processed, chunks_done
+        for future in done_futures:
+            _, count = future.result()
+            processed += count
+            chunks_done += 1
+        elapsed = time.time() - start
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        line = f"   📈 {processed:,} entries ({rate:.1f}/s)"
+        if total is not None:
+            remaining = total - skipped_records - processed
+            done = skipped_records + processed
+            line += f" · {done:,}/{total:,} ({done / max(total, 1):.1%})"
+            if rate > 0:
+                line += f" · ETA {format_duration(remaining / rate)}"
+        print(line, flush=True)
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(args.model_path, args.workers, worker_counter, args.pin)
+    ) as executor:
+        for chunk_index, records in iter_chunks(iter_records(args.input, args.text_field), args.chunk_size):
+            if chunk_index in completed:
+                continue
+            # Bound the chunks held in memory while workers catch up
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                report(done)
+            pending.add(executor.submit(analyze_chunk, chunk_index, records, options))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            report(done)
+
+    elapsed = time.time() - start
+    summary = {
+        'records': processed,
+        'skipped_records': skipped_records,
+        'chunks': chunks_done,
+        'total_chunks': total_chunks,
+        'elapsed_seconds': round(elapsed, 1),
+        'entries_per_second': round(processed / elapsed, 1) if elapsed > 0 else 0.0,
+        'model_version': model_version,
+        'output': args.output
+    }
+    print(f"✅ Backfill complete: {processed:,} entries in {format_duration(elapsed)} "
+          f"({summary['entries_per_second']}/s)")
+    return summary
+
+
+def main():
+    """Run the backfill CLI."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Resumable multi-process backfill of journal exports")
+    parser.add_argument('--input', type=str, required=True, help='JSONL or CSV export')
+    parser.add_argument('--output', type=str, required=True, help='Output directory (parts + manifest)')
+    parser.add_argument('--model_path', type=str, default='models/bert_emotion_model')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='jsonl', help='Output part format')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Worker processes, one model copy each')
+    parser.add_argument('--chunk_size', type=int, default=1000, help='Entries per chunk / output part')
+    parser.add_argument('--batch_size', type=int, default=32, help='Texts per forward pass')
+    parser.add_argument('--text_field', type=str, default='text')
+    parser.add_argument('--id_field', type=str, default='id')
+    parser.add_argument('--passthrough', type=str, default='user_id,timestamp',
+                        help='Comma-separated input fields copied to the output')
+    parser.add_argument('--include_probabilities', action='store_true', help='Write the full probability vectors')
+    parser.add_argument('--pin', action='store_true', help='Pin each worker to its own CPU set')
+    parser.add_argument('--no_count', action='store_true', help='Skip the initial record count (no ETA)')
+    parser.add_argument('--restart', action='store_true', help='Discard existing parts and start over')
+    args = parser.parse_args()
+
+    summary = run_backfill(args)
+    with open(os.path.join(args.output, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
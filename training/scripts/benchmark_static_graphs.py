@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Static-Graph Benchmark: Shape Buckets vs. Eager Dynamic Padding
+
+Compares the current inference path (eager PyTorch, each batch padded to its
+own longest text) with shape-bucketed static graphs (see static_graphs.py)
+for every requested backend:
+- Single-text latency (the API path)
+- Batch throughput on a mixed-length corpus (the backfill / model-server path)
+- Build + warmup time paid at startup
+- Largest probability difference from the eager outputs
+
+Usage:
+    python scripts/benchmark_static_graphs.py
+    python scripts/benchmark_static_graphs.py --backends torchscript,compile --buckets 16,32,64,128 --repeat 50
+"""
+
+import os
+import sys
+import json
+import time
+import torch
+import numpy as np
+from transformers import BertForSequenceClassification
+from typing import Dict, List, Any, Callable, Tuple
+
+# Add the project root to the path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_threads import BENCHMARK_TEXTS
+from static_graphs import StaticGraphRunner, PooledClassifier
+from tokenization import TokenizationStage, load_tokenizer
+
+
+def eager_runner(model) -> Callable:
+    """The current path: eager forward on the batch padded to its longest text."""
+    module = PooledClassifier(model).eval()
+
+    def run(batch) -> Tuple[np.ndarray, np.ndarray]:
+        inputs = batch.to_tensors()
+        with torch.no_grad():
+            probabilities, pooled = module(inputs['input_ids'], inputs['attention_mask'])
+        return probabilities.numpy(), pooled.numpy()
+
+    return run
+
+
+def time_single(run: Callable, batches: List, repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        for batch in batches:
+            start = time.perf_counter()
+            run(batch)
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'p50_ms': round(float(np.percentile(timings, 50)), 2),
+        'p95_ms': round(float(np.percentile(timings, 95)), 2),
+        'mean_ms': round(float(np.mean(timings)), 2)
+    }
+
+
+def time_batches(run: Callable, batches: List, repeat: int) -> Dict[str, float]:
+    texts = sum(len(batch.items) for batch in batches) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for batch in batches:
+            run(batch)
+    return {'texts_per_second': round(texts / (time.perf_counter() - start), 1)}
+
+
+def run_benchmark(model_path: str, backends: List[str], buckets: List[int], batch_size: int, repeat: int) -> Dict[str, Any]:
+    tokenization = TokenizationStage(load_tokenizer(model_path))
+    model = BertForSequenceClassification.from_pretrained(model_path).eval()
+
+    singles = [tokenization.encode_batch([text]) for text in BENCHMARK_TEXTS]
+    corpus = (BENCHMARK_TEXTS * (4 * batch_size // len(BENCHMARK_TEXTS) + 1))[:4 * batch_size]
+    # Shuffled so every batch mixes short and long texts, as in real traffic
+    corpus = [corpus[i] for i in np.random.default_rng(0).permutation(len(corpus))]
+    batches = [tokenization.encode_batch(corpus[i:i + batch_size]) for i in range(0, len(corpus), batch_size)]
+
+    eager = eager_runner(model)
+    reference = np.concatenate([eager(batch)[0] for batch in singles])
+    results = {
+        'eager_dynamic': {
+            'single_text': time_single(eager, singles, repeat),
+            f'batch_{batch_size}': time_batches(eager, batches, max(1, repeat // 5))
+        }
+    }
+
+    for backend in backends:
+        print(f"🔧 Building {backend} graphs...")
+        start = time.perf_counter()
+        try:
+            runner = StaticGraphRunner(
+                model, backend=backend, buckets=buckets, max_batch=batch_size,
+                pad_token_id=tokenization.pad_token_id, max_length=tokenization.max_length
+            )
+            runner.warmup()
+        except Exception as e:
+            print(f"⚠️ {backend} unavailable: {e}")
+            results[backend] = {'error': str(e)}
+            continue
+        startup = round(time.perf_counter() - start, 2)
+
+        outputs = np.concatenate([runner.run(batch)[0] for batch in singles])
+        results[backend] = {
+            'startup_seconds': startup,
+            'max_probability_diff': float(np.abs(outputs - reference).max()),
+            'single_text': time_single(runner.run, singles, repeat),
+            f'batch_{batch_size}': time_batches(runner.run, batches, max(1, repeat // 5)),
+            'padding_overhead': runner.stats()['padding_overhead']
+        }
+
+    return {'model_path': model_path, 'buckets': buckets, 'threads': torch.get_num_threads(), 'results': results}
+
+
+def main():
+    """Run the static-graph benchmark."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark shape-bucketed static graphs against eager dynamic padding")
+    parser.add_argument('--model_path', type=str, default='models/bert_emotion_model')
+    parser.add_argument('--backends', type=str, default='torchscript,compile,eager')
+    parser.add_argument('--buckets', type=str, default='16,32,64,128')
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=20, help='Passes over the benchmark texts')
+    parser.add_argument('--output', type=str, help='Write the results as JSON')
+    args = parser.parse_args()
+
+    print("⏱️ Benchmarking static-graph inference...")
+    report = run_benchmark(
+        args.model_path,
+        args.backends.split(','),
+        [int(size) for size in args.buckets.split(',')],
+        args.batch_size,
+        args.repeat
+    )
+
+    batch_key = f'batch_{args.batch_size}'
+    baseline = report['results']['eager_dynamic']
+    print(f"\n{'':<16}{'p50 ms':>9}{'p95 ms':>9}{'batch texts/s':>15}{'startup s':>11}{'max diff':>10}")
+    for name, result in report['results'].items():
+        if 'error' in result:
+            print(f"{name:<16}  unavailable")
+            continue
+        print(f"{name:<16}{result['single_text']['p50_ms']:>9}{result['single_text']['p95_ms']:>9}"
+              f"{result[batch_key]['texts_per_second']:>15}{result.get('startup_seconds', '-'):>11}"
+              f"{result.get('max_probability_diff', 0):>10.1e}")
+    for name, result in report['results'].items():
+        if name != 'eager_dynamic' and 'error' not in result:
+            print(f"{name}: single-text {baseline['single_text']['p50_ms'] / result['single_text']['p50_ms']:.2f}x, "
+                  f"batch {result[batch_key]['texts_per_second'] / baseline[batch_key]['texts_per_second']:.2f}x vs eager")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Tokenizer Benchmark: BertTokenizer vs. the Fast Tokenization Stage
+
+Measures per-text latency (the API path) and batch throughput (the
+backfill / batch path) of the pure-Python BertTokenizer against
+BertTokenizerFast with batch encoding and offset mapping, and checks that
+both produce identical token IDs.
+
+Usage:
+    python scripts/benchmark_tokenizer.py
+    python scripts/benchmark_tokenizer.py --model_path models/bert_emotion_model --repeat 200 --batch_size 64
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+from typing import Dict, List, Any
+
+# Add the project root to the path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_threads import BENCHMARK_TEXTS
+from tokenization import TokenizationStage, load_tokenizer
+
+
+def time_single(encode, texts: List[str], repeat: int) -> Dict[str, float]:
+    """Per-text latency percentiles in microseconds."""
+    timings = []
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter()
+            encode(text)
+            timings.append((time.perf_counter() - start) * 1e6)
+    return {
+        'p50_us': round(float(np.percentile(timings, 50)), 1),
+        'p95_us': round(float(np.percentile(timings, 95)), 1),
+        'mean_us': round(float(np.mean(timings)), 1)
+    }
+
+
+def time_batch(encode_batch, texts: List[str], batch_size: int, repeat: int) -> Dict[str, float]:
+    """Batch throughput in texts per second."""
+    corpus = (texts * (batch_size // len(texts) + 1))[:batch_size]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encode_batch(corpus)
+    elapsed = time.perf_counter() - start
+    return {'texts_per_second': round(repeat * len(corpus) / elapsed, 1)}
+
+
+def run_benchmark(model_path: str, repeat: int, batch_size: int) -> Dict[str, Any]:
+    slow = TokenizationStage(load_tokenizer(model_path, fast=False))
+    fast = TokenizationStage(load_tokenizer(model_path, fast=True))
+    if not fast.is_fast:
+        print("⚠️ Fast tokenizer could not be loaded; comparing the fallback with itself")
+
+    texts = BENCHMARK_TEXTS
+    mismatches = sum(
+        slow.encode(text).input_ids != fast.encode(text).input_ids for text in texts
+    )
+
+    results = {
+        'model_path': model_path,
+        'identical_token_ids': mismatches == 0,
+        'single_text': {
+            'BertTokenizer': time_single(lambda t: slow.tokenizer(t, truncation=True, max_length=128), texts, repeat),
+            'fast_stage': time_single(fast.encode, texts, repeat)
+        },
+        f'batch_{batch_size}': {
+            'BertTokenizer': time_batch(
+                lambda batch: slow.tokenizer(batch, truncation=True, padding=True, max_length=128),
+                texts, batch_size, max(1, repeat // 10)
+            ),
+            'fast_stage': time_batch(fast.encode_batch, texts, batch_size, max(1, repeat // 10))
+        }
+    }
+    return results
+
+
+def main():
+    """Run the tokenizer benchmark."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark BertTokenizer against the fast tokenization stage")
+    parser.add_argument('--model_path', type=str, default='models/bert_emotion_model')
+    parser.add_argument('--repeat', type=int, default=200, help='Passes over the benchmark texts')
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--output', type=str, help='Write the results as JSON')
+    args = parser.parse_args()
+
+    print("⏱️ Benchmarking tokenizers...")
+    results = run_benchmark(args.model_path, args.repeat, args.batch_size)
+
+    single = results['single_text']
+    batch = results[f'batch_{args.batch_size}']
+    print(f"\n{'':<16}{'p50 µs':>10}{'p95 µs':>10}{'batch texts/s':>16}")
+    for name in ('BertTokenizer', 'fast_stage'):
+        print(f"{name:<16}{single[name]['p50_us']:>10}{single[name]['p95_us']:>10}"
+              f"{batch[name]['texts_per_second']:>16}")
+    print(f"\nSingle-text speedup: {single['BertTokenizer']['p50_us'] / max(single['fast_stage']['p50_us'], 1e-9):.1f}x, "
+          f"batch speedup: {batch['fast_stage']['texts_per_second'] / max(batch['BertTokenizer']['texts_per_second'], 1e-9):.1f}x")
+    print(f"Identical token IDs: {'✅' if results['identical_token_ids'] else '❌'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Semantic Cache Calibration
+
+The semantic personalization cache reuses a GPT personalization when a new
+entry's pooled BERT embedding is close enough to a cached one. Raw cosine
+over the tanh pooler output is anisotropic (unrelated entries already score
+high), so a fixed threshold says little. This script measures, on GoEmotions
+dev texts:
+- Near-duplicates: each text against a lightly edited copy (dropped word,
+  lowercased, punctuation removed) - these should be reused
+- Distinct entries: different texts with the same primary emotion, i.e.
+  the pairs that actually share a cache bucket - these should not
+
+Embeddings are centered on their mean before the cosine. The threshold is
+the lowest one whose false-reuse rate on distinct pairs stays within
+--max_false_reuse; it is written with the mean embedding to the file
+semantic_cache.py loads at startup. Re-run after retraining the model.
+
+Usage:
+    python scripts/calibrate_semantic_cache.py
+    python scripts/calibrate_semantic_cache.py --samples 3000 --max_false_reuse 0.0005
+"""
+
+import os
+import sys
+import json
+import re
+import numpy as np
+from typing import Dict, List, Any
+
+# Add the project root to the path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.train import load_data
+from scripts.inference import EmotionClassifier
+from semantic_cache import CALIBRATION_PATH
+
+
+def near_duplicate(text: str, rng: np.random.Generator) -> str:
+    """A lightly edited copy, like a re-used template or reworded check-in."""
+    words = text.split()
+    if len(words) > 4:
+        del words[int(rng.integers(len(words)))]
+    edited = ' '.join(words)
+    if rng.random() < 0.5:
+        edited = edited.lower()
+    return re.sub(r'[.!?,]+$', '', edited)
+
+
+def unit(vectors: np.ndarray, center: np.ndarray = None) -> np.ndarray:
+    if center is not None:
+        vectors = vectors - center
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def same_bucket_similarities(vectors: np.ndarray, primary: np.ndarray, max_pairs: int, rng: np.random.Generator) -> np.ndarray:
+    """Cosine similarities of distinct texts sharing a primary emotion."""
+    similarities = []
+    for label in np.unique(primary):
+        rows = np.flatnonzero(primary == label)
+        if len(rows) < 2:
+            continue
+        scores = vectors[rows] @ vectors[rows].T
+        similarities.append(scores[np.triu_indices(len(rows), k=1)])
+    similarities = np.concatenate(similarities) if similarities else np.zeros(0)
+    if len(similarities) > max_pairs:
+        similarities = rng.choice(similarities, max_pairs, replace=False)
+    return similarities
+
+
+def calibrate(originals: np.ndarray, duplicates: np.ndarray, primary: np.ndarray,
+              max_false_reuse: float, max_pairs: int, center: np.ndarray = None) -> Dict[str, Any]:
+    rng = np.random.default_rng(0)
+    vectors = unit(originals, center)
+    positives = np.sum(vectors * unit(duplicates, center), axis=1)
+    negatives = same_bucket_similarities(vectors, primary, max_pairs, rng)
+    threshold = float(np.quantile(negatives, 1 - max_false_reuse))
+    return {
+        'threshold': round(threshold, 4),
+        'near_duplicate_recall': round(float(np.mean(positives >= threshold)), 3),
+        'false_reuse_rate': round(float(np.mean(negatives >= threshold)), 5),
+        'near_duplicate_similarity_p50': round(float(np.median(positives)), 4),
+        'distinct_similarity_p50': round(float(np.median(negatives)), 4),
+        'distinct_pairs': int(len(negatives))
+    }
+
+
+def main():
+    """Calibrate the semantic cache threshold."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calibrate the semantic personalization cache threshold")
+    parser.add_argument('--model_path', type=str, default='models/bert_emotion_model')
+    parser.add_argument('--samples', type=int, default=2000, help='Dev texts to embed')
+    parser.add_argument('--max_false_reuse', type=float, default=0.001,
+                        help='Allowed fraction of distinct same-bucket pairs above the threshold')
+    parser.add_argument('--max_pairs', type=int, default=500000)
+    parser.add_argument('--output', type=str, default=CALIBRATION_PATH)
+    args = parser.parse_args()
+
+    print("📏 Calibrating the semantic cache threshold...")
+    _, (texts, _), _ = load_data()
+    rng = np.random.default_rng(42)
+    texts = [texts[i] for i in rng.permutation(len(texts))[:args.samples]]
+    duplicates = [near_duplicate(text, rng) for text in texts]
+
+    classifier = EmotionClassifier(model_path=args.model_path)
+    probabilities, originals = classifier.predict_batch_with_embedding(texts)
+    _, duplicate_embeddings = classifier.predict_batch_with_embedding(duplicates)
+    primary = probabilities.argmax(axis=1)
+    mean = originals.mean(axis=0)
+
+    raw = calibrate(originals, duplicate_embeddings, primary, args.max_false_reuse, args.max_pairs)
+    centered = calibrate(originals, duplicate_embeddings, primary, args.max_false_reuse, args.max_pairs, center=mean)
+
+    for name, result in (('raw', raw), ('centered', centered)):
+        print(f"{name:<9} threshold {result['threshold']:.4f}  near-duplicate recall {result['near_duplicate_recall']:.3f}  "
+              f"false reuse {result['false_reuse_rate']:.5f}  (distinct p50 {result['distinct_similarity_p50']:.3f})")
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'model_path': args.model_path,
+            'samples': len(texts),
+            'max_false_reuse': args.max_false_reuse,
+            **centered,
+            'raw': raw,
+            'mean': mean.tolist()
+        }, f)
+    print(f"💾 Calibration saved to {args.output} (threshold {centered['threshold']:.4f})")
+
+
+if __name__ == "__main__":
+    main()
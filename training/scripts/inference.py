@@ -18,16 +18,22 @@ Or import and use programmatically:
 import os
 import sys
 import json
+import threading
 import torch
 import numpy as np
-from transformers import BertTokenizer, BertForSequenceClassification, pipeline
-from typing import Dict, List, Tuple
+from transformers import BertForSequenceClassification, pipeline
+from typing import Dict, List, Optional, Tuple
 import warnings
 warnings.filterwarnings('ignore')
 
 # Add the project root to the path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from tokenization import TokenizationStage, TokenizedBatch, load_tokenizer
+from attribution import word_attribution
+from early_exit import load_early_exit
+from static_graphs import build_from_environment as build_static_graphs
+
 class EmotionClassifier:
     """
     BERT-based emotion classifier for multi-label emotion detection.
@@ -54,11 +60,17 @@ class EmotionClassifier:
         try:
             print(f"📱 Loading model from {self.model_path}...")
             
-            self.tokenizer = BertTokenizer.from_pretrained(self.model_path)
+            self.tokenizer = load_tokenizer(self.model_path)
+            self.tokenization = TokenizationStage(self.tokenizer)
             self.model = BertForSequenceClassification.from_pretrained(self.model_path)
             self.model.to(self.device)
             self.model.eval()
             
+            # Optional shape-bucketed precompiled graphs (SOMA_STATIC_GRAPHS)
+            self.static_graphs = build_static_graphs(
+                self.model, self.tokenization.pad_token_id, self.tokenization.max_length
+            )
+            
             print(f"✓ Model loaded successfully on {self.device}")
             
         except Exception as e:
@@ -97,17 +109,159 @@ class EmotionClassifier:
             ]
             print(f"⚠️ Using default emotion labels ({len(self.emotion_labels)} labels)")
     
-    def classify_emotion(self, text: str, top_k: int = 5) -> Dict:
+    def predict_probabilities(self, text: str) -> np.ndarray:
+        """
+        Run the model and return the raw sigmoid probability vector.
+        
+        Args:
+            text: Input text to analyze
+            
+        Returns:
+            Array of per-emotion probabilities, aligned with self.emotion_labels
+        """
+        return self.predict_with_embedding(text)[0]
+    
+    def predict_with_embedding(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Run the model once and return both the probabilities and the pooled [CLS] embedding.
+        
+        Args:
+            text: Input text to analyze
+            
+        Returns:
+            Tuple of (per-emotion probabilities, pooled embedding)
+        """
+        probabilities, embeddings = self.predict_encoded(self.tokenization.encode_batch([text]))
+        return probabilities[0], embeddings[0]
+    
+    def predict_with_embedding_space(self, text: str) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
+        """
+        predict_with_embedding, also naming the space the embedding lives in.
+        
+        None is the model's final pooler. Classifiers that can return
+        embeddings from elsewhere (an exit head, another model) name that
+        source; embeddings from different spaces must not be compared,
+        stored side by side or used as one cache key.
+        
+        Args:
+            text: Input text to analyze
+            
+        Returns:
+            Tuple of (per-emotion probabilities, pooled embedding, embedding space)
+        """
+        probabilities, embedding = self.predict_with_embedding(text)
+        return probabilities, embedding, None
+    
+    def predict_encoded(self, batch: TokenizedBatch) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Run the model on an already tokenized batch.
+        
+        Args:
+            batch: Output of self.tokenization.encode_batch
+            
+        Returns:
+            Tuple of (N × labels probabilities, N × hidden pooled embeddings)
+        """
+        if getattr(self, 'static_graphs', None) is not None:
+            return self.static_graphs.run(batch)
+        
+        inputs = batch.to_tensors(self.device)
+        
+        # Same computation as BertForSequenceClassification.forward, keeping
+        # the pooled output that feeds the classification head
+        with torch.no_grad():
+            pooled = self.model.bert(**inputs).pooler_output
+            logits = self.model.classifier(self.model.dropout(pooled))
+            
+            # Apply sigmoid to get probabilities
+            return torch.sigmoid(logits).cpu().numpy(), pooled.cpu().numpy()
+    
+    # Word attribution needs the attention weights of the local model
+    supports_attribution = True
+    
+    def predict_with_attribution(self, text: str) -> Tuple[np.ndarray, np.ndarray, Dict]:
+        """
+        Run the model once and also return word-level emotion attribution.
+        
+        The attention weights and token hidden states come from the same
+        forward pass (see attribution.py); the extra cost is the rollout and
+        one pooler + classifier projection over the tokens.
+        
+        Args:
+            text: Input text to analyze
+            
+        Returns:
+            Tuple of (per-emotion probabilities, pooled embedding, word attribution)
+        """
+        batch = self.tokenization.encode_batch([text])
+        inputs = batch.to_tensors(self.device)
+        
+        with torch.no_grad():
+            outputs = self.model.bert(**inputs, output_attentions=True)
+            pooled = outputs.pooler_output
+            logits = self.model.classifier(self.model.dropout(pooled))
+            
+            # Logits the head would give each token's hidden state on its own
+            pooler = self.model.bert.pooler
+            token_logits = self.model.classifier(pooler.activation(pooler.dense(outputs.last_hidden_state)))
+            
+            probabilities = torch.sigmoid(logits).cpu().numpy()[0]
+            attentions = torch.stack([layer[0].mean(dim=0) for layer in outputs.attentions]).cpu().numpy()
+            attribution = word_attribution(batch.items[0], attentions, token_logits[0].cpu().numpy())
+            return probabilities, pooled.cpu().numpy()[0], attribution
+    
+    def predict_batch_with_embedding(
+        self,
+        texts: List[str],
+        batch_size: int = 32
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Batched version of predict_with_embedding.
+        
+        Texts are sorted by length so each padded batch holds similar lengths
+        and each batch is tokenized in one call; rows are returned in the
+        input order.
+        
+        Args:
+            texts: Input texts
+            batch_size: Texts per forward pass
+            
+        Returns:
+            Tuple of (N × labels probabilities, N × hidden pooled embeddings)
+        """
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        probabilities = np.zeros((len(texts), len(self.emotion_labels)), dtype=np.float32)
+        embeddings = np.zeros((len(texts), self.model.config.hidden_size), dtype=np.float32)
+        
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            batch = self.tokenization.encode_batch([texts[i] for i in rows])
+            probabilities[rows], embeddings[rows] = self.predict_encoded(batch)
+        
+        return probabilities, embeddings
+    
+    def classify_emotion(
+        self,
+        text: str,
+        top_k: int = 5,
+        threshold: Optional[float] = None,
+        probabilities: Optional[np.ndarray] = None
+    ) -> Dict:
         """
         Classify emotions in the given text.
         
         Args:
             text: Input text to analyze
             top_k: Number of top emotions to return
+            threshold: Optional threshold override (defaults to self.threshold)
+            probabilities: Optional precomputed probability vector, skips inference
             
         Returns:
             Dictionary containing emotion analysis results
         """
+        if threshold is None:
+            threshold = self.threshold
+        
         if not text or not text.strip():
             return {
                 "text": text,
@@ -118,22 +272,8 @@ class EmotionClassifier:
             }
         
         try:
-            # Tokenize input
-            inputs = self.tokenizer(
-                text,
-                truncation=True,
-                padding=True,
-                max_length=128,
-                return_tensors='pt'
-            ).to(self.device)
-            
-            # Get model predictions
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                logits = outputs.logits
-                
-                # Apply sigmoid to get probabilities
-                probabilities = torch.sigmoid(logits).cpu().numpy()[0]
+            if probabilities is None:
+                probabilities = self.predict_probabilities(text)
             
             # Create emotion-confidence mapping
             emotion_scores = {
@@ -148,7 +288,7 @@ class EmotionClassifier:
                     "confidence": score
                 }
                 for emotion, score in emotion_scores.items()
-                if score >= self.threshold
+                if score >= threshold
             ]
             
             # Sort by confidence
@@ -166,7 +306,7 @@ class EmotionClassifier:
                 "top_emotion": top_emotion,
                 "confidence_scores": emotion_scores,
                 "detected_emotions_count": len(detected_emotions),
-                "threshold_used": self.threshold
+                "threshold_used": threshold
             }
             
         except Exception as e:
@@ -191,11 +331,11 @@ class EmotionClassifier:
         Returns:
             List of emotion analysis results
         """
-        results = []
-        for text in texts:
-            result = self.classify_emotion(text, top_k)
-            results.append(result)
-        return results
+        probabilities, _ = self.predict_batch_with_embedding(texts)
+        return [
+            self.classify_emotion(text, top_k, probabilities=probabilities[i])
+            for i, text in enumerate(texts)
+        ]
     
     def get_emotion_summary(self, text: str) -> str:
         """
@@ -229,6 +369,138 @@ class EmotionClassifier:
         
         return summary
 
+class EarlyExitEmotionClassifier(EmotionClassifier):
+    """
+    EmotionClassifier that stops at the first confident exit head
+    (see early_exit.py). Falls back to full depth when the model has no
+    exit heads.
+    
+    Word attribution still runs the full-depth model.
+    """
+    
+    def __init__(
+        self,
+        model_path: str = 'models/bert_emotion_model',
+        threshold: float = 0.3,
+        criterion: Optional[str] = None,
+        exit_threshold: Optional[float] = None
+    ):
+        """
+        Initialize the early-exit classifier.
+        
+        Args:
+            model_path: Path to the trained model with exit heads
+            threshold: Confidence threshold for emotion detection
+            criterion: Exit criterion (default: from the environment or the model)
+            exit_threshold: Exit criterion threshold
+        """
+        self.criterion = criterion
+        self.exit_threshold = exit_threshold
+        self._exit_lock = threading.Lock()
+        self._exit_counts = {'texts': 0, 'layers': 0, 'early': 0}
+        super().__init__(model_path=model_path, threshold=threshold)
+    
+    def _load_model(self):
+        super()._load_model()
+        self.early_exit = load_early_exit(self.model, self.model_path, self.criterion, self.exit_threshold)
+        if self.early_exit is None:
+            print(f"⚠️ No exit heads in {self.model_path}; running all layers")
+            print("   Train them with: python scripts/train_early_exit.py")
+        else:
+            print(f"⚡ Early exit after layers {self.early_exit.exit_layers} "
+                  f"({self.early_exit.criterion} @ {self.early_exit.threshold})")
+    
+    def _exit_encoded(self, batch: TokenizedBatch) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Probabilities, pooled embeddings and the layer each row exited after."""
+        inputs = batch.to_tensors(self.device)
+        probabilities, pooled, layers = self.early_exit.exit_forward(inputs['input_ids'], inputs['attention_mask'])
+        layers = layers.cpu().numpy()
+        with self._exit_lock:
+            self._exit_counts['texts'] += len(layers)
+            self._exit_counts['layers'] += int(layers.sum())
+            self._exit_counts['early'] += int((layers < self.early_exit.num_layers).sum())
+        return probabilities.cpu().numpy(), pooled.cpu().numpy(), layers
+    
+    def predict_encoded(self, batch: TokenizedBatch) -> Tuple[np.ndarray, np.ndarray]:
+        if self.early_exit is None:
+            return super().predict_encoded(batch)
+        return self._exit_encoded(batch)[:2]
+    
+    def predict_with_embedding_space(self, text: str) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
+        """
+        Texts that exit early carry the exit head's pooled vector, so their
+        embedding space is named after the layer ('exit4'); full-depth texts
+        use the final pooler (None).
+        """
+        if self.early_exit is None:
+            return super().predict_with_embedding_space(text)
+        probabilities, embeddings, layers = self._exit_encoded(self.tokenization.encode_batch([text]))
+        layer = int(layers[0])
+        return probabilities[0], embeddings[0], None if layer >= self.early_exit.num_layers else f'exit{layer}'
+    
+    def exit_stats(self) -> Dict:
+        """Average layers executed and early-exit rate since startup."""
+        with self._exit_lock:
+            counts = dict(self._exit_counts)
+        if self.early_exit is None:
+            return {'enabled': False}
+        texts = max(counts['texts'], 1)
+        return {
+            'enabled': True,
+            **self.early_exit.describe(),
+            'texts': counts['texts'],
+            'avg_layers': round(counts['layers'] / texts, 2) if counts['texts'] else None,
+            'early_exit_rate': round(counts['early'] / texts, 3)
+        }
+
+class RemoteEmotionClassifier(EmotionClassifier):
+    """
+    EmotionClassifier whose forward pass runs in a shared-memory model server
+    (see model_server.py). Only the tokenizer is loaded in this process.
+    """
+    
+    # The model server returns probabilities and embeddings only
+    supports_attribution = False
+    
+    def __init__(self, client, model_path: Optional[str] = None, threshold: float = 0.3):
+        """
+        Initialize the remote classifier.
+        
+        Args:
+            client: Connected ModelServerClient
+            model_path: Model the caller expects (must match the server's model)
+            threshold: Confidence threshold for emotion detection
+        """
+        self.client = client
+        super().__init__(model_path=model_path or client.model_path, threshold=threshold)
+    
+    def _load_model(self):
+        """Load only the tokenizer; the weights live in the model server."""
+        if os.path.abspath(self.model_path) != self.client.model_path:
+            raise ValueError(
+                f"Model server at {self.client.address} serves {self.client.model_path}, not "
+                f"{self.model_path}; restart it with --model_path {self.model_path}"
+            )
+        self.tokenizer = load_tokenizer(self.model_path)
+        self.tokenization = TokenizationStage(self.tokenizer)
+        self.model = None
+        print(f"✓ Using model server at {self.client.address} ({self.client.info['model_version']})")
+    
+    def _load_emotion_labels(self):
+        self.emotion_labels = list(self.client.labels)
+    
+    def predict_with_embedding(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        return self.client.infer(self.tokenization.encode(text).input_ids)
+    
+    def predict_batch_with_embedding(
+        self,
+        texts: List[str],
+        batch_size: int = 32
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # The server batches across all workers, so submit everything at once
+        batch = self.tokenization.encode_batch(texts)
+        return self.client.infer_many([item.input_ids for item in batch.items])
+
 def demo_classifier():
     """Demonstrate the emotion classifier with example texts."""
     print("🎭 BERT Emotion Classification Demo")
@@ -25,18 +25,22 @@ except ImportError:
     print("Run: python scripts/train.py")
     sys.exit(1)
 
+from trend_store import EmotionTrendStore
+
 class JournalEmotionAnalyzer:
     """
     Integration class for SomaJournal emotion analysis.
     """
     
-    def __init__(self, model_path: str = 'models/bert_emotion_model'):
+    def __init__(self, model_path: str = 'models/bert_emotion_model', trend_store: Optional[EmotionTrendStore] = None):
         """
         Initialize the journal emotion analyzer.
         
         Args:
             model_path: Path to the trained BERT model
+            trend_store: Store for per-user running trend aggregates
         """
+        self.trend_store = trend_store or EmotionTrendStore()
         try:
             self.classifier = EmotionClassifier(model_path=model_path)
             print("✅ Emotion analyzer initialized successfully")
@@ -81,6 +85,7 @@ class JournalEmotionAnalyzer:
             
             if user_id:
                 analysis['user_id'] = user_id
+                self.trend_store.record(user_id, result['emotions'])
             
             return {
                 "status": "success",
@@ -91,6 +96,8 @@ class JournalEmotionAnalyzer:
             }
             
         except Exception as e:
+            if user_id:
+                self.trend_store.record(user_id, [], analyzed=False)
             return {
                 "status": "error",
                 "message": f"Analysis failed: {str(e)}",
@@ -100,12 +107,8 @@ class JournalEmotionAnalyzer:
     
     def _calculate_intensity(self, emotions: List[Dict]) -> float:
         """Calculate overall emotional intensity."""
-        if not emotions:
-            return 0.0
-        
         # Average confidence of detected emotions
-        total_confidence = sum(emotion['confidence'] for emotion in emotions)
-        return total_confidence / len(emotions)
+        return EmotionTrendStore.entry_intensity(emotions)
     
     def _categorize_emotions(self, emotions: List[Dict]) -> Dict:
         """Categorize emotions into positive, negative, and neutral."""
@@ -188,16 +191,31 @@ class JournalEmotionAnalyzer:
             "recommendations": recommendations[:3]  # Top 3 recommendations
         }
     
-    def get_emotion_trends(self, journal_entries: List[str]) -> Dict:
+    def get_emotion_trends(self, journal_entries: Optional[List[str]] = None, user_id: Optional[str] = None) -> Dict:
         """
         Analyze emotion trends across multiple journal entries.
         
+        With a user_id, trends are read from the running aggregates kept by the
+        trend store (updated as each entry is analyzed) without any inference.
+        With a list of entries, each entry is classified (ad-hoc analysis).
+        
         Args:
             journal_entries: List of journal entry texts
+            user_id: User whose recorded entries to summarize
             
         Returns:
             Emotion trend analysis
         """
+        if user_id is not None:
+            trends = self.trend_store.get_trends(user_id)
+            if not trends or not trends['emotion_counts']:
+                return {"error": "No emotions detected in any entries"}
+            
+            trends['trend_summary'] = self._generate_trend_summary(
+                trends['most_frequent_emotions'], trends['average_intensity']
+            )
+            return trends
+        
         if not journal_entries:
             return {"error": "No journal entries provided"}
         
@@ -305,9 +323,9 @@ def demo_integration():
         
         print()
     
-    # Analyze trends
+    # Analyze trends (read from the running aggregates, no re-classification)
     print("📈 Analyzing emotion trends across all entries...")
-    trends = analyzer.get_emotion_trends(sample_entries)
+    trends = analyzer.get_emotion_trends(user_id="demo_user")
     
     if 'error' not in trends:
         print(f"  📊 Most frequent emotions:")
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Load Generator for the Emotion Analysis Endpoints
+
+Replays a configurable mix of quick notes, short entries and detailed
+journals against the Flask server and the Next.js proxy, either open-loop at
+a target request rate (Poisson arrivals) or closed-loop at a fixed
+concurrency, and reports:
+- Latency percentiles and a log-scale latency histogram
+- Error rate by kind (HTTP status, timeout, connection) and fallback rates
+  (Next.js keyword fallback, template-only personalization)
+- With --sweep, a saturation curve (offered load vs. throughput and
+  latency) and the knee: the highest step that still keeps up with the
+  arrival rate, stays under --max_error_rate and keeps p95 within
+  --knee_factor × the first step's p95
+
+Targets:
+    analyze  -> <python_url>/analyze-emotion
+    preview  -> <python_url>/preview-analysis
+    nextjs   -> <nextjs_url>/api/analyze-emotion
+
+Run the server with SOMA_GPT_MOCK=1 to load-test without OpenAI spend.
+
+Usage:
+    python scripts/load_test.py --target analyze --rate 10 --duration 30
+    python scripts/load_test.py --target preview --concurrency 16 --duration 20
+    python scripts/load_test.py --target analyze --sweep 2,4,8,16,32 --duration 20 --output curve.json
+    python scripts/load_test.py --target nextjs --concurrency 8 --mix quick_note=0.6,detailed_journal=0.4
+"""
+
+import json
+import math
+import time
+import random
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+TARGETS = {
+    'analyze': ('python', '/analyze-emotion'),
+    'preview': ('python', '/preview-analysis'),
+    'nextjs': ('nextjs', '/api/analyze-emotion')
+}
+
+# Built-in corpus by adaptive text type
+SAMPLE_TEXTS = {
+    'quick_note': [
+        "Good day",
+        "Feeling tired.",
+        "So grateful for my friends",
+        "Anxious about tomorrow",
+        "Finally some calm",
+        "Ugh, what a mess"
+    ],
+    'short_entry': [
+        "I feel really happy today, the weather is perfect and I went for a long walk.",
+        "Work was stressful and my shoulders are tense, but dinner with my partner helped.",
+        "I miss my grandmother a lot lately. The house feels quiet without her visits.",
+        "Got the promotion! Still can't believe it, I'm excited and a little nervous."
+    ],
+    'detailed_journal': [
+        "Today I woke up feeling incredibly grateful for my family, excited about the new project at work, "
+        "but also nervous about the presentation I have to give. The morning started slowly; I made coffee and "
+        "sat by the window for a while. By lunch my chest felt tight thinking about the meeting, and I kept "
+        "rehearsing the first few slides in my head. The presentation went better than I expected, and my "
+        "manager thanked me afterwards. On the drive home I noticed how much lighter my body felt, and I "
+        "called my sister to tell her about it. I want to remember that the anticipation was worse than the event.",
+        "I've been feeling a bit overwhelmed with work lately and my sleep has been all over the place. The "
+        "weather has been gray for a week and everything feels harder than it should. I snapped at my roommate "
+        "this morning over nothing and felt guilty the rest of the day. At the same time, I finished a painting "
+        "I had been avoiding for months, and seeing it on the wall made me proud. I think I need to slow down, "
+        "go to bed earlier, and apologize properly tomorrow. Writing this down already helps a little."
+    ]
+}
+
+DEFAULT_MIX = {'quick_note': 0.4, 'short_entry': 0.3, 'detailed_journal': 0.3}
+
+# Histogram bucket upper bounds in milliseconds (log-spaced)
+HISTOGRAM_BOUNDS_MS = [5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+def parse_mix(spec: Optional[str]) -> Dict[str, float]:
+    """Parse 'quick_note=0.5,detailed_journal=0.5' into normalized weights."""
+    if not spec:
+        return dict(DEFAULT_MIX)
+    weights = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SAMPLE_TEXTS:
+            raise ValueError(f"Unknown text type '{name}' (expected one of {', '.join(SAMPLE_TEXTS)})")
+        weights[name] = float(weight or 1)
+    total = sum(weights.values())
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def load_corpus(path: Optional[str]) -> Dict[str, List[str]]:
+    """
+    Load texts grouped by type from a JSONL file of {"text", "type"} records,
+    or return the built-in samples.
+    """
+    if not path:
+        return SAMPLE_TEXTS
+    corpus: Dict[str, List[str]] = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                corpus.setdefault(record.get('type', 'short_entry'), []).append(record['text'])
+    return corpus
+
+
+class WorkloadMix:
+    """Draws request bodies according to the text-type mix."""
+
+    def __init__(self, corpus: Dict[str, List[str]], mix: Dict[str, float], seed: int = 0, user_ids: int = 0):
+        self.corpus = {name: texts for name, texts in corpus.items() if texts and mix.get(name, 0) > 0}
+        if not self.corpus:
+            raise ValueError("Workload mix selects no texts")
+        self.names = list(self.corpus)
+        self.weights = [mix[name] for name in self.names]
+        self.user_ids = user_ids
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next(self) -> Tuple[str, Dict[str, Any]]:
+        with self._lock:
+            text_type = self._rng.choices(self.names, self.weights)[0]
+            body = {'text': self._rng.choice(self.corpus[text_type])}
+            if self.user_ids:
+                body['user_id'] = f"load-user-{self._rng.randrange(self.user_ids)}"
+        return text_type, body
+
+
+def send_request(url: str, body: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """
+    POST one request and classify the outcome.
+
+    Returns:
+        Dictionary with latency_ms, ok, error (kind or None) and fallback flags
+    """
+    data = json.dumps(body).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    outcome = {'ok': False, 'error': None, 'keyword_fallback': False, 'template_fallback': False}
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.loads(response.read() or b'{}')
+        outcome['ok'] = True
+        analysis = payload.get('analysis') or {}
+        outcome['keyword_fallback'] = 'fallback' in str(analysis.get('recommended_approach', '')).lower()
+        psychosomatic = payload.get('psychosomatic')
+        if isinstance(psychosomatic, dict):
+            outcome['template_fallback'] = psychosomatic.get('personalization_level') == 'template_based'
+    except urllib.error.HTTPError as e:
+        outcome['error'] = f"http_{e.code}"
+    except (TimeoutError, urllib.error.URLError) as e:
+        reason = getattr(e, 'reason', e)
+        outcome['error'] = 'timeout' if isinstance(reason, TimeoutError) or 'timed out' in str(reason) else 'connection'
+    except Exception:
+        outcome['error'] = 'invalid_response'
+    outcome['latency_ms'] = (time.perf_counter() - start) * 1000
+    return outcome
+
+
+class LoadResults:
+    """Thread-safe collection of request outcomes for one load step."""
+
+    def __init__(self):
+        self.outcomes: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, text_type: str, outcome: Dict[str, Any]):
+        outcome['text_type'] = text_type
+        with self._lock:
+            self.outcomes.append(outcome)
+
+    def summary(self, elapsed: float, offered_rate: Optional[float] = None,
+                send_window: Optional[float] = None) -> Dict[str, Any]:
+        outcomes = list(self.outcomes)
+        total = len(outcomes)
+        ok = [o for o in outcomes if o['ok']]
+        latencies = sorted(o['latency_ms'] for o in ok)
+
+        errors: Dict[str, int] = {}
+        for o in outcomes:
+            if o['error']:
+                errors[o['error']] = errors.get(o['error'], 0) + 1
+
+        by_type = {}
+        for text_type in sorted({o['text_type'] for o in outcomes}):
+            type_latencies = sorted(o['latency_ms'] for o in ok if o['text_type'] == text_type)
+            by_type[text_type] = {
+                'requests': sum(1 for o in outcomes if o['text_type'] == text_type),
+                'p50_ms': percentile(type_latencies, 50),
+                'p95_ms': percentile(type_latencies, 95)
+            }
+
+        return {
+            'offered_rate': offered_rate,
+            'arrival_rate': round(total / send_window, 2) if send_window else None,
+            'requests': total,
+            'elapsed_s': round(elapsed, 2),
+            'throughput_rps': round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+            'error_rate': round((total - len(ok)) / total, 4) if total else 0.0,
+            'errors': errors,
+            'keyword_fallback_rate': round(sum(o['keyword_fallback'] for o in ok) / len(ok), 4) if ok else 0.0,
+            'template_fallback_rate': round(sum(o['template_fallback'] for o in ok) / len(ok), 4) if ok else 0.0,
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies), 1) if latencies else None,
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': round(latencies[-1], 1) if latencies else None
+            },
+            'histogram': histogram(latencies),
+            'by_text_type': by_type
+        }
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[index], 1)
+
+
+def histogram(latencies: List[float]) -> List[Dict[str, Any]]:
+    """Counts per log-spaced latency bucket (upper bound in ms; None is overflow)."""
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for latency in latencies:
+        for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if latency <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    bounds = HISTOGRAM_BOUNDS_MS + [None]
+    return [{'le_ms': bound, 'count': count} for bound, count in zip(bounds, counts)]
+
+
+def run_open_loop(url: str, workload: WorkloadMix, rate: float, duration: float, timeout: float,
+                  max_workers: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Send requests with Poisson arrivals at `rate` per second for `duration` seconds.
+
+    Arrivals are scheduled independently of responses, so a saturated server
+    shows up as rising latency and falling throughput rather than a lower
+    send rate. Requests that cannot get a worker queue in the pool; that
+    queueing time counts towards their latency.
+    """
+    results = LoadResults()
+    rng = random.Random(seed)
+
+    def fire(text_type, body, scheduled):
+        outcome = send_request(url, body, timeout)
+        # Measure from the scheduled arrival, including time spent waiting for a worker
+        outcome['latency_ms'] = (time.perf_counter() - scheduled) * 1000
+        results.add(text_type, outcome)
+
+    start = time.perf_counter()
+    next_arrival = start
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - start >= duration:
+                break
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            text_type, body = workload.next()
+            pool.submit(fire, text_type, body, next_arrival)
+    return results.summary(time.perf_counter() - start, offered_rate=rate, send_window=duration)
+
+
+def run_closed_loop(url: str, workload: WorkloadMix, concurrency: int, duration: float,
+                    timeout: float) -> Dict[str, Any]:
+    """Keep `concurrency` requests in flight for `duration` seconds."""
+    results = LoadResults()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            text_type, body = workload.next()
+            results.add(text_type, send_request(url, body, timeout))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = results.summary(time.perf_counter() - start)
+    summary['concurrency'] = concurrency
+    return summary
+
+
+def find_knee(steps: List[Dict[str, Any]], knee_factor: float = 2.0, max_error_rate: float = 0.01) -> Optional[Dict[str, Any]]:
+    """
+    Highest load step that still keeps up with the offered load.
+
+    A step qualifies when its error rate is at most max_error_rate, its p95 is
+    within knee_factor × the first step's p95, and (open loop) throughput is at
+    least 90% of the rate requests actually arrived at.
+    """
+    baseline = next((s['latency_ms']['p95'] for s in steps if s['latency_ms']['p95'] is not None), None)
+    knee = None
+    for step in steps:
+        p95 = step['latency_ms']['p95']
+        if p95 is None or step['error_rate'] > max_error_rate or p95 > knee_factor * baseline:
+            break
+        if step.get('arrival_rate') and step['throughput_rps'] < 0.9 * step['arrival_rate']:
+            break
+        knee = step
+    return knee
+
+
+def print_summary(title: str, summary: Dict[str, Any]):
+    latency = summary['latency_ms']
+    print(f"\n📊 {title}")
+    print(f"   Requests: {summary['requests']}  Throughput: {summary['throughput_rps']} req/s  "
+          f"Errors: {summary['error_rate']:.1%} {summary['errors'] or ''}")
+    print(f"   Fallbacks: keyword {summary['keyword_fallback_rate']:.1%}, template-only {summary['template_fallback_rate']:.1%}")
+    print(f"   Latency ms: p50 {latency['p50']}  p90 {latency['p90']}  p95 {latency['p95']}  "
+          f"p99 {latency['p99']}  max {latency['max']}")
+
+    peak = max((bucket['count'] for bucket in summary['histogram']), default=0)
+    if peak:
+        for bucket in summary['histogram']:
+            if bucket['count']:
+                label = f"≤{bucket['le_ms']}" if bucket['le_ms'] is not None else f">{HISTOGRAM_BOUNDS_MS[-1]}"
+                bar = '█' * max(1, round(40 * bucket['count'] / peak))
+                print(f"   {label:>7} ms | {bar} {bucket['count']}")
+
+    for text_type, stats in summary['by_text_type'].items():
+        print(f"   {text_type:<17} n={stats['requests']:<6} p50 {stats['p50_ms']}  p95 {stats['p95_ms']}")
+
+
+def print_curve(steps: List[Dict[str, Any]], knee: Optional[Dict[str, Any]], load_key: str):
+    print("\n📈 Saturation curve")
+    print(f"   {'load':>8} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>8}")
+    for step in steps:
+        latency = step['latency_ms']
+        marker = ' ◀ knee' if step is knee else ''
+        print(f"   {step[load_key]:>8} {step['throughput_rps']:>8} {str(latency['p50']):>8} "
+              f"{str(latency['p95']):>8} {str(latency['p99']):>8} {step['error_rate']:>8.1%}{marker}")
+    if knee is None:
+        print("   ⚠️ No step met the knee criteria (first step already saturated?)")
+
+
+def main():
+    """Run the load test."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load-test the emotion analysis endpoints")
+    parser.add_argument('--target', choices=sorted(TARGETS), default='analyze', help='Endpoint to load')
+    parser.add_argument('--python_url', type=str, default='http://localhost:8000', help='Flask server base URL')
+    parser.add_argument('--nextjs_url', type=str, default='http://localhost:3000', help='Next.js base URL')
+    parser.add_argument('--rate', type=float, help='Open loop: target requests per second')
+    parser.add_argument('--concurrency', type=int, help='Closed loop: requests kept in flight')
+    parser.add_argument('--sweep', type=str, help='Comma-separated rates (or concurrencies with --closed) to step through')
+    parser.add_argument('--closed', action='store_true', help='Sweep concurrency instead of rate')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per load step (default: 30)')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds of unrecorded warmup (default: 3)')
+    parser.add_argument('--mix', type=str, help='Text type weights, e.g. quick_note=0.5,detailed_journal=0.5')
+    parser.add_argument('--corpus', type=str, help='JSONL of {"text", "type"} records instead of the built-in samples')
+    parser.add_argument('--user_ids', type=int, default=0, help='Attach user IDs drawn from this many users')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--max_workers', type=int, default=256, help='Open loop: maximum requests in flight')
+    parser.add_argument('--knee_factor', type=float, default=2.0, help='Knee: allowed p95 growth over the first step')
+    parser.add_argument('--max_error_rate', type=float, default=0.01, help='Knee: allowed error rate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, help='Write the results as JSON')
+    args = parser.parse_args()
+
+    base, path = TARGETS[args.target]
+    url = (args.python_url if base == 'python' else args.nextjs_url).rstrip('/') + path
+    workload = WorkloadMix(load_corpus(args.corpus), parse_mix(args.mix), seed=args.seed, user_ids=args.user_ids)
+
+    closed = args.closed or (args.concurrency is not None and args.rate is None)
+    if args.sweep:
+        loads = [float(value) for value in args.sweep.split(',')]
+    elif closed:
+        loads = [args.concurrency or 1]
+    else:
+        loads = [args.rate or 5.0]
+
+    def run_step(load):
+        if closed:
+            return run_closed_loop(url, workload, int(load), args.duration, args.timeout)
+        return run_open_loop(url, workload, load, args.duration, args.timeout, args.max_workers, args.seed)
+
+    print(f"🚀 Load test: {url} ({'concurrency' if closed else 'rate'} {', '.join(f'{load:g}' for load in loads)}, "
+          f"{args.duration:g}s per step)")
+
+    if args.warmup > 0:
+        print(f"🔥 Warming up for {args.warmup:g}s...")
+        if closed:
+            run_closed_loop(url, workload, int(loads[0]), args.warmup, args.timeout)
+        else:
+            run_open_loop(url, workload, loads[0], args.warmup, args.timeout, args.max_workers, args.seed)
+
+    steps = []
+    for load in loads:
+        summary = run_step(load)
+        steps.append(summary)
+        print_summary(f"{'Concurrency' if closed else 'Rate'} {load:g}", summary)
+
+    report = {'url': url, 'mode': 'closed' if closed else 'open', 'steps': steps}
+    if len(steps) > 1:
+        knee = find_knee(steps, args.knee_factor, args.max_error_rate)
+        print_curve(steps, knee, 'concurrency' if closed else 'offered_rate')
+        report['knee'] = knee and {
+            'load': knee['concurrency'] if closed else knee['offered_rate'],
+            'throughput_rps': knee['throughput_rps'],
+            'p95_ms': knee['latency_ms']['p95']
+        }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,6 @@ import json
 import torch
 import pandas as pd
 import numpy as np
-from sklearn.metrics import precision_recall_fscore_support, accuracy_score
 from typing import Dict, List, Tuple
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -31,6 +30,57 @@ except ImportError:
     print("❌ Could not import EmotionClassifier. Please ensure the model is trained.")
     sys.exit(1)
 
+def evaluate_thresholds(probabilities: np.ndarray, labels: np.ndarray, thresholds) -> List[Dict]:
+    """
+    Evaluate many thresholds at once from one set of model outputs.
+    
+    Predictions for every threshold are a single broadcast comparison
+    (thresholds × texts × labels); macro metrics follow sklearn's
+    precision_recall_fscore_support(average='macro', zero_division=0).
+    
+    Args:
+        probabilities: N × labels sigmoid outputs
+        labels: N × labels multi-hot ground truth
+        thresholds: Thresholds to evaluate (an emotion is predicted at score >= threshold)
+        
+    Returns:
+        One metrics dictionary per threshold
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    truth = np.asarray(labels).astype(bool)
+    predictions = np.asarray(probabilities)[None, :, :] >= thresholds[:, None, None]
+    
+    tp = (predictions & truth).sum(axis=1)
+    fp = (predictions & ~truth).sum(axis=1)
+    fn = (~predictions & truth).sum(axis=1)
+    
+    def ratio(numerator, denominator):
+        return np.divide(numerator, denominator, out=np.zeros(numerator.shape), where=denominator > 0)
+    
+    precision = ratio(tp, tp + fp).mean(axis=1)
+    recall = ratio(tp, tp + fn).mean(axis=1)
+    f1 = ratio(2 * tp, 2 * tp + fp + fn).mean(axis=1)
+    subset_accuracy = (predictions == truth).all(axis=2).mean(axis=1)
+    hamming_loss = (predictions != truth).mean(axis=(1, 2))
+    total_predictions = predictions.sum(axis=(1, 2))
+    avg_confidence = float(np.asarray(probabilities).max(axis=1).mean())
+    
+    return [
+        {
+            'threshold': float(threshold),
+            'precision': float(precision[i]),
+            'recall': float(recall[i]),
+            'f1': float(f1[i]),
+            'subset_accuracy': float(subset_accuracy[i]),
+            'hamming_loss': float(hamming_loss[i]),
+            'total_predictions': int(total_predictions[i]),
+            'total_actual': int(truth.sum()),
+            'avg_confidence': avg_confidence,
+            'predictions_per_text': float(total_predictions[i]) / len(truth)
+        }
+        for i, threshold in enumerate(thresholds)
+    ]
+
 class PrecisionOptimizer:
     """
     Optimize confidence thresholds for maximum precision.
@@ -46,6 +96,7 @@ class PrecisionOptimizer:
         self.model_path = model_path
         self.classifier = None
         self.test_data = None
+        self._probabilities = None
         
     def load_model_from_checkpoint(self, checkpoint_path: str):
         """Load model from a specific checkpoint."""
@@ -53,6 +104,7 @@ class PrecisionOptimizer:
         
         try:
             self.classifier = EmotionClassifier(model_path=checkpoint_path)
+            self._probabilities = None
             print("✅ Model loaded successfully")
         except Exception as e:
             print(f"❌ Error loading model: {e}")
@@ -81,6 +133,7 @@ class PrecisionOptimizer:
                 'texts': texts,
                 'labels': labels
             }
+            self._probabilities = None
             
             print(f"✅ Loaded {len(texts)} test examples")
             return True
@@ -89,6 +142,12 @@ class PrecisionOptimizer:
             print(f"❌ Error loading test data: {e}")
             return False
     
+    def _test_probabilities(self) -> np.ndarray:
+        """Model outputs for the test texts, computed once in batches and reused for every threshold."""
+        if self._probabilities is None:
+            self._probabilities, _ = self.classifier.predict_batch_with_embedding(self.test_data['texts'])
+        return self._probabilities
+    
     def evaluate_threshold(self, threshold: float) -> Dict:
         """
         Evaluate model performance at a specific threshold.
@@ -102,60 +161,7 @@ class PrecisionOptimizer:
         if not self.test_data or not self.classifier:
             raise ValueError("Test data and model must be loaded first")
         
-        # Temporarily change classifier threshold
-        original_threshold = self.classifier.threshold
-        self.classifier.threshold = threshold
-        
-        y_true = np.array(self.test_data['labels'])
-        y_pred = []
-        confidence_scores = []
-        
-        # Get predictions for all test examples
-        for text in self.test_data['texts']:
-            result = self.classifier.classify_emotion(text, top_k=28)
-            
-            # Convert to binary vector
-            pred_vector = [0] * 28
-            for emotion in result['emotions']:
-                emotion_idx = self.classifier.emotion_labels.index(emotion['emotion'])
-                pred_vector[emotion_idx] = 1
-            
-            y_pred.append(pred_vector)
-            
-            # Collect confidence scores for analysis
-            scores = result['confidence_scores']
-            max_confidence = max(scores.values()) if scores else 0
-            confidence_scores.append(max_confidence)
-        
-        y_pred = np.array(y_pred)
-        
-        # Calculate metrics
-        precision, recall, f1, _ = precision_recall_fscore_support(
-            y_true, y_pred, average='macro', zero_division=0
-        )
-        
-        subset_accuracy = accuracy_score(y_true, y_pred)
-        hamming_loss = np.mean(y_true != y_pred)
-        
-        # Count predictions
-        total_predictions = np.sum(y_pred)
-        total_actual = np.sum(y_true)
-        
-        # Restore original threshold
-        self.classifier.threshold = original_threshold
-        
-        return {
-            'threshold': threshold,
-            'precision': precision,
-            'recall': recall,
-            'f1': f1,
-            'subset_accuracy': subset_accuracy,
-            'hamming_loss': hamming_loss,
-            'total_predictions': total_predictions,
-            'total_actual': total_actual,
-            'avg_confidence': np.mean(confidence_scores),
-            'predictions_per_text': total_predictions / len(self.test_data['texts'])
-        }
+        return evaluate_thresholds(self._test_probabilities(), self.test_data['labels'], [threshold])[0]
     
     def optimize_thresholds(self, thresholds: List[float] = None) -> pd.DataFrame:
         """
@@ -167,18 +173,18 @@ class PrecisionOptimizer:
         Returns:
             DataFrame with results for each threshold
         """
+        if not self.test_data or not self.classifier:
+            raise ValueError("Test data and model must be loaded first")
+        
         if thresholds is None:
             # Default range from 0.1 to 0.8
             thresholds = [0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8]
         
         print(f"🔍 Testing {len(thresholds)} different thresholds...")
         
-        results = []
-        for threshold in thresholds:
-            print(f"  Testing threshold {threshold:.2f}...", end=" ")
-            result = self.evaluate_threshold(threshold)
-            results.append(result)
-            print(f"Precision: {result['precision']:.3f}, Recall: {result['recall']:.3f}")
+        results = evaluate_thresholds(self._test_probabilities(), self.test_data['labels'], thresholds)
+        for result in results:
+            print(f"  Threshold {result['threshold']:.2f}: Precision: {result['precision']:.3f}, Recall: {result['recall']:.3f}")
         
         df = pd.DataFrame(results)
         return df
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Attention-Head and Layer Pruning with an Accuracy Gate
+
+Shrinks the fine-tuned emotion model structurally, so CPU latency falls with
+the FLOPs removed (no masking at inference time):
+1. Layers are scored on the GoEmotions dev set by how much the dev loss
+   rises when each one is skipped, and the least important are deleted
+2. Attention heads of the remaining layers are scored by the gradient of
+   the dev loss with respect to a head mask (Michel et al., 2019) and the
+   least important are removed with BertModel.prune_heads (their rows in
+   the Q/K/V and output projections are dropped)
+3. Optionally, the pruned model is fine-tuned briefly with the Trainer
+   setup of train.py
+4. Macro precision and F1 at the adaptive thresholds are compared with the
+   original model using the vectorized threshold evaluation of
+   optimize_precision.py; the pruned model is saved only if both stay
+   within the tolerance
+
+The report (scores, FLOPs and measured CPU latency before/after, metrics
+per threshold) is written to outputs/pruning_report.json.
+
+Usage:
+    python scripts/prune_model.py --prune_heads 0.25
+    python scripts/prune_model.py --prune_layers 2 --prune_heads 0.2 --finetune_epochs 1
+    python scripts/prune_model.py --prune_heads 0.4 --tolerance 0.02 --output_dir models/bert_emotion_model_pruned
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import torch
+import numpy as np
+from transformers import BertForSequenceClassification, Trainer, TrainingArguments
+from typing import Dict, List, Any, Tuple
+
+# Add the project root to the path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import from existing training and evaluation scripts
+from scripts.train import (
+    load_data,
+    create_datasets,
+    compute_metrics
+)
+from scripts.optimize_precision import evaluate_thresholds
+from tokenization import TokenizationStage, load_tokenizer
+
+# Thresholds used by the adaptive classifier (quick note → detailed journal)
+GATE_THRESHOLDS = [0.25, 0.35, 0.45, 0.55]
+
+
+def batched(tokenization: TokenizationStage, texts: List[str], labels: np.ndarray, batch_size: int):
+    """Length-sorted batches of (row indices, TokenizedBatch, label tensor)."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        rows = order[start:start + batch_size]
+        yield rows, tokenization.encode_batch([texts[i] for i in rows]), torch.tensor(labels[rows], dtype=torch.float)
+
+
+def predict_probabilities(model, tokenization: TokenizationStage, texts: List[str], batch_size: int = 64) -> np.ndarray:
+    """Sigmoid outputs for all texts (N × labels)."""
+    device = next(model.parameters()).device
+    probabilities = np.zeros((len(texts), model.config.num_labels), dtype=np.float32)
+    dummy = np.zeros((len(texts), model.config.num_labels))
+    model.eval()
+    with torch.no_grad():
+        for rows, batch, _ in batched(tokenization, texts, dummy, batch_size):
+            logits = model(**batch.to_tensors(device)).logits
+            probabilities[rows] = torch.sigmoid(logits).cpu().numpy()
+    return probabilities
+
+
+def dev_loss(model, tokenization: TokenizationStage, texts: List[str], labels: np.ndarray, batch_size: int = 64) -> float:
+    device = next(model.parameters()).device
+    loss_fn = torch.nn.BCEWithLogitsLoss(reduction='sum')
+    total = 0.0
+    model.eval()
+    with torch.no_grad():
+        for _, batch, targets in batched(tokenization, texts, labels, batch_size):
+            logits = model(**batch.to_tensors(device)).logits
+            total += loss_fn(logits, targets.to(device)).item()
+    return total / (len(texts) * model.config.num_labels)
+
+
+def score_layers(model, tokenization: TokenizationStage, texts: List[str], labels: np.ndarray) -> List[float]:
+    """
+    Importance of every encoder layer: dev loss increase when it is skipped.
+
+    Returns:
+        One score per layer (higher = more important)
+    """
+    layers = model.bert.encoder.layer
+    baseline = dev_loss(model, tokenization, texts, labels)
+    scores = []
+    for index in range(len(layers)):
+        model.bert.encoder.layer = torch.nn.ModuleList([layer for i, layer in enumerate(layers) if i != index])
+        scores.append(dev_loss(model, tokenization, texts, labels) - baseline)
+        print(f"   layer {index + 1:>2}: +{scores[-1]:.5f} loss when skipped")
+    model.bert.encoder.layer = layers
+    return scores
+
+
+def remove_layers(model, layer_indices: List[int]):
+    """Delete encoder layers (0-based) in place; the saved config records the new depth."""
+    keep = [layer for i, layer in enumerate(model.bert.encoder.layer) if i not in set(layer_indices)]
+    model.bert.encoder.layer = torch.nn.ModuleList(keep)
+    model.config.num_hidden_layers = len(keep)
+
+
+def score_heads(model, tokenization: TokenizationStage, texts: List[str], labels: np.ndarray, batch_size: int = 32) -> np.ndarray:
+    """
+    Importance of every attention head: accumulated |d loss / d head_mask|.
+
+    Scores are L2-normalized per layer, as in Michel et al. (2019).
+
+    Returns:
+        layers × heads array (higher = more important)
+    """
+    device = next(model.parameters()).device
+    config = model.config
+    head_mask = torch.ones(config.num_hidden_layers, config.num_attention_heads, device=device, requires_grad=True)
+    importance = torch.zeros_like(head_mask)
+    loss_fn = torch.nn.BCEWithLogitsLoss()
+
+    model.eval()
+    for _, batch, targets in batched(tokenization, texts, labels, batch_size):
+        logits = model(**batch.to_tensors(device), head_mask=head_mask).logits
+        loss_fn(logits, targets.to(device)).backward()
+        importance += head_mask.grad.abs().detach()
+        head_mask.grad = None
+        model.zero_grad()
+
+    importance = importance / importance.norm(dim=1, keepdim=True).clamp(min=1e-12)
+    return importance.cpu().numpy()
+
+
+def select_heads(importance: np.ndarray, fraction: float) -> Dict[int, List[int]]:
+    """Least important heads overall, keeping at least one head per layer."""
+    layers, heads = importance.shape
+    budget = int(round(fraction * layers * heads))
+    remaining = {layer: heads for layer in range(layers)}
+    selected: Dict[int, List[int]] = {}
+    for flat in np.argsort(importance, axis=None):
+        if budget == 0:
+            break
+        layer, head = divmod(int(flat), heads)
+        if remaining[layer] == 1:
+            continue
+        selected.setdefault(layer, []).append(head)
+        remaining[layer] -= 1
+        budget -= 1
+    return selected
+
+
+def estimate_flops(model, seq_len: int) -> float:
+    """Multiply-accumulates of the encoder for one sequence of seq_len tokens."""
+    hidden = model.config.hidden_size
+    total = 0.0
+    for layer in model.bert.encoder.layer:
+        attention_dim = layer.attention.self.all_head_size
+        total += seq_len * hidden * attention_dim * 3                # Q, K, V projections
+        total += seq_len * seq_len * attention_dim * 2               # scores and weighted values
+        total += seq_len * attention_dim * hidden                    # output projection
+        total += seq_len * hidden * layer.intermediate.dense.out_features * 2  # feed-forward
+    return total
+
+
+def measure_latency(model, tokenization: TokenizationStage, texts: List[str], repeat: int = 3) -> Dict[str, float]:
+    """CPU latency per text, one text at a time (the API path)."""
+    model = model.to('cpu').eval()
+    batches = [tokenization.encode_batch([text]).to_tensors() for text in texts]
+    timings = []
+    with torch.no_grad():
+        for inputs in batches[:5]:
+            model(**inputs)
+        for _ in range(repeat):
+            for inputs in batches:
+                start = time.perf_counter()
+                model(**inputs)
+                timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'mean_ms': round(float(np.mean(timings)), 2),
+        'p50_ms': round(float(np.percentile(timings, 50)), 2),
+        'p95_ms': round(float(np.percentile(timings, 95)), 2)
+    }
+
+
+def finetune(model, tokenizer, epochs: int, lr: float):
+    """Brief recovery fine-tuning with the train.py datasets and metrics."""
+    train_data, val_data, test_data = load_data()
+    train_dataset, val_dataset, _ = create_datasets(train_data, val_data, test_data, tokenizer)
+    os.makedirs('outputs/pruning_finetune', exist_ok=True)
+    training_args = TrainingArguments(
+        output_dir='outputs/pruning_finetune',
+        num_train_epochs=epochs,
+        learning_rate=lr,
+        per_device_train_batch_size=16,
+        per_device_eval_batch_size=16,
+        gradient_accumulation_steps=2,
+        warmup_ratio=0.06,
+        weight_decay=0.01,
+        logging_steps=100,
+        eval_strategy="epoch",
+        save_strategy="no",
+        report_to=None,
+        seed=42,
+        fp16=torch.cuda.is_available()
+    )
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=val_dataset,
+        compute_metrics=compute_metrics
+    )
+    print(f"🚀 Fine-tuning the pruned model for {epochs} epoch(s)...")
+    trainer.train()
+    return trainer.model
+
+
+def gate(baseline: List[Dict], pruned: List[Dict], tolerance: float) -> Tuple[bool, List[Dict[str, Any]]]:
+    """Macro precision and F1 of the pruned model may drop by at most `tolerance` at every threshold."""
+    rows = []
+    for before, after in zip(baseline, pruned):
+        precision_drop = before['precision'] - after['precision']
+        f1_drop = before['f1'] - after['f1']
+        rows.append({
+            'threshold': before['threshold'],
+            'precision': [round(before['precision'], 4), round(after['precision'], 4)],
+            'f1': [round(before['f1'], 4), round(after['f1'], 4)],
+            'passed': precision_drop <= tolerance and f1_drop <= tolerance
+        })
+    return all(row['passed'] for row in rows), rows
+
+
+def main():
+    """Score, prune, optionally fine-tune, gate and save."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prune attention heads and layers of the emotion model")
+    parser.add_argument('--model_path', type=str, default='models/bert_emotion_model')
+    parser.add_argument('--output_dir', type=str, default='models/bert_emotion_model_pruned')
+    parser.add_argument('--prune_heads', type=float, default=0.25, help='Fraction of attention heads to remove')
+    parser.add_argument('--prune_layers', type=int, default=0, help='Number of encoder layers to remove')
+    parser.add_argument('--score_samples', type=int, default=2000, help='Dev examples used for importance scores')
+    parser.add_argument('--finetune_epochs', type=int, default=0, help='Recovery fine-tuning epochs (0 = none)')
+    parser.add_argument('--lr', type=float, default=2e-5)
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Max macro precision/F1 drop allowed')
+    parser.add_argument('--thresholds', type=str, default=','.join(map(str, GATE_THRESHOLDS)))
+    parser.add_argument('--latency_samples', type=int, default=200)
+    args = parser.parse_args()
+
+    print("✂️ Pruning the Emotion Model")
+    print("=" * 50)
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    tokenizer = load_tokenizer(args.model_path)
+    tokenization = TokenizationStage(tokenizer)
+    original = BertForSequenceClassification.from_pretrained(args.model_path).to(device)
+    model = BertForSequenceClassification.from_pretrained(args.model_path).to(device)
+
+    _, (dev_texts, dev_labels), _ = load_data()
+    dev_texts = [str(text) for text in dev_texts]
+    dev_labels = np.array(dev_labels)
+    score_texts, score_labels = dev_texts[:args.score_samples], dev_labels[:args.score_samples]
+    thresholds = [float(t) for t in args.thresholds.split(',')]
+    seq_len = int(np.mean([len(tokenization.encode(text)) for text in dev_texts[:1000]]))
+    report: Dict[str, Any] = {'model_path': args.model_path, 'seq_len_for_flops': seq_len}
+
+    if args.prune_layers:
+        print(f"📊 Scoring {model.config.num_hidden_layers} layers on {len(score_texts)} dev examples...")
+        layer_scores = score_layers(model, tokenization, score_texts, score_labels)
+        removed_layers = sorted(np.argsort(layer_scores)[:args.prune_layers].tolist())
+        remove_layers(model, removed_layers)
+        report['layer_scores'] = [round(score, 6) for score in layer_scores]
+        report['removed_layers'] = [layer + 1 for layer in removed_layers]
+        print(f"✂️ Removed layers {report['removed_layers']}")
+
+    if args.prune_heads > 0:
+        print(f"📊 Scoring attention heads on {len(score_texts)} dev examples...")
+        head_scores = score_heads(model, tokenization, score_texts, score_labels)
+        heads_to_prune = select_heads(head_scores, args.prune_heads)
+        model.prune_heads(heads_to_prune)
+        report['head_scores'] = np.round(head_scores, 4).tolist()
+        report['pruned_heads'] = {str(layer): sorted(heads) for layer, heads in heads_to_prune.items()}
+        print(f"✂️ Removed {sum(len(h) for h in heads_to_prune.values())} heads")
+
+    if args.finetune_epochs:
+        model = finetune(model, tokenizer, args.finetune_epochs, args.lr).to(device)
+
+    print("📊 Evaluating on the dev set...")
+    baseline_metrics = evaluate_thresholds(predict_probabilities(original, tokenization, dev_texts), dev_labels, thresholds)
+    pruned_metrics = evaluate_thresholds(predict_probabilities(model, tokenization, dev_texts), dev_labels, thresholds)
+    passed, gate_rows = gate(baseline_metrics, pruned_metrics, args.tolerance)
+
+    flops_before, flops_after = estimate_flops(original, seq_len), estimate_flops(model, seq_len)
+    latency_texts = dev_texts[:args.latency_samples]
+    latency_before = measure_latency(original, tokenization, latency_texts)
+    latency_after = measure_latency(model, tokenization, latency_texts)
+    report.update({
+        'parameters': [sum(p.numel() for p in original.parameters()), sum(p.numel() for p in model.parameters())],
+        'flops_removed': round(1 - flops_after / flops_before, 3),
+        'cpu_latency_before': latency_before,
+        'cpu_latency_after': latency_after,
+        'latency_reduction': round(1 - latency_after['mean_ms'] / latency_before['mean_ms'], 3),
+        'tolerance': args.tolerance,
+        'gate': gate_rows,
+        'passed': passed
+    })
+
+    print("\n🏆 Pruning Results")
+    print("=" * 50)
+    print(f"Parameters:        {report['parameters'][0]:,} → {report['parameters'][1]:,}")
+    print(f"Encoder FLOPs:     -{report['flops_removed']:.1%} (at {seq_len} tokens)")
+    print(f"CPU latency:       {latency_before['mean_ms']}ms → {latency_after['mean_ms']}ms (-{report['latency_reduction']:.1%})")
+    print(f"{'threshold':>10}{'precision':>20}{'macro F1':>20}")
+    for row in gate_rows:
+        print(f"{row['threshold']:>10}{row['precision'][0]:>10.4f} → {row['precision'][1]:<6.4f}"
+              f"{row['f1'][0]:>10.4f} → {row['f1'][1]:<6.4f} {'✅' if row['passed'] else '❌'}")
+
+    os.makedirs('outputs', exist_ok=True)
+    with open('outputs/pruning_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    print("✓ Report saved to outputs/pruning_report.json")
+
+    if not passed:
+        print(f"\n❌ Accuracy gate failed (tolerance {args.tolerance}); pruned model not saved")
+        print("   Try pruning less, or add --finetune_epochs 1")
+        sys.exit(1)
+
+    model.save_pretrained(args.output_dir)
+    tokenizer.save_pretrained(args.output_dir)
+    config_file = os.path.join(args.model_path, 'training_config.json')
+    if os.path.exists(config_file):
+        shutil.copy(config_file, args.output_dir)
+    with open(os.path.join(args.output_dir, 'pruning_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Pruned model saved to {args.output_dir}")
+    print(f"   Hot-swap it in: POST /models/load {{\"model_path\": \"{args.output_dir}\"}}")
+
+
+if __name__ == "__main__":
+    main()
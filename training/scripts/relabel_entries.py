@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Re-label Stored Entries Without Re-running BERT
+
+Applies new decision rules to the probability vectors persisted in an
+EntryVectorStore. Thresholding and top-k selection are vectorized over
+chunks of the memory-mapped store, so millions of entries take seconds.
+
+Decision rules (combinable):
+- --threshold: one global threshold
+- --adaptive: per-entry threshold and max emotions from the current
+  AdaptiveEmotionClassifier.determine_adaptive_parameters
+- --class_thresholds: JSON file of {emotion: threshold} overrides
+
+Usage:
+    python scripts/relabel_entries.py --store data/entry_store --adaptive
+    python scripts/relabel_entries.py --store data/entry_store --threshold 0.35 --top_k 3
+    python scripts/relabel_entries.py --store data/entry_store --class_thresholds thresholds.json --output relabeled.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+from typing import Dict, List, Optional, Iterator, Tuple
+
+# Add the project root to the path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entry_store import EntryVectorStore, FEATURES
+from psychosomatic_mapping import GOEMOTIONS_LABELS
+
+
+def adaptive_parameters(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-row threshold and max emotions from the adaptive classifier's rules.
+
+    Args:
+        features: Rows of stored text characteristics (see FEATURES)
+
+    Returns:
+        Tuple of (thresholds, max_emotions) arrays
+    """
+    from scripts.adaptive_classifier import AdaptiveEmotionClassifier
+
+    thresholds = np.empty(len(features), dtype=np.float32)
+    max_emotions = np.empty(len(features), dtype=np.int64)
+    for i, row in enumerate(features.tolist()):
+        params = AdaptiveEmotionClassifier.determine_adaptive_parameters(dict(zip(FEATURES, row)))
+        thresholds[i] = params['threshold']
+        max_emotions[i] = params['max_emotions']
+    return thresholds, max_emotions
+
+
+def relabel_chunk(
+    probabilities: np.ndarray,
+    thresholds: np.ndarray,
+    max_emotions: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Apply thresholds and top-k selection to a chunk of probability vectors.
+
+    Args:
+        probabilities: N × labels probabilities
+        thresholds: N × labels thresholds (broadcastable)
+        max_emotions: Per-row number of emotions to keep
+
+    Returns:
+        Tuple of (label indices N × K sorted by confidence, validity mask N × K)
+    """
+    k = int(max_emotions.max()) if len(max_emotions) else 0
+    scores = np.where(probabilities >= thresholds, probabilities, -1.0)
+    order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    selected = np.take_along_axis(scores, order, axis=1)
+    valid = (selected >= 0) & (np.arange(k)[None, :] < max_emotions[:, None])
+    return order, valid
+
+
+def relabel_store(
+    store: EntryVectorStore,
+    threshold: float = 0.3,
+    top_k: int = 5,
+    adaptive: bool = False,
+    class_thresholds: Optional[Dict[str, float]] = None,
+    chunk_size: int = 65536
+) -> Iterator[Dict]:
+    """
+    Yield new labels for every stored entry.
+
+    Args:
+        store: Store to relabel
+        threshold: Global threshold (ignored for rows when adaptive is set)
+        top_k: Emotions kept per entry (ignored when adaptive is set)
+        adaptive: Use the adaptive classifier's per-entry parameters
+        class_thresholds: Per-emotion threshold overrides
+        chunk_size: Rows processed per vectorized step
+    """
+    labels = store.labels or GOEMOTIONS_LABELS
+    overrides = np.full(len(labels), np.nan, dtype=np.float32)
+    for emotion, value in (class_thresholds or {}).items():
+        if emotion not in labels:
+            raise ValueError(f"Unknown emotion in class thresholds: {emotion}")
+        overrides[labels.index(emotion)] = value
+    has_override = ~np.isnan(overrides)
+
+    for start in range(0, len(store), chunk_size):
+        end = min(start + chunk_size, len(store))
+        probabilities = np.asarray(store.probabilities[start:end], dtype=np.float32)
+
+        if adaptive:
+            row_thresholds, max_emotions = adaptive_parameters(store.features[start:end])
+        else:
+            row_thresholds = np.full(end - start, threshold, dtype=np.float32)
+            max_emotions = np.full(end - start, top_k, dtype=np.int64)
+
+        thresholds = np.where(has_override[None, :], overrides[None, :], row_thresholds[:, None])
+        order, valid = relabel_chunk(probabilities, thresholds, max_emotions)
+
+        for i in range(end - start):
+            record = store.records[start + i]
+            yield {
+                'id': record['id'],
+                'user_id': record.get('user_id'),
+                'model_version': record.get('model_version'),
+                'emotions': [
+                    {'emotion': labels[j], 'confidence': round(float(probabilities[i, j]), 4)}
+                    for j in order[i][valid[i]]
+                ]
+            }
+
+
+def main():
+    """Main function for relabeling stored entries."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-apply decision rules to stored probability vectors")
+    parser.add_argument('--store', type=str, default='data/entry_store', help='Entry store directory')
+    parser.add_argument('--threshold', type=float, default=0.3, help='Global threshold (default: 0.3)')
+    parser.add_argument('--top_k', type=int, default=5, help='Emotions kept per entry (default: 5)')
+    parser.add_argument('--adaptive', action='store_true', help='Use adaptive per-entry parameters')
+    parser.add_argument('--class_thresholds', type=str, help='JSON file of per-emotion thresholds')
+    parser.add_argument('--output', type=str, help='Write relabeled entries as JSONL')
+
+    args = parser.parse_args()
+
+    print("🏷️ Entry Relabeling")
+    print("=" * 50)
+
+    if not os.path.exists(os.path.join(args.store, 'meta.json')):
+        print(f"❌ No entry store found at {args.store}")
+        sys.exit(1)
+
+    store = EntryVectorStore(args.store)
+    class_thresholds = None
+    if args.class_thresholds:
+        with open(args.class_thresholds, 'r') as f:
+            class_thresholds = json.load(f)
+
+    print(f"📦 {len(store)} stored entries")
+
+    start = time.perf_counter()
+    emotion_counts: Dict[str, int] = {}
+    total_emotions = 0
+    output = open(args.output, 'w') if args.output else None
+    try:
+        for entry in relabel_store(
+            store,
+            threshold=args.threshold,
+            top_k=args.top_k,
+            adaptive=args.adaptive,
+            class_thresholds=class_thresholds
+        ):
+            total_emotions += len(entry['emotions'])
+            for emotion in entry['emotions']:
+                emotion_counts[emotion['emotion']] = emotion_counts.get(emotion['emotion'], 0) + 1
+            if output:
+                output.write(json.dumps(entry) + '\n')
+    finally:
+        if output:
+            output.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"✓ Relabeled {len(store)} entries in {elapsed:.2f}s")
+    print(f"   Mean emotions per entry: {total_emotions / max(len(store), 1):.2f}")
+    print("   Most frequent emotions:")
+    for emotion, count in sorted(emotion_counts.items(), key=lambda x: x[1], reverse=True)[:5]:
+        print(f"   • {emotion}: {count}")
+    if args.output:
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Early-Exit Head Training and Evaluation
+
+Extends train.py: loads the fine-tuned emotion model, adds exit heads after
+selected encoder layers (see early_exit.py) and trains them on GoEmotions.
+By default the backbone is frozen, so the full-depth predictions are
+unchanged and only the heads are learned (minutes, not hours); --joint also
+fine-tunes the backbone with a depth-weighted loss over all heads.
+
+After training, every requested criterion/threshold is evaluated on the
+GoEmotions test split one text at a time (the API path) and reported as
+macro F1, average layers executed and latency saving against the full
+12-layer model, overall and per text type.
+
+Usage:
+    python scripts/train_early_exit.py
+    python scripts/train_early_exit.py --exit_layers 2,4,6,8,10 --epochs 2
+    python scripts/train_early_exit.py --joint --output_dir models/bert_emotion_model_early_exit
+    python scripts/train_early_exit.py --report_only --criterion entropy --thresholds 0.3,0.5,0.7 --apply
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import torch
+import numpy as np
+from sklearn.metrics import precision_recall_fscore_support
+from transformers import BertForSequenceClassification, Trainer, TrainingArguments
+from typing import Dict, List, Any, Optional
+
+# Add the project root to the path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import from existing training script
+from scripts.train import (
+    load_data,
+    create_datasets
+)
+from early_exit import (
+    EarlyExitBert,
+    DEFAULT_EXIT_LAYERS,
+    load_early_exit,
+    save_exit_heads,
+    update_exit_config
+)
+from tokenization import TokenizationStage, load_tokenizer
+
+DEFAULT_THRESHOLDS = {
+    'max_prob': [0.8, 0.9, 0.95],
+    'entropy': [0.3, 0.5, 0.7],
+    'patience': [2, 3, 4]
+}
+
+
+def make_exit_metrics(exit_layers: List[int], num_layers: int):
+    """compute_metrics for the Trainer: macro F1 of every exit head at 0.5."""
+    names = [f'layer_{layer}' for layer in exit_layers] + [f'layer_{num_layers}']
+
+    def compute_exit_metrics(eval_pred):
+        logits, labels = eval_pred
+        labels = labels.astype(int)
+        probabilities = 1 / (1 + np.exp(-logits))
+        metrics = {}
+        for i, name in enumerate(names):
+            _, _, f1, _ = precision_recall_fscore_support(
+                labels, (probabilities[:, i] > 0.5).astype(int), average='macro', zero_division=0
+            )
+            metrics[f'f1_{name}'] = f1
+        # Heads are selected on their average F1
+        metrics['f1'] = float(np.mean([metrics[f'f1_{name}'] for name in names[:-1]]))
+        return metrics
+
+    return compute_exit_metrics
+
+
+def setup_exit_training_args(output_dir: str, epochs: int, lr: float) -> TrainingArguments:
+    """
+    Training arguments for the exit heads.
+
+    Args:
+        output_dir: Directory for logs and checkpoints
+        epochs: Number of epochs
+        lr: Learning rate (heads alone tolerate a much higher rate)
+
+    Returns:
+        TrainingArguments object
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    return TrainingArguments(
+        output_dir=output_dir,
+        num_train_epochs=epochs,
+        learning_rate=lr,
+        per_device_train_batch_size=32,
+        per_device_eval_batch_size=64,
+        warmup_ratio=0.06,
+        weight_decay=0.01,
+        logging_steps=100,
+        eval_strategy="epoch",
+        save_strategy="no",
+        report_to=None,
+        seed=42,
+        fp16=torch.cuda.is_available()
+    )
+
+
+def train_exit_heads(
+    model_path: str,
+    exit_layers: List[int],
+    epochs: int,
+    lr: Optional[float],
+    joint: bool
+) -> EarlyExitBert:
+    """
+    Add exit heads to the fine-tuned model and train them.
+
+    Args:
+        model_path: Fine-tuned model directory
+        exit_layers: Layers followed by an exit head
+        epochs: Training epochs
+        lr: Learning rate (default 5e-4 for heads only, 2e-5 for joint training)
+        joint: Also fine-tune the backbone
+
+    Returns:
+        Trained EarlyExitBert
+    """
+    train_data, val_data, test_data = load_data()
+
+    print(f"🤖 Loading fine-tuned model from {model_path}...")
+    tokenizer = load_tokenizer(model_path)
+    model = BertForSequenceClassification.from_pretrained(model_path)
+    exit_model = EarlyExitBert(model, exit_layers)
+    if not joint:
+        exit_model.freeze_backbone()
+    trainable = sum(p.numel() for p in exit_model.parameters() if p.requires_grad)
+    print(f"✓ Exit heads after layers {exit_model.exit_layers} ({trainable:,} trainable parameters)")
+
+    train_dataset, val_dataset, _ = create_datasets(train_data, val_data, test_data, tokenizer)
+    training_args = setup_exit_training_args(
+        'outputs/early_exit_training', epochs, lr or (2e-5 if joint else 5e-4)
+    )
+
+    trainer = Trainer(
+        model=exit_model,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=val_dataset,
+        compute_metrics=make_exit_metrics(exit_model.exit_layers, exit_model.num_layers)
+    )
+
+    print(f"🚀 Training exit heads ({'joint' if joint else 'frozen backbone'})...")
+    trainer.train()
+    metrics = trainer.evaluate()
+    print("\n📊 Validation macro F1 per exit:")
+    for name, value in metrics.items():
+        if name.startswith('eval_f1_layer_'):
+            print(f"   {name.replace('eval_f1_', ''):<10} {value:.4f}")
+
+    exit_model.eval()
+    return exit_model
+
+
+def text_type(text: str) -> str:
+    """Word-count buckets of AdaptiveEmotionClassifier._categorize_text_type."""
+    word_count = len(text.split())
+    if word_count < 10:
+        return "quick_note"
+    elif word_count < 30:
+        return "short_entry"
+    elif word_count < 100:
+        return "medium_entry"
+    return "detailed_journal"
+
+
+def run_test_split(
+    exit_model: EarlyExitBert,
+    tokenization: TokenizationStage,
+    texts: List[str],
+    criterion: str,
+    threshold: float
+) -> Dict[str, np.ndarray]:
+    """Classify the texts one at a time, recording probabilities, exit layer and latency."""
+    device = next(exit_model.parameters()).device
+    probabilities, layers, latencies = [], [], []
+    for text in texts:
+        inputs = tokenization.encode_batch([text]).to_tensors(device)
+        start = time.perf_counter()
+        probs, _, layer = exit_model.exit_forward(
+            inputs['input_ids'], inputs['attention_mask'], criterion=criterion, threshold=threshold
+        )
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        latencies.append((time.perf_counter() - start) * 1000)
+        probabilities.append(probs[0].cpu().numpy())
+        layers.append(int(layer[0]))
+    return {
+        'probabilities': np.array(probabilities),
+        'layers': np.array(layers),
+        'latency_ms': np.array(latencies)
+    }
+
+
+def summarize(run: Dict[str, np.ndarray], labels: np.ndarray, decision_threshold: float) -> Dict[str, float]:
+    predictions = (run['probabilities'] > decision_threshold).astype(int)
+    _, _, f1, _ = precision_recall_fscore_support(labels, predictions, average='macro', zero_division=0)
+    return {
+        'macro_f1': round(float(f1), 4),
+        'avg_layers': round(float(run['layers'].mean()), 2),
+        'mean_latency_ms': round(float(run['latency_ms'].mean()), 2),
+        'p95_latency_ms': round(float(np.percentile(run['latency_ms'], 95)), 2)
+    }
+
+
+def evaluate_early_exit(
+    exit_model: EarlyExitBert,
+    tokenizer,
+    criterion: str,
+    thresholds: List[float],
+    decision_threshold: float = 0.5,
+    max_samples: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Report layers executed and latency saving against macro F1 on the test split.
+
+    Args:
+        exit_model: EarlyExitBert with trained heads
+        tokenizer: Model tokenizer
+        criterion: Confidence criterion to sweep
+        thresholds: Criterion thresholds to evaluate
+        decision_threshold: Probability threshold for the macro F1 label sets
+        max_samples: Evaluate only the first N test examples
+
+    Returns:
+        Report with the full-depth baseline and one row per threshold
+    """
+    _, _, (texts, label_vectors) = load_data()
+    texts = [str(text) for text in texts[:max_samples]]
+    labels = np.array(label_vectors[:len(texts)])
+    types = np.array([text_type(text) for text in texts])
+    tokenization = TokenizationStage(tokenizer)
+
+    print(f"⏱️ Full-depth baseline on {len(texts)} test examples...")
+    baseline_run = run_test_split(exit_model, tokenization, texts, 'none', 0)
+    baseline = summarize(baseline_run, labels, decision_threshold)
+    baseline_predictions = baseline_run['probabilities'] > decision_threshold
+
+    rows = []
+    for threshold in thresholds:
+        print(f"⏱️ {criterion} threshold {threshold}...")
+        run = run_test_split(exit_model, tokenization, texts, criterion, threshold)
+        row = {'criterion': criterion, 'threshold': threshold, **summarize(run, labels, decision_threshold)}
+        row['f1_drop'] = round(baseline['macro_f1'] - row['macro_f1'], 4)
+        row['latency_saving'] = round(1 - row['mean_latency_ms'] / baseline['mean_latency_ms'], 3)
+        row['layer_saving'] = round(1 - row['avg_layers'] / exit_model.num_layers, 3)
+        # Share of texts whose label set matches the full-depth model's
+        row['agreement'] = round(float(np.mean(
+            ((run['probabilities'] > decision_threshold) == baseline_predictions).all(axis=1)
+        )), 3)
+        row['by_text_type'] = {
+            kind: {
+                'count': int((types == kind).sum()),
+                'avg_layers': round(float(run['layers'][types == kind].mean()), 2),
+                'exit_rate': round(float((run['layers'][types == kind] < exit_model.num_layers).mean()), 3)
+            }
+            for kind in ('quick_note', 'short_entry', 'medium_entry', 'detailed_journal')
+            if (types == kind).any()
+        }
+        rows.append(row)
+
+    return {
+        'exit_layers': exit_model.exit_layers,
+        'test_examples': len(texts),
+        'decision_threshold': decision_threshold,
+        'baseline': baseline,
+        'results': rows
+    }
+
+
+def recommend(report: Dict[str, Any], max_f1_drop: float) -> Optional[Dict[str, Any]]:
+    """Largest latency saving whose macro F1 drop stays within the budget."""
+    eligible = [row for row in report['results'] if row['f1_drop'] <= max_f1_drop]
+    return max(eligible, key=lambda row: row['latency_saving']) if eligible else None
+
+
+def print_report(report: Dict[str, Any]):
+    baseline = report['baseline']
+    print(f"\n🏆 Early-Exit Report ({report['test_examples']} test examples)")
+    print("=" * 72)
+    print(f"{'criterion':<10}{'thresh':>8}{'macro F1':>10}{'avg layers':>12}{'mean ms':>10}{'saving':>9}{'agree':>8}")
+    print(f"{'full':<10}{'-':>8}{baseline['macro_f1']:>10.4f}{baseline['avg_layers']:>12.2f}"
+          f"{baseline['mean_latency_ms']:>10.2f}{'-':>9}{'-':>8}")
+    for row in report['results']:
+        print(f"{row['criterion']:<10}{row['threshold']:>8}{row['macro_f1']:>10.4f}{row['avg_layers']:>12.2f}"
+              f"{row['mean_latency_ms']:>10.2f}{row['latency_saving']:>8.1%}{row['agreement']:>8.1%}")
+    for row in report['results']:
+        quick = row['by_text_type'].get('quick_note')
+        if quick:
+            print(f"   quick_note @ {row['threshold']}: {quick['avg_layers']} layers, {quick['exit_rate']:.0%} exit early")
+
+
+def main():
+    """Train exit heads and report their accuracy/latency trade-off."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train and evaluate early-exit heads for the emotion model")
+    parser.add_argument('--model_path', type=str, default='models/bert_emotion_model')
+    parser.add_argument('--output_dir', type=str, help='Where to save the model with heads (default: --model_path)')
+    parser.add_argument('--exit_layers', type=str, default=','.join(map(str, DEFAULT_EXIT_LAYERS)))
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--lr', type=float, help='Learning rate (default: 5e-4 heads only, 2e-5 joint)')
+    parser.add_argument('--joint', action='store_true', help='Also fine-tune the backbone (requires --output_dir)')
+    parser.add_argument('--report_only', action='store_true', help='Evaluate heads already saved with the model')
+    parser.add_argument('--criterion', type=str, default='max_prob', choices=sorted(DEFAULT_THRESHOLDS))
+    parser.add_argument('--thresholds', type=str, help='Comma-separated criterion thresholds to evaluate')
+    parser.add_argument('--decision_threshold', type=float, default=0.5, help='Label threshold for macro F1')
+    parser.add_argument('--max_samples', type=int, help='Evaluate only the first N test examples')
+    parser.add_argument('--max_f1_drop', type=float, default=0.01, help='Macro F1 budget for the recommendation')
+    parser.add_argument('--apply', action='store_true', help='Save the recommended criterion/threshold as the default')
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or args.model_path
+    if args.joint and os.path.abspath(output_dir) == os.path.abspath(args.model_path):
+        print("❌ --joint changes the backbone; pass a separate --output_dir")
+        sys.exit(1)
+
+    print("⚡ Early-Exit Heads for the Emotion Model")
+    print("=" * 50)
+
+    if args.report_only:
+        tokenizer = load_tokenizer(output_dir)
+        exit_model = load_early_exit(BertForSequenceClassification.from_pretrained(output_dir), output_dir)
+        if exit_model is None:
+            print(f"❌ No exit heads found in {output_dir}; train them first")
+            sys.exit(1)
+    else:
+        exit_layers = [int(layer) for layer in args.exit_layers.split(',')]
+        exit_model = train_exit_heads(args.model_path, exit_layers, args.epochs, args.lr, args.joint)
+        tokenizer = load_tokenizer(args.model_path)
+        if output_dir != args.model_path:
+            exit_model.model.save_pretrained(output_dir)
+            tokenizer.save_pretrained(output_dir)
+            config_file = os.path.join(args.model_path, 'training_config.json')
+            if os.path.exists(config_file):
+                shutil.copy(config_file, output_dir)
+        save_exit_heads(exit_model, output_dir)
+        print(f"💾 Exit heads saved to {output_dir}")
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    exit_model.to(device)
+    thresholds = (
+        [float(t) for t in args.thresholds.split(',')] if args.thresholds else DEFAULT_THRESHOLDS[args.criterion]
+    )
+    report = evaluate_early_exit(
+        exit_model, tokenizer, args.criterion, thresholds, args.decision_threshold, args.max_samples
+    )
+    print_report(report)
+
+    best = recommend(report, args.max_f1_drop)
+    report['recommended'] = best and {'criterion': best['criterion'], 'threshold': best['threshold']}
+    os.makedirs('outputs', exist_ok=True)
+    with open('outputs/early_exit_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    print("✓ Report saved to outputs/early_exit_report.json")
+
+    if best:
+        print(f"\n✅ Recommended: {best['criterion']} @ {best['threshold']} "
+              f"({best['latency_saving']:.1%} faster, macro F1 -{best['f1_drop']:.4f})")
+        if args.apply:
+            update_exit_config(output_dir, criterion=best['criterion'], threshold=best['threshold'])
+            print(f"💾 Default criterion updated in {output_dir}")
+    else:
+        print(f"\n⚠️ No threshold stays within a macro F1 drop of {args.max_f1_drop}; keep early exit disabled")
+
+
+if __name__ == "__main__":
+    main()
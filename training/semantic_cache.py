@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Semantic Personalization Cache for SomaJournal
+
+Near-duplicate entries (reused templates, daily check-ins with small wording
+changes) would each pay a full GPT personalization round-trip. This cache
+keys prior personalizations by the entry's pooled BERT embedding and reuses
+one when a new entry with the same primary emotion is similar enough.
+
+Entries are grouped into buckets by (scope, model version, primary emotion,
+user context); only vectors within a bucket are compared. The scope is the
+user ID; callers must not use the cache for requests without one, so
+personalizations are never reused across users. Each bucket holds a bounded
+FIFO of unit vectors, and a lookup is a single matrix-vector product.
+
+BERT's tanh pooler outputs are anisotropic (every pair of entries has a high
+raw cosine), so vectors are centered on the mean embedding from
+scripts/calibrate_semantic_cache.py before normalizing, and the threshold
+comes from the same calibration run.
+
+Configuration (environment variables):
+    SOMA_SEMANTIC_CACHE_CALIBRATION  Calibration file (default: models/semantic_cache_calibration.json)
+    SOMA_SEMANTIC_CACHE_THRESHOLD  Override the calibrated cosine threshold
+                                   (default without calibration: 0.95 on raw embeddings)
+    SOMA_SEMANTIC_CACHE_SIZE       Entries kept per bucket (default: 256)
+    SOMA_SEMANTIC_CACHE_BUCKETS    Buckets kept, least recently used evicted (default: 1024)
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+CALIBRATION_PATH = os.getenv('SOMA_SEMANTIC_CACHE_CALIBRATION', 'models/semantic_cache_calibration.json')
+THRESHOLD_OVERRIDE = os.getenv('SOMA_SEMANTIC_CACHE_THRESHOLD')
+UNCALIBRATED_THRESHOLD = 0.95
+DEFAULT_BUCKET_SIZE = int(os.getenv('SOMA_SEMANTIC_CACHE_SIZE', '256'))
+DEFAULT_MAX_BUCKETS = int(os.getenv('SOMA_SEMANTIC_CACHE_BUCKETS', '1024'))
+
+
+def load_calibration(path: str = CALIBRATION_PATH) -> Optional[Dict[str, Any]]:
+    """Calibrated threshold and mean embedding, or None if the file is missing."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        calibration = json.load(f)
+    calibration['mean'] = np.asarray(calibration['mean'], dtype=np.float32)
+    return calibration
+
+
+class SemanticBucket:
+    """Fixed-size FIFO of unit embeddings and their cached payloads."""
+
+    def __init__(self, dim: int, capacity: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.payloads: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self.size = 0
+        self.next = 0
+
+    def best_match(self, vector: np.ndarray) -> Tuple[int, float]:
+        scores = self.vectors[:self.size] @ vector
+        best = int(scores.argmax())
+        return best, float(scores[best])
+
+    def add(self, vector: np.ndarray, payload: Dict[str, Any]):
+        self.vectors[self.next] = vector
+        self.payloads[self.next] = payload
+        self.next = (self.next + 1) % len(self.payloads)
+        self.size = min(self.size + 1, len(self.payloads))
+
+
+class SemanticPersonalizationCache:
+    """
+    Thread-safe embedding-similarity cache of GPT personalizations.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: Optional[float] = None,
+        bucket_size: int = DEFAULT_BUCKET_SIZE,
+        max_buckets: int = DEFAULT_MAX_BUCKETS,
+        calibration: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            similarity_threshold: Minimum cosine similarity to reuse a personalization
+                (default: SOMA_SEMANTIC_CACHE_THRESHOLD, then the calibrated value)
+            bucket_size: Personalizations kept per bucket (oldest replaced first)
+            max_buckets: Buckets kept (least recently used evicted)
+            calibration: Output of load_calibration (default: loaded from CALIBRATION_PATH)
+        """
+        if calibration is None:
+            calibration = load_calibration()
+        self.center = calibration['mean'] if calibration else None
+        if similarity_threshold is None:
+            if THRESHOLD_OVERRIDE:
+                similarity_threshold = float(THRESHOLD_OVERRIDE)
+            elif calibration:
+                similarity_threshold = float(calibration['threshold'])
+            else:
+                similarity_threshold = UNCALIBRATED_THRESHOLD
+        self.similarity_threshold = similarity_threshold
+        self.bucket_size = bucket_size
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Tuple, SemanticBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._hit_similarity_sum = 0.0
+
+    @staticmethod
+    def bucket_key(
+        primary_emotion: str,
+        scope: Optional[str] = None,
+        model_version: Optional[str] = None,
+        user_context: Optional[Dict[str, Any]] = None
+    ) -> Tuple:
+        context_key = json.dumps(user_context, sort_keys=True) if user_context else None
+        return (scope, model_version, primary_emotion, context_key)
+
+    def _unit(self, embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if self.center is not None and self.center.shape == vector.shape:
+            vector = vector - self.center
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, key: Tuple, embedding) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Find a cached personalization for a similar entry in the same bucket.
+
+        Returns:
+            Tuple of (payload, similarity), or None on a miss
+        """
+        vector = self._unit(embedding)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None and bucket.size and bucket.vectors.shape[1] == vector.shape[0]:
+                self._buckets.move_to_end(key)
+                index, similarity = bucket.best_match(vector)
+                if similarity >= self.similarity_threshold:
+                    self.hits += 1
+                    self._hit_similarity_sum += similarity
+                    return bucket.payloads[index], similarity
+            self.misses += 1
+            return None
+
+    def store(self, key: Tuple, embedding, payload: Dict[str, Any]):
+        """Remember a personalization for an entry's embedding."""
+        vector = self._unit(embedding)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.vectors.shape[1] != vector.shape[0]:
+                bucket = self._buckets[key] = SemanticBucket(vector.shape[0], self.bucket_size)
+            self._buckets.move_to_end(key)
+            bucket.add(vector, payload)
+            self.stores += 1
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'similarity_threshold': self.similarity_threshold,
+                'calibrated': self.center is not None,
+                'buckets': len(self._buckets),
+                'entries': sum(bucket.size for bucket in self._buckets.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'mean_hit_similarity': round(self._hit_similarity_sum / self.hits, 4) if self.hits else None
+            }
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Similar Past Entries Search for SomaJournal
+
+Indexes each user's pooled BERT embeddings (produced during classification)
+and answers "times I felt like this before" by cosine similarity:
+- Small histories use an exact vectorized scan
+- Above a size threshold an IVF index (spherical k-means coarse
+  quantizer) is trained and only the nearest lists are probed
+- New entries are added incrementally; the IVF quantizer is retrained
+  only when the history has doubled since the last training
+
+Embeddings from different model versions and spaces (the final pooler, an
+early-exit layer, a routed model) are indexed separately and only searched
+within one version and space: a retrained model's pooler is a different
+vector space even when its shape is unchanged.
+"""
+
+import os
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_IVF_THRESHOLD = int(os.getenv('SOMA_SIMILARITY_IVF_THRESHOLD', '5000'))
+DEFAULT_NPROBE = int(os.getenv('SOMA_SIMILARITY_NPROBE', '8'))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(vectors: np.ndarray, num_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Returns:
+        num_clusters × dim array of unit centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = (vectors @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty clusters with random points
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class UserEmbeddingIndex:
+    """
+    Growable embedding matrix for one user with an optional IVF index.
+    """
+
+    def __init__(self, dim: int, ivf_threshold: int = DEFAULT_IVF_THRESHOLD, initial_capacity: int = 64):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.vectors = np.empty((initial_capacity, dim), dtype=np.float32)
+        self.size = 0
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+
+        # IVF state (None until the history passes the threshold)
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.empty(initial_capacity, dtype=np.int64)
+        self._lists: List[List[int]] = []
+        self._list_arrays: Dict[int, np.ndarray] = {}
+        self._trained_size = 0
+
+    def add(self, entry_id: str, embedding: np.ndarray, metadata: Optional[Dict[str, Any]] = None):
+        vector = normalize(np.asarray(embedding).reshape(-1))
+        row = self._rows.get(entry_id)
+        if row is None:
+            row = self.size
+            self._grow(row + 1)
+            self.ids.append(entry_id)
+            self.metadata.append(metadata or {})
+            self._rows[entry_id] = row
+            self.size += 1
+        else:
+            self.metadata[row] = metadata or self.metadata[row]
+            if self.centroids is not None:
+                old_list = int(self.assignments[row])
+                self._lists[old_list].remove(row)
+                self._list_arrays.pop(old_list, None)
+        self.vectors[row] = vector
+
+        if self.centroids is None:
+            if self.size >= self.ivf_threshold:
+                self.train()
+        elif self.size >= 2 * self._trained_size:
+            self.train()
+        else:
+            list_id = int((self.centroids @ vector).argmax())
+            self.assignments[row] = list_id
+            self._lists[list_id].append(row)
+            self._list_arrays.pop(list_id, None)
+
+    def _grow(self, rows: int):
+        capacity = len(self.vectors)
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        assignments = np.empty(capacity, dtype=np.int64)
+        assignments[:self.size] = self.assignments[:self.size]
+        self.vectors, self.assignments = vectors, assignments
+
+    def train(self, sample_size: int = 20000):
+        """(Re)build the IVF coarse quantizer and inverted lists."""
+        vectors = self.vectors[:self.size]
+        num_lists = max(1, int(np.sqrt(self.size)))
+        if self.size > sample_size:
+            sample = vectors[np.random.default_rng(0).choice(self.size, sample_size, replace=False)]
+        else:
+            sample = vectors
+        self.centroids = spherical_kmeans(sample, num_lists)
+
+        self.assignments[:self.size] = (vectors @ self.centroids.T).argmax(axis=1)
+        self._lists = [[] for _ in range(num_lists)]
+        for row, list_id in enumerate(self.assignments[:self.size].tolist()):
+            self._lists[list_id].append(row)
+        self._list_arrays = {}
+        self._trained_size = self.size
+
+    def _list_rows(self, list_id: int) -> np.ndarray:
+        rows = self._list_arrays.get(list_id)
+        if rows is None:
+            rows = self._list_arrays[list_id] = np.array(self._lists[list_id], dtype=np.int64)
+        return rows
+
+    def search(self, query: np.ndarray, k: int = 5, exclude_id: Optional[str] = None, nprobe: int = DEFAULT_NPROBE):
+        """
+        Find the k most similar entries to a query embedding.
+
+        Returns:
+            List of (row, similarity) pairs, most similar first
+        """
+        if self.size == 0:
+            return []
+        query = normalize(np.asarray(query).reshape(-1))
+
+        if self.centroids is None:
+            candidates = None
+            scores = self.vectors[:self.size] @ query
+        else:
+            probe = np.argsort(-(self.centroids @ query))[:nprobe]
+            candidates = np.concatenate([self._list_rows(int(list_id)) for list_id in probe])
+            scores = self.vectors[candidates] @ query
+
+        exclude_row = self._rows.get(exclude_id) if exclude_id is not None else None
+        if exclude_row is not None:
+            if candidates is None:
+                scores[exclude_row] = -np.inf
+            else:
+                scores[candidates == exclude_row] = -np.inf
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = top if candidates is None else candidates[top]
+        return [(int(row), float(score)) for row, score in zip(rows, scores[top]) if np.isfinite(score)]
+
+
+class SimilarEntryIndex:
+    """
+    Thread-safe per-user similarity search over entry embeddings.
+    """
+
+    def __init__(self, ivf_threshold: int = DEFAULT_IVF_THRESHOLD, nprobe: int = DEFAULT_NPROBE):
+        """
+        Initialize the index.
+
+        Args:
+            ivf_threshold: History size at which a user's index switches from exact scan to IVF
+            nprobe: Number of IVF lists probed per query
+        """
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        # Keyed by (user ID, model version, embedding space)
+        self._users: Dict[Tuple[str, Optional[str], Optional[str]], UserEmbeddingIndex] = {}
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        user_id: str,
+        entry_id: str,
+        embedding,
+        metadata: Optional[Dict[str, Any]] = None,
+        space: Optional[str] = None,
+        model_version: Optional[str] = None
+    ):
+        """
+        Add (or replace) one entry's embedding in the user's index.
+
+        Args:
+            user_id: User identifier
+            entry_id: Entry identifier
+            embedding: Pooled embedding from classification
+            metadata: Small summary returned with search results (timestamp, emotions)
+            space: Embedding space (None for the model's final pooler)
+            model_version: Version of the model that produced the embedding
+        """
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        key = (user_id, model_version, space)
+        with self._lock:
+            index = self._users.get(key)
+            if index is None:
+                index = self._users[key] = UserEmbeddingIndex(embedding.shape[0], self.ivf_threshold)
+            index.add(entry_id, embedding, metadata)
+
+    def search(
+        self,
+        user_id: str,
+        embedding,
+        k: int = 5,
+        exclude_id: Optional[str] = None,
+        space: Optional[str] = None,
+        model_version: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Find a user's most similar past entries embedded by the same model
+        version in the same space.
+
+        Returns:
+            List of {entry_id, similarity, **metadata}, most similar first
+        """
+        with self._lock:
+            index = self._users.get((user_id, model_version, space))
+            if index is None:
+                return []
+            matches = index.search(embedding, k=k, exclude_id=exclude_id, nprobe=self.nprobe)
+            return [
+                {'entry_id': index.ids[row], 'similarity': round(score, 4), **index.metadata[row]}
+                for row, score in matches
+            ]
+
+    def load_from_store(self, store, labels: List[str], threshold: float = 0.3, top_k: int = 3) -> int:
+        """
+        Rebuild user indexes from an EntryVectorStore (e.g. at startup).
+
+        Returns:
+            Number of entries indexed
+        """
+        count = 0
+        embeddings = store.embeddings
+        probabilities = store.probabilities
+        for row, record in enumerate(store.records):
+            if not record.get('user_id'):
+                continue
+            scores = np.asarray(probabilities[row], dtype=np.float32)
+            top = [i for i in np.argsort(-scores)[:top_k] if scores[i] >= threshold]
+            self.add(record['user_id'], record['id'], embeddings[row], {
+                'timestamp': record.get('timestamp'),
+                'emotions': [{'emotion': labels[i], 'confidence': round(float(scores[i]), 3)} for i in top]
+            }, space=record.get('embedding_space'), model_version=record.get('model_version'))
+            count += 1
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = [index.size for index in self._users.values()]
+            return {
+                'users': len({user_id for user_id, _, _ in self._users}),
+                'model_versions': sorted({version or 'unknown' for _, version, _ in self._users}),
+                'spaces': sorted({space or 'final' for _, _, space in self._users}),
+                'entries': int(sum(sizes)),
+                'ivf_users': sum(1 for index in self._users.values() if index.centroids is not None),
+                'ivf_threshold': self.ivf_threshold,
+                'nprobe': self.nprobe
+            }
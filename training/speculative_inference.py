@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Speculative Draft Inference for SomaJournal
+
+While a user pauses typing, /preview-analysis can queue a low-priority BERT
+inference of the current draft into the registry's probability cache, so the
+final /analyze-emotion submit usually becomes a cache hit.
+
+Speculative work never competes with real submissions:
+- A single background worker runs jobs, and only while no real request is
+  in flight on the active model version
+- Each client has at most one pending job (newer drafts replace older ones)
+  and a per-minute budget
+- Jobs run under registry.acquire(), so they count as in flight and a model
+  swap waits for them like for any other request
+- The global queue is bounded; excess work is dropped, not delayed
+"""
+
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = int(os.getenv('SOMA_SPECULATIVE_MAX_PENDING', '32'))
+DEFAULT_PER_USER_PER_MINUTE = int(os.getenv('SOMA_SPECULATIVE_PER_USER_PER_MINUTE', '6'))
+
+
+class SpeculativeInferenceQueue:
+    """
+    Bounded, per-user-limited queue of background inferences into the probability cache.
+    """
+
+    def __init__(
+        self,
+        registry,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        per_user_per_minute: int = DEFAULT_PER_USER_PER_MINUTE,
+        idle_poll_seconds: float = 0.02
+    ):
+        """
+        Initialize the queue and start its worker thread.
+
+        Args:
+            registry: ModelRegistry whose active version and cache are used
+            max_pending: Global cap on queued speculative jobs
+            per_user_per_minute: Speculative inferences allowed per user per minute
+            idle_poll_seconds: How often the worker re-checks for real traffic
+        """
+        self.registry = registry
+        self.max_pending = max_pending
+        self.per_user_per_minute = per_user_per_minute
+        self.idle_poll_seconds = idle_poll_seconds
+
+        # user_key -> latest draft text, in submission order
+        self._pending: "OrderedDict[str, str]" = OrderedDict()
+        # user_key -> submission times in the last minute, least recently active first
+        self._recent: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        self.stats = {
+            'queued': 0,
+            'replaced': 0,
+            'completed': 0,
+            'already_cached': 0,
+            'rejected_global': 0,
+            'rejected_user': 0,
+            'failed': 0
+        }
+
+        self._worker = threading.Thread(target=self._run, name='speculative-inference', daemon=True)
+        self._worker.start()
+
+    def submit(self, user_key: str, text: str) -> str:
+        """
+        Queue a speculative inference for a user's current draft.
+
+        Args:
+            user_key: Key the pending job and budget are tracked under (the
+                API uses the client address, which a client cannot rotate)
+            text: Draft text
+
+        Returns:
+            One of 'queued', 'cached' or 'rejected'
+        """
+        text = text.strip()
+        model = self.registry.active
+        if not text or model is None:
+            return 'rejected'
+        if self.registry.cache.contains(model.version, text):
+            return 'cached'
+
+        with self._lock:
+            if user_key in self._pending:
+                # Only the newest draft matters; replacing does not use budget
+                self._pending[user_key] = text
+                self._pending.move_to_end(user_key)
+                self.stats['replaced'] += 1
+                return 'queued'
+
+            if len(self._pending) >= self.max_pending:
+                self.stats['rejected_global'] += 1
+                return 'rejected'
+
+            cutoff = time.time() - 60
+            # Forget clients with no submission in the last minute
+            while self._recent:
+                oldest = self._recent[next(iter(self._recent))]
+                if oldest and oldest[-1] >= cutoff:
+                    break
+                self._recent.popitem(last=False)
+
+            recent = self._recent.setdefault(user_key, deque())
+            while recent and recent[0] < cutoff:
+                recent.popleft()
+            if len(recent) >= self.per_user_per_minute:
+                self.stats['rejected_user'] += 1
+                return 'rejected'
+
+            recent.append(time.time())
+            self._recent.move_to_end(user_key)
+            self._pending[user_key] = text
+            self.stats['queued'] += 1
+
+        self._wakeup.set()
+        return 'queued'
+
+    def _next_job(self) -> Optional[str]:
+        with self._lock:
+            if not self._pending:
+                self._wakeup.clear()
+                return None
+            _, text = self._pending.popitem(last=False)
+            return text
+
+    def _wait_for_idle(self):
+        """Block while real requests are running on the active model."""
+        while True:
+            model = self.registry.active
+            if model is not None and model.in_flight == 0:
+                return model
+            time.sleep(self.idle_poll_seconds)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            text = self._next_job()
+            if text is None:
+                continue
+
+            self._wait_for_idle()
+            cache = self.registry.cache
+            try:
+                with self.registry.acquire() as model:
+                    if cache.contains(model.version, text):
+                        self.stats['already_cached'] += 1
+                        continue
+                    probabilities, embedding, space = model.classifier.base_classifier.predict_with_embedding_space(text)
+                    cache.put(model.version, text, probabilities, embedding, embedding_space=space)
+                self.stats['completed'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.warning(f"⚠️ Speculative inference failed: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'per_user_per_minute': self.per_user_per_minute,
+            **self.stats
+        }
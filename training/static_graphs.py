@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Shape-Bucketed Static-Graph Inference
+
+Padding every batch to its own longest text gives a new input shape almost
+every call, so graph compilers keep re-specializing, while padding
+everything to 128 tokens wastes most of the compute on short entries. This
+module pads each batch to the nearest of a few sequence-length buckets
+(16, 32, 64, 128 by default) and its row count to the next power of two, so
+inference only ever sees a small fixed set of shapes:
+- torchscript  One traced graph per (rows, length) shape, sharing the model's weights
+- compile      torch.compile with static shapes (one specialization per shape)
+- eager        Bucketed padding without compilation (for comparison)
+
+Every (rows, length) shape is run at startup, so no request pays for
+tracing or compilation. The bucket is picked automatically from the
+batch's longest text.
+
+ONNX Runtime would be a third graph backend, but it is not a dependency
+of this project; the two PyTorch-native backends cover the same ground.
+
+Configuration (environment variables):
+    SOMA_STATIC_GRAPHS      torchscript, compile, eager or off (default: off)
+    SOMA_SHAPE_BUCKETS      Sequence-length buckets (default: 16,32,64,128)
+    SOMA_STATIC_MAX_BATCH   Largest row bucket; bigger batches are split (default: 32)
+
+Benchmark against eager dynamic padding:
+    python scripts/benchmark_static_graphs.py
+"""
+
+import os
+import bisect
+import logging
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+STATIC_GRAPHS = os.getenv('SOMA_STATIC_GRAPHS', 'off')
+SHAPE_BUCKETS = [int(size) for size in os.getenv('SOMA_SHAPE_BUCKETS', '16,32,64,128').split(',')]
+STATIC_MAX_BATCH = int(os.getenv('SOMA_STATIC_MAX_BATCH', '32'))
+
+BACKENDS = ('torchscript', 'compile', 'eager')
+
+# Warmup passes per shape (TorchScript's profiling executor optimizes on the second run)
+WARMUP_RUNS = 2
+
+
+def bucket_for(length: int, buckets: List[int]) -> int:
+    """Smallest bucket that fits length (the largest bucket when none does)."""
+    index = bisect.bisect_left(buckets, length)
+    return buckets[min(index, len(buckets) - 1)]
+
+
+def row_buckets(max_batch: int) -> List[int]:
+    """Powers of two up to max_batch (inclusive)."""
+    sizes, size = [], 1
+    while size < max_batch:
+        sizes.append(size)
+        size *= 2
+    return sizes + [max_batch]
+
+
+class PooledClassifier(nn.Module):
+    """BertForSequenceClassification inference as one graph: (probabilities, pooled)."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.bert = model.bert
+        self.classifier = model.classifier
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        pooled = self.bert(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[1]
+        return torch.sigmoid(self.classifier(pooled)), pooled
+
+
+class StaticGraphRunner:
+    """
+    Runs the classifier on a fixed set of padded (rows, length) shapes, one graph each.
+    """
+
+    def __init__(
+        self,
+        model,
+        backend: str = 'torchscript',
+        buckets: Optional[List[int]] = None,
+        max_batch: int = STATIC_MAX_BATCH,
+        pad_token_id: int = 0,
+        max_length: int = 128
+    ):
+        """
+        Build (trace or compile) the graphs.
+
+        Args:
+            model: BertForSequenceClassification in eval mode
+            backend: One of BACKENDS
+            buckets: Sequence-length buckets
+            max_batch: Largest row bucket
+            pad_token_id: Token used for padding
+            max_length: Tokenizer truncation length (added as a bucket if none covers it)
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown static graph backend '{backend}'; choose from {BACKENDS}")
+        self.backend = backend
+        self.buckets = sorted(set(buckets or SHAPE_BUCKETS))
+        if self.buckets[-1] < max_length:
+            self.buckets.append(max_length)
+        self.row_buckets = row_buckets(max_batch)
+        self.max_batch = max_batch
+        self.pad_token_id = pad_token_id
+        self.device = next(model.parameters()).device
+
+        module = PooledClassifier(model).eval()
+        shapes = [(rows, bucket) for bucket in self.buckets for rows in self.row_buckets]
+        self.graphs: Dict[Tuple[int, int], Any] = {}
+        if backend == 'torchscript':
+            with torch.no_grad():
+                for shape in shapes:
+                    self.graphs[shape] = torch.jit.trace(module, self._example(*shape), check_trace=False)
+        elif backend == 'compile':
+            # Every (rows, length) pair is its own specialization; allow all of them
+            import torch._dynamo
+            torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, len(shapes))
+            compiled = torch.compile(module, dynamic=False)
+            self.graphs = {shape: compiled for shape in shapes}
+        else:
+            self.graphs = {shape: module for shape in shapes}
+
+        self._lock = threading.Lock()
+        self.calls = {bucket: 0 for bucket in self.buckets}
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.warmup_seconds = None
+
+    def _example(self, rows: int, length: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        input_ids = torch.full((rows, length), self.pad_token_id, dtype=torch.long, device=self.device)
+        attention_mask = torch.ones((rows, length), dtype=torch.long, device=self.device)
+        return input_ids, attention_mask
+
+    def warmup(self) -> float:
+        """Run every (rows, length) shape so no request pays for compilation."""
+        start = time.perf_counter()
+        with torch.no_grad():
+            for shape, graph in self.graphs.items():
+                for _ in range(WARMUP_RUNS):
+                    graph(*self._example(*shape))
+        self.warmup_seconds = round(time.perf_counter() - start, 2)
+        logger.info(f"🔥 Warmed up {len(self.graphs)} {self.backend} shapes in {self.warmup_seconds}s")
+        return self.warmup_seconds
+
+    def run(self, batch) -> Tuple[np.ndarray, np.ndarray]:
+        """Run a TokenizedBatch; see run_arrays."""
+        return self.run_arrays(batch.input_ids, batch.attention_mask)
+
+    def run_arrays(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pad to the batch's bucket, run the matching graph and drop the padding rows.
+
+        Args:
+            input_ids: N × width token IDs (width at most the largest bucket)
+            attention_mask: N × width mask
+
+        Returns:
+            Tuple of (N × labels probabilities, N × hidden pooled embeddings)
+        """
+        lengths = attention_mask.sum(axis=1)
+        if int(lengths.max()) > self.buckets[-1]:
+            raise ValueError(f"Batch of {int(lengths.max())} tokens exceeds the largest bucket ({self.buckets[-1]})")
+        bucket = bucket_for(int(lengths.max()), self.buckets)
+        width = min(input_ids.shape[1], bucket)
+
+        probabilities, embeddings = [], []
+        padded_tokens = 0
+        for start in range(0, len(input_ids), self.max_batch):
+            count = min(self.max_batch, len(input_ids) - start)
+            rows = bucket_for(count, self.row_buckets)
+            padded_ids = np.full((rows, bucket), self.pad_token_id, dtype=np.int64)
+            padded_mask = np.zeros((rows, bucket), dtype=np.int64)
+            padded_ids[:count, :width] = input_ids[start:start + count, :width]
+            padded_mask[:count, :width] = attention_mask[start:start + count, :width]
+            # Padding rows attend to one token so they stay numerically tame
+            padded_mask[count:, 0] = 1
+
+            padded_tokens += rows * bucket
+            with torch.no_grad():
+                batch_probabilities, pooled = self.graphs[(rows, bucket)](
+                    torch.from_numpy(padded_ids).to(self.device),
+                    torch.from_numpy(padded_mask).to(self.device)
+                )
+            probabilities.append(batch_probabilities[:count].cpu().numpy())
+            embeddings.append(pooled[:count].cpu().numpy())
+
+        with self._lock:
+            self.calls[bucket] += 1
+            self.real_tokens += int(lengths.sum())
+            self.padded_tokens += padded_tokens
+        return np.concatenate(probabilities), np.concatenate(embeddings)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'buckets': self.buckets,
+                'row_buckets': self.row_buckets,
+                'calls_per_bucket': dict(self.calls),
+                'padding_overhead': round(1 - self.real_tokens / self.padded_tokens, 3) if self.padded_tokens else None,
+                'warmup_seconds': self.warmup_seconds
+            }
+
+
+def build_from_environment(
+    model,
+    pad_token_id: int = 0,
+    max_length: int = 128,
+    backend: Optional[str] = None
+) -> Optional[StaticGraphRunner]:
+    """
+    Build and warm up a StaticGraphRunner when SOMA_STATIC_GRAPHS asks for one.
+
+    Falls back to None (eager dynamic padding) if the backend cannot build
+    the graphs, e.g. torch.compile without a working compiler toolchain.
+    """
+    backend = backend or STATIC_GRAPHS
+    if backend in ('', 'off', '0'):
+        return None
+    try:
+        runner = StaticGraphRunner(model, backend=backend, pad_token_id=pad_token_id, max_length=max_length)
+        runner.warmup()
+        return runner
+    except Exception as e:
+        logger.warning(f"⚠️ Static graphs ({backend}) unavailable, using dynamic padding: {e}")
+        return None
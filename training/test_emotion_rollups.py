@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Tests for rebuilding emotion rollups from the entry store
+"""
+
+import sys
+import os
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from entry_store import EntryVectorStore
+from emotion_rollups import EmotionRollupEngine
+from psychosomatic_mapping import GOEMOTIONS_LABELS
+
+DAY = 86400
+
+
+def test_load_from_store_rebuilds_rollups(tmp_path):
+    store = EntryVectorStore(str(tmp_path), labels=GOEMOTIONS_LABELS)
+    joy = np.zeros(len(GOEMOTIONS_LABELS))
+    joy[GOEMOTIONS_LABELS.index('joy')] = 0.9
+    store.put('e0', joy, np.zeros(4), user_id='u1', timestamp=0.0)
+    store.put('e1', joy, np.zeros(4), user_id='u1', timestamp=2 * DAY)
+    store.put('anonymous', joy, np.zeros(4), timestamp=0.0)
+
+    engine = EmotionRollupEngine()
+    assert engine.load_from_store(EntryVectorStore(str(tmp_path))) == 2
+
+    rollup = engine.rollup('u1', window='day')
+    assert [bucket['start'] for bucket in rollup['buckets']] == ['1970-01-01', '1970-01-03']
+    assert rollup['buckets'][0]['dominant_emotion'] == 'joy'
+    assert engine.rollup('anonymous') is None
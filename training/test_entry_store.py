@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent entry vector store (index replay and recovery)
+"""
+
+import sys
+import os
+import json
+
+import numpy as np
+import pytest
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from entry_store import EntryVectorStore
+
+
+def put_entry(store, entry_id, value):
+    return store.put(entry_id, np.full(3, value), np.full(4, value), user_id='u')
+
+
+def test_reopen_replays_index(tmp_path):
+    store = EntryVectorStore(str(tmp_path), labels=['a', 'b', 'c'], initial_capacity=2)
+    for i in range(5):
+        put_entry(store, f'e{i}', i)
+    put_entry(store, 'e1', 9)  # Overwrites the row, latest index line wins
+    store.flush()
+
+    reopened = EntryVectorStore(str(tmp_path))
+    assert len(reopened) == 5
+    assert reopened.get('e1')['embedding'][0] == 9
+    assert reopened.get('e4')['probabilities'][0] == 4
+
+
+def test_write_after_torn_line_survives_reopen(tmp_path):
+    store = EntryVectorStore(str(tmp_path), labels=['a', 'b', 'c'])
+    put_entry(store, 'e0', 1)
+    store.flush()
+
+    # A crash mid-write leaves a partial final line without a newline
+    with open(os.path.join(str(tmp_path), 'index.jsonl'), 'a') as f:
+        f.write('{"id": "torn", "ro')
+
+    recovered = EntryVectorStore(str(tmp_path))
+    assert len(recovered) == 1
+    put_entry(recovered, 'e1', 2)
+    recovered.flush()
+
+    reopened = EntryVectorStore(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.get('e1')['embedding'][0] == 2
+    with open(os.path.join(str(tmp_path), 'index.jsonl')) as f:
+        assert all(json.loads(line)['id'] != 'torn' for line in f)
+
+
+def test_other_instance_sees_new_entries(tmp_path):
+    writer = EntryVectorStore(str(tmp_path), labels=['a', 'b', 'c'])
+    put_entry(writer, 'e0', 1)
+    reader = EntryVectorStore(str(tmp_path))
+    put_entry(writer, 'e1', 2)
+
+    assert reader.get('e1')['embedding'][0] == 2
+    # The reader allocates after the writer's rows
+    assert put_entry(reader, 'e2', 3) == 2
+
+
+def test_entry_id_owned_by_another_user_is_rejected(tmp_path):
+    store = EntryVectorStore(str(tmp_path), labels=['a', 'b', 'c'])
+    put_entry(store, 'e0', 1)
+
+    with pytest.raises(PermissionError):
+        store.put('e0', np.full(3, 2), np.full(4, 2), user_id='other')
+    assert store.get('e0')['user_id'] == 'u'
+    assert store.get('e0')['embedding'][0] == 1
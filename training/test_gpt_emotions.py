@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 """
 Test script for GPT emotion detection when BERT fails
+
+Runs offline against the local mock client with:
+    SOMA_GPT_MOCK=1 SOMA_GPT_MOCK_LATENCY=fixed:0 python test_gpt_emotions.py
 """
 
 import sys
@@ -132,4 +135,5 @@ if __name__ == "__main__":
     print("\n\n🎉 GPT Emotion Detection Testing Complete!")
     print("=" * 60)
     print("💡 Note: GPT analysis requires valid OpenAI API key in .env.local")
-    print("🔧 Without API key, system falls back to evidence-based templates")
\ No newline at end of file
+    print("🔧 Without API key, system falls back to evidence-based templates")
+    print("🧪 Set SOMA_GPT_MOCK=1 to run against the local mock client instead")
\ No newline at end of file
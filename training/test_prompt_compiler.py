@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-budgeted prompt compiler
+"""
+
+import sys
+import os
+
+import pytest
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from prompt_compiler import PromptCompiler, PromptBudgetError
+
+JOURNAL = "I feel anxious about tomorrow. " * 300
+
+
+def test_combined_prompt_drops_context_before_exceeding_budget():
+    compiler = PromptCompiler(max_input_tokens=700)
+    compiled = compiler.combined_prompt(
+        "system", JOURNAL, ['nervousness', 'fear', 'sadness', 'joy'], 3, 'detailed_journal', 'full',
+        user_context={'notes': 'x' * 400}
+    )
+    assert compiled['prompt_tokens'] <= 700
+    assert compiled['dropped_context'][0] == 'user_context'
+    # The most likely candidate's template is always kept
+    assert 'template:nervousness' not in compiled['dropped_context']
+    assert '[nervousness]' in compiled['user_prompt']
+
+
+def test_prompt_that_cannot_fit_raises():
+    with pytest.raises(PromptBudgetError):
+        PromptCompiler(max_input_tokens=100).personalization_prompt("system", JOURNAL, 'fear')
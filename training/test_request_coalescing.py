@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight coalescing of identical analyses
+"""
+
+import sys
+import os
+import threading
+import time
+
+import pytest
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from request_coalescing import SingleFlight, coalescing_key
+
+
+def start_followers(flight, key, count, outcomes):
+    """Callers of an in-flight key; each records its (result, shared) or exception."""
+    def follow():
+        try:
+            outcomes.append(flight.run(key, lambda: 'follower ran'))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=follow) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    # Let them reach the in-flight future before the leader finishes
+    time.sleep(0.2)
+    return threads
+
+
+def run_leader(flight, key, fn):
+    """Start a leader whose fn blocks until released; returns (thread, release event, outcome)."""
+    started, release, outcome = threading.Event(), threading.Event(), []
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return fn()
+
+    def lead():
+        try:
+            outcome.append(flight.run(key, blocking))
+        except Exception as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=lead)
+    thread.start()
+    assert started.wait(5)
+    return thread, release, outcome
+
+
+def test_concurrent_callers_share_the_leaders_result():
+    flight = SingleFlight()
+    calls = []
+    leader, release, leader_outcome = run_leader(flight, 'k', lambda: calls.append(1) or 'result')
+
+    outcomes = []
+    followers = start_followers(flight, 'k', 3, outcomes)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert leader_outcome == [('result', False)]
+    assert outcomes == [('result', True)] * 3
+    stats = flight.stats()
+    assert (stats['executions'], stats['coalesced'], stats['in_flight']) == (1, 3, 0)
+
+
+def test_followers_receive_the_leaders_exception():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError('model failed')
+
+    leader, release, leader_outcome = run_leader(flight, 'k', fail)
+    outcomes = []
+    followers = start_followers(flight, 'k', 2, outcomes)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert isinstance(leader_outcome[0], RuntimeError)
+    assert len(outcomes) == 2 and all(isinstance(e, RuntimeError) for e in outcomes)
+    assert flight.stats()['failures'] == 1
+
+    # A failed flight is not remembered: the next call runs again
+    assert flight.run('k', lambda: 'retry') == ('retry', False)
+
+
+def test_sequential_calls_are_not_cached():
+    flight = SingleFlight()
+    assert flight.run('k', lambda: 1) == (1, False)
+    assert flight.run('k', lambda: 2) == (2, False)
+    with pytest.raises(ValueError):
+        flight.run('k', lambda: int('not a number'))
+
+
+def test_key_separates_users_and_normalizes_whitespace():
+    assert coalescing_key('I feel  fine\n', {'user_id': 'a'}) == coalescing_key('I feel fine', {'user_id': 'a'})
+    assert coalescing_key('I feel fine', {'user_id': 'a'}) != coalescing_key('I feel fine', {'user_id': 'b'})
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Tests for rebuilding emotion trend aggregates from the entry store
+"""
+
+import sys
+import os
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from entry_store import EntryVectorStore
+from trend_store import EmotionTrendStore
+
+LABELS = ['joy', 'sadness', 'fear']
+
+
+def test_load_from_store_rebuilds_user_trends(tmp_path):
+    store = EntryVectorStore(str(tmp_path), labels=LABELS)
+    store.put('e1', [0.9, 0.1, 0.4], np.zeros(4), user_id='u1', timestamp=200.0)
+    store.put('e0', [0.1, 0.8, 0.0], np.zeros(4), user_id='u1', timestamp=100.0)
+    store.put('e2', [0.9, 0.0, 0.0], np.zeros(4), user_id='u2', timestamp=150.0)
+    store.put('anonymous', [0.9, 0.0, 0.0], np.zeros(4), timestamp=150.0)
+
+    trends = EmotionTrendStore()
+    assert trends.load_from_store(EntryVectorStore(str(tmp_path)), LABELS) == 3
+
+    u1 = trends.get_trends('u1')
+    assert u1['analyzed_entries'] == 2
+    assert u1['emotion_counts'] == {'joy': 1, 'sadness': 1, 'fear': 1}
+    # Folded oldest first, so the range ends on the newest entry
+    assert (u1['first_entry_at'], u1['last_entry_at']) == (100.0, 200.0)
+    assert trends.get_trends('u2')['emotion_counts'] == {'joy': 1}
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Tokenization Stage for the Emotion Classifier
+
+Wraps the Rust-backed BertTokenizerFast (falling back to the pure-Python
+BertTokenizer when the fast tokenizer cannot be loaded) and keeps what one
+tokenization pass produces:
+- Token IDs, padded per batch with a single batch-encoding call
+- Character offsets of every token and the word each token belongs to, so
+  sentence segmentation and word-level highlighting reuse the same
+  tokenization instead of tokenizing again
+
+Offsets are native with the fast tokenizer; with the fallback they are
+recovered by aligning the word pieces against the lowercased text.
+
+Configuration (environment variables):
+    SOMA_FAST_TOKENIZER  "0" to force the pure-Python tokenizer (default: 1)
+
+Benchmark against the pure-Python tokenizer:
+    python scripts/benchmark_tokenizer.py
+"""
+
+import os
+import re
+import logging
+import unicodedata
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+USE_FAST_TOKENIZER = os.getenv('SOMA_FAST_TOKENIZER', '1') == '1'
+MAX_LENGTH = 128
+
+SENTENCE_END = re.compile(r'[.!?]+')
+
+
+def load_tokenizer(model_path: str, fast: bool = USE_FAST_TOKENIZER):
+    """
+    Load the model's tokenizer, preferring the fast (Rust) implementation.
+
+    Args:
+        model_path: Path to the model (or a hub name)
+        fast: Try BertTokenizerFast first
+
+    Returns:
+        A BertTokenizerFast or BertTokenizer
+    """
+    from transformers import BertTokenizer, BertTokenizerFast
+
+    if fast:
+        try:
+            return BertTokenizerFast.from_pretrained(model_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Fast tokenizer unavailable ({e}); using BertTokenizer")
+    return BertTokenizer.from_pretrained(model_path)
+
+
+class TokenizedText:
+    """
+    One text's tokenization: IDs, character offsets and word membership.
+
+    Special tokens ([CLS], [SEP]) have offset (0, 0) and word_id None.
+    """
+
+    def __init__(self, text: str, input_ids: List[int], offsets: List[Tuple[int, int]], word_ids: List[Optional[int]]):
+        self.text = text
+        self.input_ids = input_ids
+        self.offsets = offsets
+        self.word_ids = word_ids
+
+    def __len__(self) -> int:
+        return len(self.input_ids)
+
+    def words(self) -> List[Dict[str, Any]]:
+        """
+        Group tokens into words.
+
+        Returns:
+            List of {word, start, end, tokens} in text order
+        """
+        words: List[Dict[str, Any]] = []
+        current = None
+        for index, word_id in enumerate(self.word_ids):
+            if word_id is None:
+                continue
+            start, end = self.offsets[index]
+            if current is None or current['id'] != word_id:
+                current = {'id': word_id, 'start': start, 'end': end, 'tokens': []}
+                words.append(current)
+            current['end'] = end
+            current['tokens'].append(index)
+        return [
+            {'word': self.text[w['start']:w['end']], 'start': w['start'], 'end': w['end'], 'tokens': w['tokens']}
+            for w in words
+        ]
+
+    def sentence_ids(self) -> List[Optional[int]]:
+        """Sentence index of every token (None for special tokens), from the offsets."""
+        boundaries = [match.end() for match in SENTENCE_END.finditer(self.text)]
+        sentence_ids: List[Optional[int]] = []
+        sentence = 0
+        for (start, end), word_id in zip(self.offsets, self.word_ids):
+            if word_id is None:
+                sentence_ids.append(None)
+                continue
+            while sentence < len(boundaries) and start >= boundaries[sentence]:
+                sentence += 1
+            sentence_ids.append(sentence)
+        return sentence_ids
+
+
+class TokenizedBatch:
+    """Padded token arrays for a batch plus each text's TokenizedText."""
+
+    def __init__(self, items: List[TokenizedText], pad_token_id: int = 0):
+        self.items = items
+        width = max((len(item) for item in items), default=0)
+        self.input_ids = np.full((len(items), width), pad_token_id, dtype=np.int64)
+        self.attention_mask = np.zeros((len(items), width), dtype=np.int64)
+        for row, item in enumerate(items):
+            self.input_ids[row, :len(item)] = item.input_ids
+            self.attention_mask[row, :len(item)] = 1
+
+    def to_tensors(self, device=None) -> Dict[str, Any]:
+        """Model inputs as torch tensors on the given device."""
+        import torch
+
+        inputs = {
+            'input_ids': torch.from_numpy(self.input_ids),
+            'attention_mask': torch.from_numpy(self.attention_mask)
+        }
+        if device is not None:
+            inputs = {name: tensor.to(device) for name, tensor in inputs.items()}
+        return inputs
+
+
+class TokenizationStage:
+    """
+    Encodes texts once for inference, sentence segmentation and highlighting.
+    """
+
+    def __init__(self, tokenizer, max_length: int = MAX_LENGTH):
+        """
+        Initialize the stage.
+
+        Args:
+            tokenizer: BertTokenizerFast (preferred) or BertTokenizer
+            max_length: Truncation length in tokens, including special tokens
+        """
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.is_fast = bool(getattr(tokenizer, 'is_fast', False))
+        self.pad_token_id = tokenizer.pad_token_id or 0
+
+    def encode(self, text: str) -> TokenizedText:
+        return self.encode_batch([text]).items[0]
+
+    def encode_batch(self, texts: List[str]) -> TokenizedBatch:
+        """
+        Tokenize texts in one call (the fast tokenizer parallelizes batches).
+
+        Returns:
+            TokenizedBatch with padded arrays and per-text offsets
+        """
+        if self.is_fast:
+            encodings = self.tokenizer(
+                texts,
+                truncation=True,
+                max_length=self.max_length,
+                return_offsets_mapping=True
+            )
+            items = [
+                TokenizedText(
+                    text,
+                    encodings['input_ids'][i],
+                    [tuple(offset) for offset in encodings['offset_mapping'][i]],
+                    encodings.word_ids(i)
+                )
+                for i, text in enumerate(texts)
+            ]
+        else:
+            items = [self._encode_slow(text) for text in texts]
+        return TokenizedBatch(items, self.pad_token_id)
+
+    def _encode_slow(self, text: str) -> TokenizedText:
+        """Pure-Python fallback: encode, then align word pieces to recover offsets."""
+        input_ids = self.tokenizer(text, truncation=True, max_length=self.max_length)['input_ids']
+        tokens = self.tokenizer.convert_ids_to_tokens(input_ids)
+        special = set(self.tokenizer.all_special_tokens)
+
+        normalized = _normalize_for_alignment(text)
+        offsets: List[Tuple[int, int]] = []
+        word_ids: List[Optional[int]] = []
+        cursor, word = 0, -1
+        for token in tokens:
+            if token in special:
+                offsets.append((0, 0))
+                word_ids.append(None)
+                continue
+            piece = token[2:] if token.startswith('##') else token
+            start = normalized.find(piece, cursor)
+            if start < 0:
+                start = cursor
+            end = start + len(piece)
+            if not token.startswith('##') or word < 0:
+                word += 1
+            offsets.append((start, end))
+            word_ids.append(word)
+            cursor = end
+        return TokenizedText(text, input_ids, offsets, word_ids)
+
+
+def _normalize_for_alignment(text: str) -> str:
+    """Lowercase and strip accents character by character, keeping string positions."""
+    return ''.join(
+        ''.join(c for c in unicodedata.normalize('NFD', ch) if unicodedata.category(c) != 'Mn')[:1] or ch
+        for ch in text.lower()
+    )
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Incremental Emotion Trend Store for SomaJournal
+
+Keeps running per-user aggregates that are updated in O(1) as each analysis
+completes, so trend queries read the aggregates instead of re-classifying the
+user's whole journal history:
+- Emotion occurrence counts (and the top-k most frequent emotions)
+- Mean and exponentially weighted intensity
+- Entry counts and timestamps
+
+Aggregates live in the API process's memory. At startup they are rebuilt
+from the entry store (load_from_store); after that each worker process
+only folds in the analyses it handles itself, so with several workers the
+trends served by one worker miss other workers' entries until its next
+restart.
+"""
+
+import heapq
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+
+class UserTrends:
+    """Running aggregates for one user."""
+
+    def __init__(self):
+        self.total_entries = 0
+        self.analyzed_entries = 0
+        self.emotion_counts: Dict[str, int] = {}
+        self.intensity_sum = 0.0
+        self.ewma_intensity: Optional[float] = None
+        self.first_entry_at: Optional[float] = None
+        self.last_entry_at: Optional[float] = None
+
+
+class EmotionTrendStore:
+    """
+    Thread-safe store of per-user emotion trend aggregates.
+    """
+
+    def __init__(self, ewma_alpha: float = 0.3, top_k: int = 5):
+        """
+        Initialize the store.
+
+        Args:
+            ewma_alpha: Weight of the newest entry in the exponentially weighted intensity
+            top_k: Default number of frequent emotions to report
+        """
+        self.ewma_alpha = ewma_alpha
+        self.top_k = top_k
+        self._users: Dict[str, UserTrends] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry_intensity(emotions: List[Dict[str, Any]]) -> float:
+        """Intensity of one entry: the mean confidence of its detected emotions."""
+        if not emotions:
+            return 0.0
+        return sum(emotion['confidence'] for emotion in emotions) / len(emotions)
+
+    def record(
+        self,
+        user_id: str,
+        emotions: List[Dict[str, Any]],
+        analyzed: bool = True,
+        timestamp: Optional[float] = None
+    ):
+        """
+        Fold one completed analysis into the user's aggregates.
+
+        Args:
+            user_id: User identifier
+            emotions: Detected emotions with confidence scores
+            analyzed: False if the analysis failed (counted but not aggregated)
+            timestamp: Entry time in epoch seconds (defaults to now)
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+
+        with self._lock:
+            trends = self._users.setdefault(user_id, UserTrends())
+            trends.total_entries += 1
+            if not analyzed:
+                return
+
+            trends.analyzed_entries += 1
+            for emotion in emotions:
+                name = emotion['emotion']
+                trends.emotion_counts[name] = trends.emotion_counts.get(name, 0) + 1
+
+            intensity = self.entry_intensity(emotions)
+            trends.intensity_sum += intensity
+            if trends.ewma_intensity is None:
+                trends.ewma_intensity = intensity
+            else:
+                trends.ewma_intensity += self.ewma_alpha * (intensity - trends.ewma_intensity)
+
+            if trends.first_entry_at is None:
+                trends.first_entry_at = timestamp
+            trends.last_entry_at = timestamp
+
+    def load_from_store(self, store, labels: List[str], threshold: float = 0.3, top_k: int = 3) -> int:
+        """
+        Rebuild user aggregates from an EntryVectorStore (e.g. at startup).
+
+        Stored entries keep probabilities, not the adaptive emotion list, so
+        each entry's emotions are its top_k labels at or above threshold (as
+        in the similarity index). Entries are folded in timestamp order so
+        the weighted intensity ends on the newest one.
+
+        Returns:
+            Number of entries recorded
+        """
+        probabilities = store.probabilities
+        rows = sorted(
+            (row for row, record in enumerate(store.records) if record.get('user_id')),
+            key=lambda row: store.records[row].get('timestamp') or 0.0
+        )
+        for row in rows:
+            record = store.records[row]
+            scores = np.asarray(probabilities[row], dtype=np.float32)
+            top = [i for i in np.argsort(-scores)[:top_k] if scores[i] >= threshold]
+            self.record(
+                record['user_id'],
+                [{'emotion': labels[i], 'confidence': float(scores[i])} for i in top],
+                timestamp=record.get('timestamp')
+            )
+        return len(rows)
+
+    def most_frequent(self, user_id: str, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Top-k most frequent emotions (bounded by the 28 labels, so constant time)."""
+        with self._lock:
+            trends = self._users.get(user_id)
+            if trends is None:
+                return []
+            return heapq.nlargest(k or self.top_k, trends.emotion_counts.items(), key=lambda item: item[1])
+
+    def get_trends(self, user_id: str, k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Read a user's trend aggregates.
+
+        Returns:
+            Trend dictionary, or None if nothing has been recorded for the user
+        """
+        with self._lock:
+            trends = self._users.get(user_id)
+            if trends is None:
+                return None
+            most_frequent = heapq.nlargest(
+                k or self.top_k, trends.emotion_counts.items(), key=lambda item: item[1]
+            )
+            return {
+                'total_entries': trends.total_entries,
+                'analyzed_entries': trends.analyzed_entries,
+                'most_frequent_emotions': most_frequent,
+                'average_intensity': trends.intensity_sum / max(trends.analyzed_entries, 1),
+                'recent_intensity': trends.ewma_intensity or 0.0,
+                'emotion_diversity': len(trends.emotion_counts),
+                'emotion_counts': dict(trends.emotion_counts),
+                'first_entry_at': trends.first_entry_at,
+                'last_entry_at': trends.last_entry_at
+            }
+
+    def reset(self, user_id: str):
+        with self._lock:
+            self._users.pop(user_id, None)